@@ -0,0 +1,221 @@
+"""Transferring media resources to and from Atompub servers.
+
+The document you are looking for is RFC 5023, section 9.6.
+
+Media resources can be large, so the functions here never keep them in
+memory as a whole. Uploads are read from a file object and sent with
+chunked transfer coding, downloads are written into a file object or
+read from the response in chunks. Only the media link entries the server
+sends back are parsed::
+
+    entry = post_media(collection, open("photo.jpg", "rb"), "image/jpeg",
+                       slug="photo")
+    with open("copy.jpg", "wb") as file:
+        get_media(entry, file)
+
+Each request uses a connection of its own, which is closed along with
+the response. Connections time out after *request_timeout* seconds
+without progress, a module attribute you can adjust.
+
+URLs are taken from the collection's href and the entry's edit-media
+link or content src. They are resolved against xml:base, so the objects
+should come from :meth:`XMLObject.parse_from_xml` or be resolved via
+:meth:`XMLObject.resolve`.
+"""
+
+from __future__ import absolute_import
+import httplib
+import socket
+from urllib import quote
+from urlparse import urljoin, urlsplit
+
+from atomtools.atompub import AppEntry
+
+chunk_size = 64 * 1024
+request_timeout = 60
+
+
+class AppClientError(RuntimeError):
+    """The server didn't respond as expected.
+
+    The *status* and *reason* attributes contain the status line of the
+    response.
+    """
+    def __init__(self, method, url, status, reason):
+        super(AppClientError, self).__init__("%s %s failed: %d %s"
+                                             % (method, url, status, reason))
+        self.status = status
+        self.reason = reason
+
+
+def post_media(collection, file, type, slug=None, entry_class=AppEntry,
+               headers=None):
+    """Add the content of *file* to *collection* as a media resource.
+
+    The *collection* is an :class:`AppCollection`, the *file* a file
+    object opened for reading in binary mode and *type* the media type of
+    its content. The *slug* is a suggestion for the name of the new
+    resource. Additional request *headers* can be given as a dict.
+
+    Returns the media link entry created by the server as an instance of
+    *entry_class*. Its links and content src are resolved against the
+    entry's location, so you can pass it to :func:`get_media` and
+    :func:`put_media` right away.
+    """
+    url = collection.resolve_url(collection.href)
+    headers = dict(headers or ())
+    headers["Content-Type"] = type
+    if slug is not None:
+        if isinstance(slug, unicode):
+            slug = slug.encode("utf-8")
+        headers["Slug"] = quote(slug, " ")
+    response = send_request("POST", url, headers, file)
+    try:
+        if response.status != 201:
+            raise AppClientError("POST", url, response.status,
+                                 response.reason)
+        location = response.getheader("Location")
+        if location is None:
+            raise AppClientError("POST", url, response.status,
+                                 "no Location in response")
+        location = urljoin(url, location)
+        if response.getheader("Content-Location") == location:
+            entry = entry_class.parse_from_xml(response)
+        else:
+            entry = None
+    finally:
+        response.close()
+    if entry is None:
+        entry = get_entry(location, entry_class)
+    else:
+        entry.resolve(location)
+    return entry
+
+
+def get_entry(url, entry_class=AppEntry, headers=None):
+    """Return the entry at *url* as an instance of *entry_class*."""
+    response = send_request("GET", url, headers)
+    try:
+        if response.status != 200:
+            raise AppClientError("GET", url, response.status,
+                                 response.reason)
+        entry = entry_class.parse_from_xml(response)
+    finally:
+        response.close()
+    entry.resolve(url)
+    return entry
+
+
+def put_media(entry, file, type, headers=None):
+    """Replace the media resource of the media link *entry*.
+
+    The new content is read from *file* and has media type *type*.
+    """
+    url = get_media_url(entry, "edit-media")
+    headers = dict(headers or ())
+    headers["Content-Type"] = type
+    response = send_request("PUT", url, headers, file)
+    try:
+        if response.status not in (200, 204):
+            raise AppClientError("PUT", url, response.status,
+                                 response.reason)
+    finally:
+        response.close()
+
+
+def open_media(entry, headers=None):
+    """Request the media resource of the media link *entry*.
+
+    Returns the :class:`httplib.HTTPResponse`. Read the content from it
+    in chunks and close it when you are done.
+    """
+    url = get_media_url(entry)
+    response = send_request("GET", url, headers)
+    if response.status != 200:
+        response.close()
+        raise AppClientError("GET", url, response.status, response.reason)
+    return response
+
+
+def get_media(entry, file, headers=None):
+    """Write the media resource of the media link *entry* into *file*.
+
+    Returns the media type of the resource.
+    """
+    response = open_media(entry, headers)
+    try:
+        while True:
+            data = response.read(chunk_size)
+            if not data:
+                break
+            file.write(data)
+        return response.getheader("Content-Type")
+    finally:
+        response.close()
+
+
+def get_media_url(entry, rel=None):
+    """Return the absolute URL of the media resource of *entry*.
+
+    This is the entry's "edit-media" link or, unless *rel* insists on
+    that link, the src of its content.
+    """
+    for link in entry.links:
+        if link.rel == "edit-media" and link.href is not None:
+            return link.resolved_href or link.href
+    if rel is None and entry.content is not None and entry.content.src:
+        return entry.content.resolved_src or entry.content.src
+    raise ValueError("entry has no %s" % (rel or "media resource"))
+
+
+def send_request(method, url, headers=None, file=None, timeout=None):
+    """Send a request and return the :class:`httplib.HTTPResponse`.
+
+    If *file* is given, the request body is read from it and sent using
+    chunked transfer coding. Socket operations time out after *timeout*
+    seconds, *request_timeout* by default.
+
+    The server is asked to close the connection after the response, so
+    closing the response closes the connection, too. If anything goes
+    wrong before there is a response, the connection is closed right
+    away.
+    """
+    if timeout is None:
+        timeout = request_timeout
+    parts = urlsplit(url)
+    if parts.scheme == "https":
+        connection = httplib.HTTPSConnection(parts.netloc, timeout=timeout)
+    elif parts.scheme == "http":
+        connection = httplib.HTTPConnection(parts.netloc, timeout=timeout)
+    else:
+        raise ValueError("unsupported URL %s" % url)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    try:
+        connection.putrequest(method, path)
+        for key, value in (headers or {}).iteritems():
+            connection.putheader(key, value)
+        connection.putheader("Connection", "close")
+        if file is not None:
+            connection.putheader("Transfer-Encoding", "chunked")
+        connection.endheaders()
+        if file is not None:
+            try:
+                while True:
+                    data = file.read(chunk_size)
+                    if not data:
+                        break
+                    connection.send("%x\r\n%s\r\n" % (len(data), data))
+                connection.send("0\r\n\r\n")
+            except socket.timeout:
+                raise
+            except socket.error:
+                # The server may have given up on the body early, but
+                # still sent a response that says why.
+                pass
+        # With "Connection: close", the response takes over the socket.
+        return connection.getresponse()
+    except:
+        connection.close()
+        raise
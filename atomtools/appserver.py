@@ -0,0 +1,805 @@
+"""A WSGI application for the Atom Publishing Protocol.
+
+The document you are looking for is RFC 5023.
+
+This implements the HTTP side of Atompub on top of the classes from
+:mod:`atomtools.atompub`. The actual data lives in a storage object you
+provide. See :class:`AppStorage` for what it needs to implement.
+
+The URL space of the application looks like this::
+
+    /                             the service document
+    /<collection>/                the collection feed, paged via ?page=<n>,
+                                  POST creates entries and media resources
+    /<collection>/<entry>         a member entry
+    /<collection>/<entry>/media   the media resource of a media link entry
+
+Since :class:`AppServer` is a plain WSGI application, you can run it
+locally through :mod:`wsgiref` or any other WSGI server and point a load
+generator at it. The :class:`MemoryStorage` is enough for that.
+
+Encoded collection feeds can be kept in a :class:`ResponseCache`, which
+is also useful on its own for serving :class:`AtomFeed` objects.
+"""
+
+from __future__ import absolute_import
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import datetime
+from hashlib import sha1
+import re
+from StringIO import StringIO
+from threading import Lock
+from urllib import unquote
+from urlparse import parse_qs
+from uuid import uuid4
+from wsgiref.util import application_uri
+
+from atomtools.atom import AtomContent, AtomDate, AtomLink, AtomText
+from atomtools.atompub import (AppAccept, AppCollection, AppEntry, AppFeed,
+                               AppService, AppWorkspace)
+from atomtools.tzinfo import TzInfoUTC
+from atomtools.xml import iter_compressed, ParseError
+
+
+def entry_etag(entry):
+    """Return an entity tag for *entry*.
+
+    The tag is derived from the atom:id and atom:updated of the entry, so
+    it can be determined without serializing the entry.
+    """
+    digest = sha1()
+    _update_etag_digest(digest, entry)
+    return '"%s"' % digest.hexdigest()
+
+
+def feed_etag(feed, entries, page=1):
+    """Return an entity tag for a page of a collection feed.
+
+    The tag is derived from the atom:id of the *feed*, the *page* number
+    and atom:id and atom:updated of all the *entries* on that page.
+    """
+    digest = sha1()
+    _update_etag_digest(digest, feed)
+    digest.update("\0%d" % page)
+    for entry in entries:
+        _update_etag_digest(digest, entry)
+    return '"%s"' % digest.hexdigest()
+
+
+def coding_etag(etag, coding):
+    """Return the entity tag of the variant of *etag* in content *coding*.
+
+    Compressed variants are different representations, so they need tags
+    of their own.
+    """
+    if coding == "identity":
+        return etag
+    return '%s-%s"' % (etag[:-1], coding)
+
+
+def _update_etag_digest(digest, obj):
+    if obj.id is not None:
+        digest.update(unicode(obj.id).encode("utf-8"))
+    digest.update("\0")
+    if obj.updated is not None and obj.updated.datetime is not None:
+        digest.update(obj.updated.datetime.isoformat())
+    digest.update("\0")
+
+
+class AppStorage(object):
+    """The interface for the storage behind an :class:`AppServer`.
+
+    Collections and entries are identified by the names used in their
+    URLs. These names are chosen by the storage and needn't have anything
+    to do with the atom:id of an entry.
+
+    All methods here but :meth:`get_media_version` raise
+    :exc:`NotImplementedError`. Base your storage on this class and
+    override the methods you need.
+    """
+    def get_service(self):
+        """Return the :class:`AppService` for all collections.
+
+        The server encodes the service document only once for each
+        object returned, so keep returning the same object for as long
+        as the collections don't change.
+        """
+        raise NotImplementedError
+
+    def get_feed(self, collection):
+        """Return the meta data of *collection*.
+
+        The result should be an :class:`AppFeed` without any entries. The
+        server will add entries and paging links to it, so don't return
+        an object you keep around. If there is no such collection, return
+        ``None``.
+        """
+        raise NotImplementedError
+
+    def get_entries(self, collection, start, count):
+        """Return a list of at most *count* entries of *collection*.
+
+        The list should start with the entry at index *start* when all
+        entries are ordered by descending atom:updated.
+        """
+        raise NotImplementedError
+
+    def get_entry(self, collection, name):
+        """Return the entry *name* of *collection* or ``None``."""
+        raise NotImplementedError
+
+    def put_entry(self, collection, name, entry):
+        """Replace the entry *name* in *collection* with *entry*.
+
+        Return ``False`` if there is no such entry.
+        """
+        raise NotImplementedError
+
+    def delete_entry(self, collection, name):
+        """Delete entry *name* and its media resource, if any.
+
+        Return ``False`` if there is no such entry.
+        """
+        raise NotImplementedError
+
+    def get_media(self, collection, name):
+        """Return the media resource of entry *name*.
+
+        The result is a pair of the media type and a file object that
+        will be read from and closed by the server. Return ``None`` if
+        there is no such media resource.
+        """
+        raise NotImplementedError
+
+    def get_media_version(self, collection, name):
+        """Return a string that changes whenever the media resource of
+        entry *name* does.
+
+        The server uses it for the entity tag of the media resource. The
+        default returns ``None``, in which case media resources don't get
+        an entity tag at all.
+        """
+        return None
+
+    def put_media(self, collection, name, type, file):
+        """Replace the media resource of entry *name*.
+
+        The new resource of media type *type* should be read from the
+        file object *file*. Return ``False`` if there is no such media
+        resource.
+        """
+        raise NotImplementedError
+
+    def post_entry(self, collection, entry):
+        """Add *entry* to *collection* and return its name.
+
+        Return ``None`` if there is no such collection.
+        """
+        raise NotImplementedError
+
+    def post_media(self, collection, type, slug, file):
+        """Add a media resource to *collection* and return the name of its
+        media link entry.
+
+        The resource of media type *type* should be read from the file
+        object *file*. Read it in chunks, since it may be of any size.
+        The *slug* is the client's suggestion for the name or ``None``.
+        The media link entry returned by :meth:`get_entry` for the name
+        should have an "edit-media" link to ``<name>/media`` relative to
+        the collection. Return ``None`` if there is no such collection.
+        """
+        raise NotImplementedError
+
+
+class MemoryStorage(AppStorage):
+    """A storage keeping everything in memory.
+
+    This is meant for trying out the server and for running it locally
+    in tests and benchmarks. Add collections through
+    :meth:`add_collection` and entries through :meth:`post_entry` or
+    :meth:`post_media`.
+
+    The entries of each collection are kept in a list sorted by
+    atom:updated, so a page of the collection feed is a slice of it.
+    """
+    def __init__(self, title=u"Collections"):
+        self.title = title
+        self.collections = OrderedDict()
+        self.service = None
+        self.lock = Lock()
+
+    def add_collection(self, name, title, accept=None):
+        """Add an empty collection *name* with *title*.
+
+        The *accept* is a list of the media ranges the collection accepts
+        and defaults to entries only.
+        """
+        if accept is None:
+            accept = ["application/atom+xml;type=entry"]
+        with self.lock:
+            self.collections[name] = {
+                "title": title,
+                "accept": list(accept),
+                "id": u"urn:uuid:%s" % uuid4(),
+                "entries": {},
+                "sorted": [],
+                "media": {},
+                "count": 0,
+            }
+            self.service = None
+
+    def get_service(self):
+        with self.lock:
+            if self.service is None:
+                collections = [
+                    AppCollection(href=u"%s/" % name,
+                                  title=AtomText(text=item["title"]),
+                                  accept=[AppAccept(media_range=media_range)
+                                          for media_range in item["accept"]])
+                    for name, item in self.collections.iteritems()]
+                self.service = AppService(workspaces=[
+                    AppWorkspace(title=AtomText(text=self.title),
+                                 collections=collections)])
+            return self.service
+
+    def get_feed(self, collection):
+        item = self.collections.get(collection)
+        if item is None:
+            return None
+        with self.lock:
+            newest = item["sorted"][-1:]
+        if newest:
+            updated = AtomDate(newest[0][0])
+        else:
+            updated = AtomDate(datetime(1970, 1, 1, tzinfo=TzInfoUTC()))
+        return AppFeed(id=item["id"], title=AtomText(text=item["title"]),
+                       updated=updated)
+
+    def get_entries(self, collection, start, count):
+        item = self.collections.get(collection)
+        if item is None:
+            return []
+        with self.lock:
+            keys = item["sorted"]
+            end = max(len(keys) - start, 0)
+            page = keys[max(end - count, 0):end]
+            entries = item["entries"]
+            result = [entries[key[2]][0] for key in page]
+        result.reverse()
+        return result
+
+    def get_entry(self, collection, name):
+        item = self.collections.get(collection)
+        if item is None:
+            return None
+        record = item["entries"].get(name)
+        return record and record[0]
+
+    def put_entry(self, collection, name, entry):
+        item = self.collections.get(collection)
+        with self.lock:
+            if item is None or name not in item["entries"]:
+                return False
+            order = item["entries"][name][1]
+            self.remove_record(item, name)
+            self.prepare_entry(entry, name)
+            self.add_record(item, name, entry, order)
+        return True
+
+    def delete_entry(self, collection, name):
+        item = self.collections.get(collection)
+        with self.lock:
+            if item is None or name not in item["entries"]:
+                return False
+            self.remove_record(item, name)
+            item["media"].pop(name, None)
+        return True
+
+    def get_media(self, collection, name):
+        item = self.collections.get(collection)
+        media = item and item["media"].get(name)
+        if media is None:
+            return None
+        return media[0], StringIO(media[1])
+
+    def get_media_version(self, collection, name):
+        item = self.collections.get(collection)
+        media = item and item["media"].get(name)
+        return media and str(media[2])
+
+    def put_media(self, collection, name, type, file):
+        item = self.collections.get(collection)
+        if item is None or name not in item["media"]:
+            return False
+        data = file.read()
+        with self.lock:
+            version = item["media"][name][2] + 1
+            item["media"][name] = (type, data, version)
+        return True
+
+    def post_entry(self, collection, entry):
+        item = self.collections.get(collection)
+        if item is None:
+            return None
+        with self.lock:
+            name = self.new_name(item)
+            if entry.id is None:
+                entry.id = u"urn:uuid:%s" % uuid4()
+            self.prepare_entry(entry, name)
+            self.add_record(item, name, entry, item["count"])
+        return name
+
+    def post_media(self, collection, type, slug, file):
+        item = self.collections.get(collection)
+        if item is None:
+            return None
+        data = file.read()
+        with self.lock:
+            name = self.new_name(item, slug)
+            entry = AppEntry(id=u"urn:uuid:%s" % uuid4(),
+                             title=AtomText(text=slug or name),
+                             content=AtomContent(type=type,
+                                                 src=u"%s/media" % name),
+                             links=[AtomLink(rel="edit-media",
+                                             href=u"%s/media" % name)])
+            self.prepare_entry(entry, name)
+            self.add_record(item, name, entry, item["count"])
+            item["media"][name] = (type, data, 1)
+        return name
+
+    @staticmethod
+    def add_record(item, name, entry, order):
+        """Add *entry* as *name* to the collection *item*.
+
+        The *order* breaks ties between entries updated at the same time.
+        """
+        key = (entry.updated.datetime, order, name)
+        item["entries"][name] = (entry, order, key)
+        insort(item["sorted"], key)
+
+    @staticmethod
+    def remove_record(item, name):
+        """Remove the entry *name* from the collection *item*."""
+        key = item["entries"].pop(name)[2]
+        keys = item["sorted"]
+        del keys[bisect_left(keys, key)]
+
+    @staticmethod
+    def new_name(item, slug=None):
+        item["count"] += 1
+        name = re.sub(r"[^A-Za-z0-9_.~-]+", "-", slug or u"").strip("-.")
+        if name and name not in item["entries"]:
+            return str(name)
+        return str(item["count"])
+
+    @staticmethod
+    def prepare_entry(entry, name):
+        """Set atom:updated and the edit link of *entry*."""
+        entry.updated = AtomDate(datetime.now(TzInfoUTC()))
+        entry.links = [link for link in entry.links if link.rel != "edit"]
+        entry.links.append(AtomLink(rel="edit", href=name))
+        entry.clear_content_hash()
+
+
+class ResponseCache(object):
+    """A cache for encoded response bodies.
+
+    Bodies are identified by a key and a version. The version should
+    change whenever the content does. Storing a body for a new version of
+    a key drops those of all older versions. Besides the body itself, a
+    gzip compressed variant is created when it is first asked for.
+
+    The cache holds at most *max_size* bytes. If it gets full, the bodies
+    used least recently are dropped. It can be shared between threads.
+    """
+    codings = ("identity", "gzip")
+
+    def __init__(self, max_size=64 << 20):
+        self.max_size = max_size
+        self.size = 0
+        self.bodies = OrderedDict()
+        self.versions = {}
+        self.lock = Lock()
+
+    def get(self, key, version, create, coding="identity"):
+        """Return the body for *key* and *version* in content *coding*.
+
+        If the body isn't cached, *create* is called without arguments
+        and should return an iterable of byte strings for the body.
+        """
+        if coding not in self.codings:
+            raise ValueError("unknown content coding %r" % coding)
+        body = self.get_cached((key, version, coding))
+        if body is not None:
+            return body
+        if coding == "gzip":
+            body = "".join(iter_compressed([self.get(key, version, create)],
+                                           "gzip"))
+        else:
+            body = "".join(create())
+        self.set_cached(key, version, coding, body)
+        return body
+
+    def get_feed(self, feed, coding="identity"):
+        """Return the encoded *feed* in content *coding*.
+
+        The atom:id of the feed serves as the key and
+        :meth:`AtomFeed.get_version` as the version.
+        """
+        return self.get(feed.id, feed.get_version(), feed.iterencode, coding)
+
+    def get_cached(self, cache_key):
+        with self.lock:
+            try:
+                body = self.bodies.pop(cache_key)
+            except KeyError:
+                return None
+            self.bodies[cache_key] = body
+            return body
+
+    def set_cached(self, key, version, coding, body):
+        if len(body) > self.max_size:
+            return
+        with self.lock:
+            bodies = self.bodies
+            old = self.versions.get(key)
+            if old is not None and old != version:
+                for item in self.codings:
+                    self.size -= len(bodies.pop((key, old, item), ""))
+            self.versions[key] = version
+            cache_key = (key, version, coding)
+            self.size -= len(bodies.pop(cache_key, ""))
+            bodies[cache_key] = body
+            self.size += len(body)
+            while self.size > self.max_size:
+                (key, version, coding), body = bodies.popitem(last=False)
+                self.size -= len(body)
+                if not any((key, version, item) in bodies
+                           for item in self.codings):
+                    self.versions.pop(key, None)
+
+
+def accepts_gzip(environ):
+    """Does the request's Accept-Encoding header allow gzip?"""
+    for item in environ.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, _, params = item.partition(";")
+        if coding.strip().lower() in ("gzip", "x-gzip"):
+            params = params.replace(" ", "")
+            return params not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+class AppServer(object):
+    """A WSGI application serving the collections of *storage*.
+
+    Collection feeds are split into pages of *page_size* entries. Entry
+    documents are parsed using *entry_class*.
+
+    If a :class:`ResponseCache` is given in *cache*, encoded collection
+    feeds are kept there and sent gzip compressed to clients that accept
+    this. Compressed feeds have entity tags of their own, see
+    :func:`coding_etag`.
+
+    Responses for entries and collection feeds carry entity tags that are
+    created from atom:id and atom:updated values rather than the response
+    body. Conditional requests for unchanged resources are therefore
+    answered without ever serializing anything.
+    """
+    entry_class = AppEntry
+    page_size = 20
+    chunk_size = 64 * 1024
+
+    def __init__(self, storage, page_size=None, entry_class=None,
+                 cache=None):
+        self.storage = storage
+        if page_size is not None:
+            self.page_size = page_size
+        if entry_class is not None:
+            self.entry_class = entry_class
+        self.cache = cache
+        self.service = (None, None, None)
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "").strip("/")
+        parts = path.split("/") if path else []
+        if not parts:
+            handler = self.handle_service
+        elif len(parts) == 1:
+            handler = self.handle_collection
+        elif len(parts) == 2:
+            handler = self.handle_entry
+        elif len(parts) == 3 and parts[2] == "media":
+            handler = self.handle_media
+            parts = parts[:2]
+        else:
+            return self.respond(start_response, "404 Not Found")
+        return handler(environ, start_response, *parts)
+
+    def handle_service(self, environ, start_response):
+        method = environ["REQUEST_METHOD"]
+        if method not in ("GET", "HEAD"):
+            return self.not_allowed(start_response, "GET, HEAD")
+        service = self.storage.get_service()
+        cached, body, etag = self.service
+        if service is not cached:
+            body = service.encode()
+            etag = '"%s"' % sha1(body).hexdigest()
+            self.service = (service, body, etag)
+        if self.not_modified(environ, etag):
+            return self.respond(start_response, "304 Not Modified",
+                                [("ETag", etag)])
+        return self.respond_document(environ, start_response, etag,
+                                     service.content_type, [body])
+
+    def handle_collection(self, environ, start_response, collection):
+        method = environ["REQUEST_METHOD"]
+        if method == "POST":
+            return self.handle_post(environ, start_response, collection)
+        if method not in ("GET", "HEAD"):
+            return self.not_allowed(start_response, "GET, HEAD, POST")
+        try:
+            page = int(parse_qs(environ.get("QUERY_STRING", ""))
+                                .get("page", ["1"])[0])
+        except ValueError:
+            page = 0
+        if page < 1:
+            return self.respond(start_response, "400 Bad Request")
+        feed = self.storage.get_feed(collection)
+        if feed is None:
+            return self.respond(start_response, "404 Not Found")
+        entries = self.storage.get_entries(collection,
+                                           (page - 1) * self.page_size,
+                                           self.page_size + 1)
+        etag = feed_etag(feed, entries, page)
+        uri = "%s/%s/" % (environ.get("SCRIPT_NAME", ""), collection)
+        if self.cache is None:
+            if self.not_modified(environ, etag):
+                return self.respond(start_response, "304 Not Modified",
+                                    [("ETag", etag)])
+            return self.respond_document(environ, start_response, etag,
+                                         feed.content_type,
+                                         feed.iterencode_page(entries, page,
+                                                              self.page_size,
+                                                              uri))
+        coding = "gzip" if accepts_gzip(environ) else "identity"
+        tag = coding_etag(etag, coding)
+        # A client may hold either variant, and both are still valid.
+        if any(self.not_modified(environ, coding_etag(etag, item))
+               for item in self.cache.codings):
+            return self.respond(start_response, "304 Not Modified",
+                                [("ETag", tag), ("Vary", "Accept-Encoding")])
+        headers = [("Content-Type", feed.content_type), ("ETag", tag),
+                   ("Vary", "Accept-Encoding")]
+        if coding != "identity":
+            headers.append(("Content-Encoding", coding))
+        if method == "HEAD":
+            # Only tell the length if it is known without encoding.
+            body = self.cache.get_cached(((uri, page), etag, coding))
+            if body is not None:
+                headers.append(("Content-Length", str(len(body))))
+            start_response("200 OK", headers)
+            return []
+        body = self.cache.get((uri, page), etag,
+                              lambda: feed.iterencode_page(entries, page,
+                                                           self.page_size,
+                                                           uri),
+                              coding)
+        headers.append(("Content-Length", str(len(body))))
+        start_response("200 OK", headers)
+        return [body]
+
+    def handle_post(self, environ, start_response, collection):
+        """Create a member of *collection* from the request body.
+
+        Bodies of type application/atom+xml are entries, everything else
+        is a media resource. Answers with the new (media link) entry.
+        """
+        type = environ.get("CONTENT_TYPE") or "application/octet-stream"
+        if type.split(";")[0].strip().lower() == "application/atom+xml":
+            try:
+                entry = self.entry_class.parse_from_xml(InputReader(environ))
+            except ParseError:
+                return self.respond(start_response, "400 Bad Request")
+            name = self.storage.post_entry(collection, entry)
+        else:
+            slug = environ.get("HTTP_SLUG")
+            if slug is not None:
+                slug = unquote(slug).decode("utf-8", "replace")
+            name = self.storage.post_media(collection, type, slug,
+                                           InputReader(environ))
+        if name is None:
+            return self.respond(start_response, "404 Not Found")
+        entry = self.storage.get_entry(collection, name)
+        location = "%s%s/%s" % (application_uri(environ).rstrip("/") + "/",
+                                collection, name)
+        body = entry.encode()
+        start_response("201 Created",
+                       [("Content-Type", entry.content_type),
+                        ("Content-Length", str(len(body))),
+                        ("Location", location),
+                        ("Content-Location", location),
+                        ("ETag", entry_etag(entry))])
+        return [body]
+
+    def handle_entry(self, environ, start_response, collection, name):
+        method = environ["REQUEST_METHOD"]
+        if method not in ("GET", "HEAD", "PUT", "DELETE"):
+            return self.not_allowed(start_response, "GET, HEAD, PUT, DELETE")
+        entry = self.storage.get_entry(collection, name)
+        if entry is None:
+            return self.respond(start_response, "404 Not Found")
+        etag = entry_etag(entry)
+        if method in ("GET", "HEAD"):
+            if self.not_modified(environ, etag):
+                return self.respond(start_response, "304 Not Modified",
+                                    [("ETag", etag)])
+            return self.respond_document(environ, start_response, etag,
+                                         entry.content_type,
+                                         entry.iterencode())
+        if self.precondition_failed(environ, etag):
+            return self.respond(start_response, "412 Precondition Failed")
+        if method == "DELETE":
+            if not self.storage.delete_entry(collection, name):
+                return self.respond(start_response, "404 Not Found")
+            return self.respond(start_response, "200 OK")
+        try:
+            entry = self.entry_class.parse_from_xml(InputReader(environ))
+        except ParseError:
+            return self.respond(start_response, "400 Bad Request")
+        if not self.storage.put_entry(collection, name, entry):
+            return self.respond(start_response, "404 Not Found")
+        return self.respond(start_response, "200 OK",
+                            [("ETag", entry_etag(entry))])
+
+    def handle_media(self, environ, start_response, collection, name):
+        method = environ["REQUEST_METHOD"]
+        if method not in ("GET", "HEAD", "PUT"):
+            return self.not_allowed(start_response, "GET, HEAD, PUT")
+        entry = self.storage.get_entry(collection, name)
+        if entry is None:
+            return self.respond(start_response, "404 Not Found")
+        version = self.storage.get_media_version(collection, name)
+        if version is not None:
+            etag = '"%s"' % sha1("%s\0%s" % (entry_etag(entry),
+                                             version)).hexdigest()
+            headers = [("ETag", etag)]
+        else:
+            etag = None
+            headers = []
+        if method == "PUT":
+            if etag is not None and self.precondition_failed(environ, etag):
+                return self.respond(start_response, "412 Precondition Failed")
+            type = environ.get("CONTENT_TYPE") or "application/octet-stream"
+            if not self.storage.put_media(collection, name, type,
+                                          InputReader(environ)):
+                return self.respond(start_response, "404 Not Found")
+            return self.respond(start_response, "200 OK")
+        if etag is not None and self.not_modified(environ, etag):
+            return self.respond(start_response, "304 Not Modified", headers)
+        media = self.storage.get_media(collection, name)
+        if media is None:
+            return self.respond(start_response, "404 Not Found")
+        type, file = media
+        start_response("200 OK", [("Content-Type", type)] + headers)
+        if method == "HEAD":
+            file.close()
+            return []
+        wrapper = environ.get("wsgi.file_wrapper")
+        if wrapper is not None:
+            return wrapper(file, self.chunk_size)
+        return iter_file(file, self.chunk_size)
+
+    # Helpers for the handlers
+    #
+    def respond(self, start_response, status, headers=()):
+        """Respond with *status* and *headers* but without a body."""
+        headers = list(headers)
+        headers.append(("Content-Length", "0"))
+        start_response(status, headers)
+        return []
+
+    def respond_document(self, environ, start_response, etag, type, body):
+        """Respond with an XML document.
+
+        The *body* is an iterable of byte strings. It is only iterated
+        over if the request method wasn't HEAD.
+        """
+        start_response("200 OK", [("Content-Type", type), ("ETag", etag)])
+        if environ["REQUEST_METHOD"] == "HEAD":
+            return []
+        return body
+
+    def not_allowed(self, start_response, allow):
+        return self.respond(start_response, "405 Method Not Allowed",
+                            [("Allow", allow)])
+
+    def not_modified(self, environ, etag):
+        """Does the request's If-None-Match header match *etag*?"""
+        return _match_etag(environ.get("HTTP_IF_NONE_MATCH"), etag)
+
+    def precondition_failed(self, environ, etag):
+        """Does the request's If-Match header not match *etag*?"""
+        header = environ.get("HTTP_IF_MATCH")
+        return header is not None and not _match_etag(header, etag)
+
+
+def _match_etag(header, etag):
+    if not header:
+        return False
+    for item in header.split(","):
+        item = item.strip()
+        if item == "*" or item == etag:
+            return True
+        if item.startswith("W/") and item[2:] == etag:
+            return True
+    return False
+
+
+class InputReader(object):
+    """A file object for the body of a WSGI request.
+
+    Makes sure that no more than the request's Content-Length is read
+    from the input stream. Bodies sent with chunked transfer coding are
+    decoded unless the server did so already and says so through
+    ``wsgi.input_terminated``.
+    """
+    def __init__(self, environ):
+        self.input = environ["wsgi.input"]
+        self.chunked = False
+        if environ.get("wsgi.input_terminated"):
+            self.remaining = None
+        elif (environ.get("HTTP_TRANSFER_ENCODING", "").lower()
+                == "chunked"):
+            self.chunked = True
+            self.remaining = 0
+        else:
+            try:
+                self.remaining = int(environ.get("CONTENT_LENGTH") or 0)
+            except ValueError:
+                self.remaining = 0
+
+    def read(self, size=-1):
+        if self.remaining is None:
+            return self.input.read(size)
+        if self.chunked and not self.remaining:
+            self.next_chunk()
+        if size < 0:
+            if self.chunked:
+                return "".join(iter(lambda: self.read(1 << 16), ""))
+            size = self.remaining
+        size = min(size, self.remaining)
+        if not size:
+            return ""
+        data = self.input.read(size)
+        self.remaining -= len(data)
+        if not data:
+            self.remaining = 0
+            self.chunked = False
+        elif self.chunked and not self.remaining:
+            self.input.readline() # CRLF after the chunk data
+        return data
+
+    def next_chunk(self):
+        line = self.input.readline()
+        try:
+            self.remaining = int(line.split(";")[0].strip(), 16)
+        except ValueError:
+            self.remaining = 0
+        if not self.remaining:
+            # The last chunk. Skip trailers and stop.
+            while line.strip():
+                line = self.input.readline()
+            self.chunked = False
+
+
+def iter_file(file, chunk_size):
+    """Iterate over the content of *file* in chunks and then close it."""
+    try:
+        while True:
+            data = file.read(chunk_size)
+            if not data:
+                break
+            yield data
+    finally:
+        file.close()
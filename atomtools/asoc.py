@@ -11,16 +11,26 @@ changed completely.
 You can find the documentation in doc/ames in the source distribution.
 """
 
+import base64
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from hashlib import sha256
+from heapq import heapify, heappop, heappush, merge
+
 from atomtools.atom import (AtomCategory, AtomCommon, AtomDate,
                             AtomEntry, AtomLink, AtomPerson, AtomText,
-                            atom_ns)
+                            atom_tags)
 from atomtools.atompub import AppFeed, AppService
-from atomtools.utils import create_text_xml, from_text_xml
-from atomtools.xml import define_namespace, QName, XMLObject, xml_ns
+from atomtools.utils import (create_text_xml, from_text_xml,
+                             timestamp_from_date)
+from atomtools.xml import (define_namespace, define_tags,
+                           iterparse_children, XMLObject, xml_tags)
 
 # Namespace
 #
 asoc_ns = define_namespace("asoc", "http://www.alipedis.com/2012/asoc")
+asoc_tags = define_tags(asoc_ns, "certificate", "certificates", "content",
+                        "name", "peer", "peers", "post", "uri")
 
 
 # Messaging
@@ -39,7 +49,7 @@ class AsocPost(AtomCommon):
         "rights": AtomText.from_xml,
         "updated": AtomDate.from_xml,
     }
-    standard_tag = QName(asoc_ns, "post")
+    standard_tag = asoc_tags.post
     content_type = "application/asoc+xml"
 
     def __init__(self, authors=(), categories=(), content=None, id=None,
@@ -61,43 +71,66 @@ class AsocPost(AtomCommon):
         kwargs.setdefault("categories", [])
         kwargs.setdefault("links", [])
         for sub in element:
-            if sub.tag == QName(atom_ns, "author"):
+            if sub.tag == atom_tags.author:
                 kwargs["authors"].append(cls.inner_from_xml("author", sub))
-            elif sub.tag == QName(atom_ns, "category"):
+            elif sub.tag == atom_tags.category:
                 kwargs["categories"].append(cls.inner_from_xml("category",
                                                                sub))
-            elif sub.tag == QName(asoc_ns, "content"):
+            elif sub.tag == asoc_tags.content:
                 kwargs["content"] = cls.inner_from_xml("content", sub)
-            elif sub.tag == QName(atom_ns, "id"):
+            elif sub.tag == atom_tags.id:
                 kwargs["id"] = from_text_xml(sub)
-            elif sub.tag == QName(atom_ns, "link"):
+            elif sub.tag == atom_tags.link:
                 kwargs["links"].append(cls.inner_from_xml("link", sub))
-            elif sub.tag == QName(atom_ns, "publised"):
+            elif sub.tag == atom_tags.published:
                 kwargs["published"] = cls.inner_from_xml("published", sub)
-            elif sub.tag == QName(atom_ns, "rights"):
+            elif sub.tag == atom_tags.rights:
                 kwargs["rights"] = cls.inner_from_xml("rights", sub)
-            elif sub.tag == QName(atom_ns, "updated"):
+            elif sub.tag == atom_tags.updated:
                 kwargs["updated"] = cls.inner_from_xml("updated", sub)
         return super(AsocPost, cls).from_xml(element, **kwargs)
 
     def prepare_xml(self, element):
         super(AsocPost, self).prepare_xml(element)
         for author in self.authors:
-            author.create_xml(element, QName(atom_ns, "author"))
+            author.create_xml(element, atom_tags.author)
         for category in self.categories:
-            category.create_xml(element, QName(atom_ns, "category"))
+            category.create_xml(element, atom_tags.category)
         if self.content:
-            self.content.create_xml(element, QName(asoc_ns, "content"))
+            self.content.create_xml(element, asoc_tags.content)
         if self.id is not None:
-            create_text_xml(self.id, element, QName(atom_ns, "id"))
+            create_text_xml(self.id, element, atom_tags.id)
         for link in self.links:
-            link.create_xml(element, QName(atom_ns, "link"))
+            link.create_xml(element, atom_tags.link)
+        if self.published:
+            self.published.create_xml(element, atom_tags.published)
+        if self.rights:
+            self.rights.create_xml(element, atom_tags.rights)
+        if self.updated:
+            self.updated.create_xml(element, atom_tags.updated)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AsocPost, self).check_xml(result, path, secure, **kwargs)
+        if not self.id:
+            result.add(path + "/atom:id", "id is required")
+        if not self.updated:
+            result.add(path + "/atom:updated", "updated is required")
+        for n, item in enumerate(self.authors, 1):
+            item.check_xml(result, "%s/atom:author[%d]" % (path, n), secure)
+        for n, item in enumerate(self.categories, 1):
+            item.check_xml(result, "%s/atom:category[%d]" % (path, n),
+                           secure)
+        for n, item in enumerate(self.links, 1):
+            item.check_xml(result, "%s/atom:link[%d]" % (path, n), secure)
+        if self.content:
+            self.content.check_xml(result, path + "/asoc:content", secure)
         if self.published:
-            self.published.create_xml(element, QName(atom_ns, "published"))
+            self.published.check_xml(result, path + "/atom:published",
+                                     secure)
         if self.rights:
-            self.rights.create_xml(element, QName(atom_ns, "rights"))
+            self.rights.check_xml(result, path + "/atom:rights", secure)
         if self.updated:
-            self.updated.create_xml(element, QName(atom_ns, "updated"))
+            self.updated.check_xml(result, path + "/atom:updated", secure)
 
     # A bunch of helpers to make life easier
     #
@@ -142,12 +175,151 @@ class AsocFeed(AppFeed):
 
     @classmethod
     def from_xml(cls, element, **kwargs):
-        entries = kwargs.setdefault("entries", [])
+        posts = kwargs.setdefault("posts", [])
         for sub in element:
-            if sub.tag == QName(asoc_ns, "post"):
-                entries.append(cls.inner_from_xml("post", sub))
+            if sub.tag == asoc_tags.post:
+                posts.append(cls.inner_from_xml("post", sub))
         return super(AsocFeed, cls).from_xml(element, **kwargs)
 
+    def prepare_xml(self, element):
+        super(AsocFeed, self).prepare_xml(element)
+        for post in self.posts:
+            post.create_xml(element)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AsocFeed, self).check_xml(result, path, secure, **kwargs)
+        for n, post in enumerate(self.posts, 1):
+            post.check_xml(result, "%s/asoc:post[%d]" % (path, n), secure)
+
+
+class AsocTimeline(object):
+    """The newest posts of a number of feeds.
+
+    The timeline keeps at most *size* posts, dropping the oldest ones as
+    newer posts are added. Posts are ordered by their atom:updated or, if
+    that is missing, atom:published value and, for equal times, by their
+    id. Posts with the same id are only kept once, the newest version
+    wins.
+
+    Pages of the timeline are retrieved through :meth:`get_posts` using
+    a cursor created by :meth:`get_cursor` from the last post of the
+    previous page.
+    """
+    def __init__(self, size=1000, feeds=()):
+        if size < 1:
+            raise ValueError("timeline size must be at least 1")
+        self.size = size
+        self.heap = []
+        self.live = {}
+        self.sorted = None
+        self.serial = 0
+        self.add_feeds(feeds)
+
+    def __len__(self):
+        return len(self.live)
+
+    def add_feeds(self, feeds):
+        """Add the posts of all *feeds*.
+
+        The posts of each feed are merged by time, newest first. Since the
+        timeline only keeps the newest posts, merging stops as soon as the
+        remaining posts are too old to make it into the timeline.
+        """
+        streams = []
+        for feed in feeds:
+            self.serial += 1
+            stream = [(-key[0], self.serial, n, key, post)
+                      for n, (key, post) in enumerate(
+                            (self.get_cursor(post), post)
+                            for post in feed.posts)]
+            stream.sort()
+            streams.append(stream)
+        for item in merge(*streams):
+            if len(self.live) >= self.size and item[3][0] < self.oldest()[0]:
+                break
+            self.push(item[3], item[4])
+
+    def add_posts(self, posts):
+        """Add an iterable of posts."""
+        for post in posts:
+            self.push(self.get_cursor(post), post)
+
+    def push(self, key, post):
+        """Add *post* whose cursor is *key*."""
+        live = self.live
+        current = live.get(key[1])
+        if current is not None:
+            if current >= key:
+                return
+            # The old version stays in the heap and is skipped later.
+            del live[key[1]]
+        elif len(live) >= self.size:
+            if key <= self.oldest():
+                return
+            del live[heappop(self.heap)[0][1]]
+        self.serial += 1
+        heappush(self.heap, (key, self.serial, post))
+        live[key[1]] = key
+        self.sorted = None
+        if len(self.heap) > 2 * len(live) + 64:
+            self.compact()
+
+    def compact(self):
+        """Drop the outdated versions of posts from the heap."""
+        live = self.live
+        self.heap = [item for item in self.heap
+                     if live.get(item[0][1]) == item[0]]
+        heapify(self.heap)
+
+    def oldest(self):
+        """Return the key of the oldest post currently kept."""
+        heap = self.heap
+        while self.live.get(heap[0][0][1]) != heap[0][0]:
+            heappop(heap)
+        return heap[0][0]
+
+    def get_posts(self, before=None, after=None, limit=None):
+        """Return a list of posts, newest first.
+
+        If *before* is given, only posts older than that cursor are
+        returned. If *after* is given, only posts newer than that cursor
+        are returned. If there are more than *limit* posts, those closest
+        to the cursor are returned, or the newest ones if there is no
+        cursor.
+        """
+        if self.sorted is None:
+            items = [item for item in self.heap
+                     if self.live.get(item[0][1]) == item[0]]
+            items.sort()
+            self.sorted = ([item[0] for item in items],
+                           [item[2] for item in items])
+        keys, posts = self.sorted
+        start, end = 0, len(keys)
+        if after is not None:
+            start = bisect_right(keys, after)
+        if before is not None:
+            end = bisect_left(keys, before)
+        if limit is not None and end - start > limit:
+            if after is not None and before is None:
+                end = start + limit
+            else:
+                start = end - limit
+        result = posts[start:end]
+        result.reverse()
+        return result
+
+    @staticmethod
+    def get_cursor(post):
+        """Return the position of *post* in the timeline.
+
+        The result is a pair of the post's time in microseconds since the
+        epoch and its id.
+        """
+        timestamp = timestamp_from_date(post.updated or post.published)
+        if timestamp is None:
+            return 0, post.id
+        return timestamp, post.id
+
 # Peers
 #
 
@@ -159,7 +331,7 @@ class AsocPeer(XMLObject):
         "category": AtomCategory.from_xml,
         "link": AtomLink.from_xml,
     }
-    standard_tag = QName(asoc_ns, "peer")
+    standard_tag = asoc_tags.peer
     content_type = "application/asoc+xml"
 
     def __init__(self, id=None, uri=None, name=None, categories=(), links=(),
@@ -176,32 +348,42 @@ class AsocPeer(XMLObject):
         kwargs.setdefault("categories", [])
         kwargs.setdefault("links", [])
         for sub in element:
-            if sub.tag == QName(atom_ns, "id"):
+            if sub.tag == atom_tags.id:
                 kwargs["id"] = from_text_xml(sub)
-            elif sub.tag == QName(asoc_ns, "uri"):
+            elif sub.tag == asoc_tags.uri:
                 kwargs["uri"] = from_text_xml(sub)
-            elif sub.tag == QName(asoc_ns, "name"):
+            elif sub.tag == asoc_tags.name:
                 kwargs["name"] = from_text_xml(sub)
-            elif sub.tag == QName(atom_ns, "category"):
+            elif sub.tag == atom_tags.category:
                 kwargs["categories"].append(cls.inner_from_xml("category",
                                                                sub))
-            elif sub.tag == QName(atom_ns, "link"):
+            elif sub.tag == atom_tags.link:
                 kwargs["links"].append(cls.inner_from_xml("link", sub))
         return super(AsocPeer, cls).from_xml(element, **kwargs)
 
     def prepare_xml(self, element):
         super(AsocPeer, self).prepare_xml(element)
         if self.id:
-            create_text_xml(self.id, element, QName(atom_ns, "id"))
+            create_text_xml(self.id, element, atom_tags.id)
         if self.uri:
-            create_text_xml(self.uri, element, QName(asoc_ns, "uri"))
+            create_text_xml(self.uri, element, asoc_tags.uri)
         if self.name:
-            create_text_xml(self.name, element, QName(asoc_ns, "name"))
+            create_text_xml(self.name, element, asoc_tags.name)
         for item in self.categories:
             item.create_xml(element)
         for item in self.links:
             item.create_xml(element)
 
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AsocPeer, self).check_xml(result, path, secure, **kwargs)
+        if not self.id and not self.uri:
+            result.add(path + "/atom:id", "id or uri is required")
+        for n, item in enumerate(self.categories, 1):
+            item.check_xml(result, "%s/atom:category[%d]" % (path, n),
+                           secure)
+        for n, item in enumerate(self.links, 1):
+            item.check_xml(result, "%s/atom:link[%d]" % (path, n), secure)
+
 
 class AsocPeers(XMLObject):
     """The "asoc:peers" Element and Document
@@ -210,7 +392,7 @@ class AsocPeers(XMLObject):
     inner_factory = {
         "peer": AsocPeer.from_xml,
     }
-    standard_tag = QName(asoc_ns, "peers")
+    standard_tag = asoc_tags.peers
     content_type = "application/asoc+xml"
 
     def __init__(self, peers=(), **kwargs):
@@ -221,21 +403,163 @@ class AsocPeers(XMLObject):
     def from_xml(cls, element, **kwargs):
         kwargs.setdefault("peers", [])
         for sub in element:
-            if sub.tag == QName(asoc_ns, "peer"):
+            if sub.tag == asoc_tags.peer:
                 kwargs["peers"].append(cls.inner_from_xml("peer", sub))
         return super(AsocPeers, cls).from_xml(element, **kwargs)
 
+    @classmethod
+    def iterparse_from_xml(cls, source, parser=None):
+        """Iterate over the peers in the XML file object *source*.
+
+        Each peer is produced as soon as it has been parsed, so this works
+        with documents of any size.
+        """
+        for root, sub in iterparse_children(source, cls.standard_tag,
+                                            parser):
+            if sub.tag == asoc_tags.peer:
+                peer = cls.inner_from_xml("peer", sub)
+                peer.resolve(root.attrib.get(xml_tags.base),
+                             root.attrib.get(xml_tags.lang))
+                yield peer
+
     def prepare_xml(self, element):
         super(AsocPeers, self).prepare_xml(element)
         for item in self.peers:
             item.create_xml(element)
 
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AsocPeers, self).check_xml(result, path, secure, **kwargs)
+        for n, item in enumerate(self.peers, 1):
+            item.check_xml(result, "%s/asoc:peer[%d]" % (path, n), secure)
+
+
+class AsocPeerIndex(object):
+    """An index over a large number of :class:`AsocPeer` objects.
+
+    Peers are identified by their *id* or, if that is missing, by their
+    *uri*. The index allows looking up peers by id or uri and finding all
+    peers with a certain category term in constant time.
+
+    Two snapshots of the peers of an account can be compared with
+    :meth:`diff`.
+    """
+    def __init__(self, peers=()):
+        self.peers = {}
+        self.uris = {}
+        self.terms = {}
+        self.signatures = {}
+        for peer in peers:
+            self.add(peer)
+
+    @classmethod
+    def parse_from_xml(cls, source, parser=None):
+        """Create an index from an asoc:peers document in *source*.
+
+        The document is parsed peer by peer, so the element tree of the
+        entire document never exists.
+        """
+        return cls(AsocPeers.iterparse_from_xml(source, parser))
+
+    def __len__(self):
+        return len(self.peers)
+
+    def __iter__(self):
+        return self.peers.itervalues()
+
+    def __contains__(self, key):
+        return key in self.peers or key in self.uris
+
+    def add(self, peer):
+        """Add *peer*, replacing a peer with the same key."""
+        key = self.get_key(peer)
+        if key in self.peers:
+            self.remove(key)
+        self.peers[key] = peer
+        if peer.uri is not None:
+            self.uris[peer.uri] = key
+        for category in peer.categories:
+            self.terms.setdefault(category.term, set()).add(key)
+        self.signatures[key] = self.get_signature(peer)
+
+    def remove(self, key):
+        """Remove the peer with *key*. Raises :exc:`KeyError` if missing."""
+        peer = self.peers.pop(key)
+        del self.signatures[key]
+        if peer.uri is not None and self.uris.get(peer.uri) == key:
+            del self.uris[peer.uri]
+        for category in peer.categories:
+            keys = self.terms.get(category.term)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.terms[category.term]
+
+    def get(self, id):
+        """Return the peer with *id* or ``None``."""
+        return self.peers.get(id)
+
+    def get_by_uri(self, uri):
+        """Return the peer with *uri* or ``None``."""
+        key = self.uris.get(uri)
+        if key is None:
+            return None
+        return self.peers[key]
+
+    def get_by_category(self, term, scheme=None):
+        """Return a list of all peers with a category *term*.
+
+        If *scheme* is given, the category must also be of this scheme.
+        """
+        peers = [self.peers[key] for key in self.terms.get(term, ())]
+        if scheme is not None:
+            peers = [peer for peer in peers
+                     if any(category.term == term
+                            and category.scheme == scheme
+                            for category in peer.categories)]
+        return peers
+
+    def diff(self, other):
+        """Compare this index with the newer index *other*.
+
+        Returns a triple of lists of peers: those that have been added in
+        *other*, those that have been removed, and those that have
+        changed. Removed peers are taken from this index, all others from
+        *other*.
+        """
+        added = []
+        changed = []
+        for key, signature in other.signatures.iteritems():
+            old = self.signatures.get(key)
+            if old is None:
+                added.append(other.peers[key])
+            elif old != signature:
+                changed.append(other.peers[key])
+        removed = [peer for key, peer in self.peers.iteritems()
+                   if key not in other.signatures]
+        return added, removed, changed
+
+    @staticmethod
+    def get_key(peer):
+        """Return the key of *peer* in the index."""
+        if peer.id is not None:
+            return peer.id
+        return peer.uri
+
+    @staticmethod
+    def get_signature(peer):
+        """Return a value that changes when *peer* changes."""
+        return (peer.id, peer.uri, peer.name,
+                tuple(sorted((category.term, category.scheme, category.label)
+                             for category in peer.categories)),
+                tuple((link.rel, link.href, link.type)
+                      for link in peer.links))
+
 
 class AsocCertificate(XMLObject):
     """The "asoc:certificate" Element.
 
     """
-    standard_tag = QName(asoc_ns, "certificate")
+    standard_tag = asoc_tags.certificate
     content_type = "application/asoc+xml"
 
     def __init__(self, href=None, name=None, certificate=None, **kwargs):
@@ -261,6 +585,12 @@ class AsocCertificate(XMLObject):
         if self.certificate:
             element.text = self.certificate
 
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AsocCertificate, self).check_xml(result, path, secure,
+                                               **kwargs)
+        if not self.certificate:
+            result.add(path, "certificate is required")
+
 
 class AsocCertificates(XMLObject):
     """The "asoc:certificates" Element
@@ -270,7 +600,7 @@ class AsocCertificates(XMLObject):
     inner_factory = {
         "certificate": AsocCertificate.from_xml,
     }
-    standard_tag = QName(asoc_ns, "certificates")
+    standard_tag = asoc_tags.certificates
     content_type = "application/asoc+xml"
 
     def __init__(self, certificates=(), **kwargs):
@@ -278,10 +608,10 @@ class AsocCertificates(XMLObject):
         self.certificates = list(certificates)
 
     @classmethod
-    def from_xml(self, element, **kwargs):
+    def from_xml(cls, element, **kwargs):
         kwargs.setdefault("certificates", list())
         for sub in element:
-            if sub.tag == QName(asoc_ns, "certificate"):
+            if sub.tag == asoc_tags.certificate:
                 kwargs["certificates"].append(
                         cls.inner_from_xml("certificate", sub))
         return super(AsocCertificates, cls).from_xml(element, **kwargs)
@@ -291,6 +621,126 @@ class AsocCertificates(XMLObject):
         for cert in self.certificates:
             cert.create_xml(element)
 
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AsocCertificates, self).check_xml(result, path, secure,
+                                                **kwargs)
+        for n, item in enumerate(self.certificates, 1):
+            item.check_xml(result, "%s/asoc:certificate[%d]" % (path, n),
+                           secure)
+
+
+class AsocCertificateStore(object):
+    """A store for the certificates of an asoc:certificates document.
+
+    Certificates are indexed by their *href* and *name*. The certificate
+    text is decoded into DER only once, when a certificate is added or
+    changed. The decoded data is turned into whatever you need for
+    verification by *loader*, a function taking the DER data as its only
+    argument. If it is ``None``, the DER data itself is used. Results of
+    the loader are kept in a cache of at most *cache_size* items, keyed
+    by the SHA-256 fingerprint of the DER data, with the least recently
+    used items dropped first.
+
+    Certificates whose text can't be decoded are left out. The dict
+    *errors* maps their keys to the error message of the last update.
+    """
+    def __init__(self, certificates=(), loader=None, cache_size=256):
+        self.loader = loader
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.records = {}
+        self.names = {}
+        self.errors = {}
+        self.update(certificates)
+
+    def __len__(self):
+        return len(self.records)
+
+    def update(self, certificates):
+        """Replace the content of the store with *certificates*.
+
+        The argument can be a :class:`AsocCertificates` object or an
+        iterable of :class:`AsocCertificate` objects. Certificates whose
+        text hasn't changed since the last update aren't decoded again.
+        """
+        certificates = getattr(certificates, "certificates", certificates)
+        records = {}
+        names = {}
+        errors = {}
+        for cert in certificates:
+            key = self.get_key(cert)
+            old = self.records.get(key)
+            if old is not None and old[0].certificate == cert.certificate:
+                fingerprint, der = old[1], old[2]
+            else:
+                try:
+                    der = decode_certificate(cert.certificate)
+                except (TypeError, ValueError), err:
+                    errors[key] = str(err)
+                    continue
+                fingerprint = sha256(der).hexdigest()
+            records[key] = (cert, fingerprint, der)
+            if cert.name is not None:
+                names[cert.name] = key
+        self.records = records
+        self.names = names
+        self.errors = errors
+
+    def get(self, href):
+        """Return the loaded certificate for *href* or ``None``."""
+        record = self.records.get(href)
+        if record is None:
+            return None
+        return self.load(record[1], record[2])
+
+    def get_by_name(self, name):
+        """Return the loaded certificate called *name* or ``None``."""
+        key = self.names.get(name)
+        if key is None:
+            return None
+        return self.get(key)
+
+    def get_certificate(self, href):
+        """Return the :class:`AsocCertificate` for *href* or ``None``."""
+        record = self.records.get(href)
+        return record and record[0]
+
+    def get_fingerprint(self, href):
+        """Return the SHA-256 fingerprint of the certificate for *href*."""
+        record = self.records.get(href)
+        return record and record[1]
+
+    def load(self, fingerprint, der):
+        """Return the loaded certificate, using the cache if possible."""
+        cache = self.cache
+        try:
+            value = cache.pop(fingerprint)
+        except KeyError:
+            if self.loader is None:
+                value = der
+            else:
+                value = self.loader(der)
+            if len(cache) >= self.cache_size:
+                cache.popitem(last=False)
+        cache[fingerprint] = value
+        return value
+
+    @staticmethod
+    def get_key(cert):
+        """Return the key of *cert* in the store."""
+        if cert.href is not None:
+            return cert.href
+        return cert.name
+
+
+def decode_certificate(text):
+    """Decode the PEM or plain base64 certificate *text* into DER."""
+    if not text:
+        return ""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    lines = [line for line in lines if line and not line.startswith("-----")]
+    return base64.b64decode("".join(lines))
+
 
 class AsocService(AppService):
     """An app:service element with asoc extensions.
@@ -308,7 +758,7 @@ class AsocService(AppService):
     def from_xml(cls, element, **kwargs):
         kwargs.setdefault('links', [])
         for sub in element:
-            if sub.tag == QName(atom_ns, "link"):
+            if sub.tag == atom_tags.link:
                 kwargs["links"].append(cls.inner_from_xml("link", sub))
         return super(AsocService, cls).from_xml(element, **kwargs)
 
@@ -317,6 +767,11 @@ class AsocService(AppService):
         for link in self.links:
             link.create_xml(element)
 
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AsocService, self).check_xml(result, path, secure, **kwargs)
+        for n, item in enumerate(self.links, 1):
+            item.check_xml(result, "%s/atom:link[%d]" % (path, n), secure)
+
     def get_link(self, rel):
         """Return the href of the first link with *rel* or None."""
         for link in self.links:
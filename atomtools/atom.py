@@ -4,20 +4,34 @@ The document you are looking for is RFC 4287.
 """
 from __future__ import absolute_import
 import base64
+from copy import copy
 from datetime import datetime, tzinfo
+from hashlib import sha1
+from itertools import islice
 import re
-from xml.etree.ElementTree import QName
-
-from atomtools.exceptions import ValidationError
-from atomtools.utils import (create_text_xml, flatten_xml_content,
-                             from_text_xml, wrap_xml_tree)
+from xml.etree.ElementTree import Comment
+
+from atomtools.exceptions import IncompleteObjectError, ValidationError
+from atomtools.utils import (create_text_xml, default_interner,
+                             extract_html_text, extract_xml_text,
+                             flatten_xml_content, from_text_xml,
+                             is_unsafe_html, is_unsafe_xml, join_url,
+                             TextCollector, wrap_xml_tree)
 from atomtools.tzinfo import TzInfoFixedOffset, TzInfoUTC
-from atomtools.xhtml import xhtml_ns
-from atomtools.xml import define_namespace, XMLObject, xml_ns
+from atomtools.xhtml import xhtml_tags
+from atomtools.xml import (define_namespace, define_tags,
+                           iterparse_children, serialize_xml,
+                           ValidationResult, XMLObject, xml_tags,
+                           xpath_name)
 
 # Namespace
 #
 atom_ns = define_namespace("atom", "http://www.w3.org/2005/Atom")
+atom_tags = define_tags(atom_ns, "author", "category", "content",
+                        "contributor", "email", "entry", "feed", "generator",
+                        "icon", "id", "link", "logo", "name", "published",
+                        "rights", "source", "subtitle", "summary", "title",
+                        "updated", "uri")
 
 
 class AtomCommon(XMLObject):
@@ -28,7 +42,19 @@ class AtomCommon(XMLObject):
 
     The optional *lang* attribute indicates the natural language for this
     and any inner element.
+
+    Values that tend to repeat a lot, such as link relations or category
+    terms, are deduplicated during parsing by the
+    :class:`.atomtools.utils.Interner` in the class attribute *interner*.
+
+    Once :meth:`resolve` has been called, *resolved_base* and
+    *resolved_lang* contain the values in effect for the object, taking
+    into account those of all its containers.
     """
+    interner = default_interner
+    resolved_base = None
+    resolved_lang = None
+
     def __init__(self, base=None, lang=None, **kwargs):
         super(AtomCommon, self).__init__(**kwargs)
         self.base = base
@@ -37,16 +63,82 @@ class AtomCommon(XMLObject):
     @classmethod
     def from_xml(cls, element, **kwargs):
         return super(AtomCommon, cls).from_xml(element,
-                base=element.attrib.get(QName(xml_ns, "base")),
-                lang=element.attrib.get(QName(xml_ns, "lang")),
+                base=element.attrib.get(xml_tags.base),
+                lang=element.attrib.get(xml_tags.lang),
                 **kwargs)
 
+    def resolve(self, base=None, lang=None):
+        if self.base is not None:
+            base = join_url(base, self.base)
+        if self.lang is not None:
+            lang = self.lang
+        self.resolved_base = base
+        self.resolved_lang = lang
+        super(AtomCommon, self).resolve(base, lang)
+
+    def resolve_url(self, url):
+        """Return *url* resolved against the effective xml:base."""
+        return join_url(self.resolved_base, url)
+
     def prepare_xml(self, element):
         super(AtomCommon, self).prepare_xml(element)
         if self.base is not None:
-            element.attrib[QName(xml_ns, "base")] = self.base
+            element.attrib[xml_tags.base] = self.base
         if self.lang is not None:
-            element.attrib[QName(xml_ns, "lang")] = self.lang
+            element.attrib[xml_tags.lang] = self.lang
+
+
+class AtomFlyweight(AtomCommon):
+    """Base for constructs whose instances can be shared.
+
+    If the class attribute *shared* is ``True``, :meth:`from_xml` returns
+    the very same instance for all elements with the same content. Such
+    shared instances are frozen: setting an attribute raises
+    :exc:`TypeError`. Use :meth:`copy` to get a changeable copy.
+    """
+    shared = False
+    _frozen = False
+
+    def __setattr__(self, name, value):
+        # This runs for every attribute of every instance, shared or
+        # not, so it is kept as cheap as possible.
+        if self._frozen:
+            raise TypeError("shared %s cannot be changed, use copy()"
+                            % type(self).__name__)
+        object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_xml(cls, element, **kwargs):
+        if not cls.shared:
+            return super(AtomFlyweight, cls).from_xml(element, **kwargs)
+        key = (cls, element.attrib.get(xml_tags.base),
+               element.attrib.get(xml_tags.lang),
+               frozenset(kwargs.iteritems()))
+        try:
+            hash(key)
+        except TypeError:
+            return super(AtomFlyweight, cls).from_xml(element, **kwargs)
+        def create():
+            result = super(AtomFlyweight, cls).from_xml(element, **kwargs)
+            result.__dict__["_frozen"] = True
+            return result
+        return cls.interner.share(key, create)
+
+    def resolve(self, base=None, lang=None):
+        # Shared instances appear in different contexts, so they can't
+        # keep any of them.
+        if not self.is_frozen():
+            super(AtomFlyweight, self).resolve(base, lang)
+
+    def is_frozen(self):
+        """Is this a shared instance that cannot be changed?"""
+        return self._frozen
+
+    def copy(self):
+        """Return a shallow copy that can be changed."""
+        result = copy(self)
+        result.__dict__.pop("_frozen", None)
+        return result
 
 
 class AtomText(AtomCommon):
@@ -62,10 +154,14 @@ class AtomText(AtomCommon):
     is ``"xhtml"``, the text is a element tree element, specifically, a
     xthml:div element.
 
-    The text is never sanitized. If you are doing anything with it, you
-    should check that it doesn't contain any malicious crap, such as
-    xhtml:script elements.
+    By default, the text is never sanitized. If you are doing anything
+    with it, you should check that it doesn't contain any malicious crap,
+    such as xhtml:script elements. Alternatively, set the class attribute
+    *sanitize_policy* to a :class:`.atomtools.sanitize.SanitizePolicy`
+    in a derived class to have html and xhtml text sanitized when parsed.
     """
+    sanitize_policy = None
+
     def __init__(self, type="text", text=None, **kwargs):
         super(AtomText, self).__init__(**kwargs)
         self.type = type
@@ -74,10 +170,15 @@ class AtomText(AtomCommon):
     @classmethod
     def from_xml(cls, element, **kwargs):
         type = element.attrib.get("type", "text").lower().strip()
+        policy = cls.sanitize_policy
         if type in ("text", "html"):
             text = flatten_xml_content(element)
+            if type == "html" and policy is not None:
+                text = policy.sanitize_html(text)
         elif type == "xhtml":
-            text = wrap_xml_tree(element, QName(xhtml_ns, "dvi"))
+            text = wrap_xml_tree(element, xhtml_tags.div)
+            if policy is not None:
+                text = policy.sanitize_xml(text)
         else:
             text = None
         return super(AtomText, cls).from_xml(element, type=type, text=text,
@@ -89,7 +190,7 @@ class AtomText(AtomCommon):
             element.attrib["type"] = self.type
         if self.type is not None and self.type.lower() == "xhtml":
             if self.text is None:
-                element.append(QName(xhtml_ns, "div"))
+                element.append(xhtml_tags.div)
             elif hasattr(self.text, "create_xml"):
                 self.text.create_xml(element)
             else:
@@ -97,8 +198,29 @@ class AtomText(AtomCommon):
         elif self.text:
             element.text = unicode(self.text)
 
-
-class AtomPerson(AtomCommon):
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AtomText, self).check_xml(result, path, secure, **kwargs)
+        if self.type not in ("text", "html", "xhtml"):
+            result.add(path + "/@type", "unknown text type")
+        elif self.type == "xhtml":
+            if getattr(self.text, "tag", None) != xhtml_tags.div:
+                result.add(path, "xhtml text needs a single xhtml:div")
+            elif secure and is_unsafe_xml(self.text):
+                result.add(path, "potentially unsafe xhtml")
+        elif secure and self.type == "html" and is_unsafe_html(self.text):
+            result.add(path, "potentially unsafe html")
+
+    def get_plain_text(self, limit=None):
+        """Return the text as normalized plain text.
+
+        Markup is removed and runs of whitespace are collapsed into a
+        single space. If *limit* is given, the result is at most that
+        many characters long and processing stops once they are found.
+        """
+        return get_plain_text(self.type, self.text, limit)
+
+
+class AtomPerson(AtomFlyweight):
     """3.2.  Person Constructs
 
     The person construct describes a person.
@@ -106,6 +228,8 @@ class AtomPerson(AtomCommon):
     The *name* attribute contains the human-readable name for the person.
     The optional *uri* attribute contains an IRI associated with the person.
     The optional *email* attribute contains the person's email address.
+
+    Persons can be shared. See :class:`AtomFlyweight`.
     """
     def __init__(self, name=None, uri=None, email=None, **kwargs):
         super(AtomPerson, self).__init__(**kwargs)
@@ -115,22 +239,28 @@ class AtomPerson(AtomCommon):
 
     @classmethod
     def from_xml(cls, element, **kwargs):
+        intern = cls.interner
         for sub in element:
-            if sub.tag == QName(atom_ns, "name"):
-                kwargs["name"] = sub.text
-            elif sub.tag == QName(atom_ns, "uri"):
-                kwargs["uri"] = sub.text
-            elif sub.tag == QName(atom_ns, "email"):
-                kwargs["email"] = sub.text
+            if sub.tag == atom_tags.name:
+                kwargs["name"] = intern(sub.text)
+            elif sub.tag == atom_tags.uri:
+                kwargs["uri"] = intern(sub.text)
+            elif sub.tag == atom_tags.email:
+                kwargs["email"] = intern(sub.text)
         return super(AtomPerson, cls).from_xml(element, **kwargs)
 
     def prepare_xml(self, element):
         super(AtomPerson, self).prepare_xml(element)
-        create_text_xml(self.name, element, QName(atom_ns, "name"))
+        create_text_xml(self.name, element, atom_tags.name)
         if self.uri:
-            create_text_xml(self.uri, element, QName(atom_ns, "uri"))
+            create_text_xml(self.uri, element, atom_tags.uri)
         if self.email:
-            create_text_xml(self.email, element, QName(atom_ns, "email"))
+            create_text_xml(self.email, element, atom_tags.email)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AtomPerson, self).check_xml(result, path, secure, **kwargs)
+        if not self.name:
+            result.add(path + "/atom:name", "name is required")
 
 
 class AtomDate(AtomCommon):
@@ -151,22 +281,27 @@ class AtomDate(AtomCommon):
 
     @classmethod
     def from_xml(cls, element, **kwargs):
-        m = cls.date_re.match(element.text)
+        m = cls.date_re.match(element.text or "")
+        dt = None
         if m is not None:
             (year, mon, day, hour, minute,
              sec, frac, off, offhour, offmin) = m.groups()
             if offhour is None:
                 tz = TzInfoUTC()
             else:
-                tz = TzInfoFixedOffset(int(offhour) * 60 + int(offmin))
+                offset = int(offhour) * 60 + int(offmin)
+                if off[0] == "-":
+                    offset = -offset
+                tz = TzInfoFixedOffset(offset)
             if frac:
                 msec = int(float(frac) * 1000000)
             else:
                 msec = 0
-            dt = datetime(int(year), int(mon), int(day), int(hour),
-                          int(minute), int(sec), msec, tz)
-        else:
-            dt = None
+            try:
+                dt = datetime(int(year), int(mon), int(day), int(hour),
+                              int(minute), int(sec), msec, tz)
+            except ValueError:
+                pass
         return super(AtomDate, cls).from_xml(element, datetime=dt, **kwargs)
 
     def prepare_xml(self, element):
@@ -185,7 +320,11 @@ class AtomDate(AtomCommon):
         element.text = ("%04d-%02d-%02dT%02d:%02d:%02d%s%s" 
                           % (dt.year, dt.month, dt.day, dt.hour,
                              dt.minute, dt.second, frac, tz))
-        print element.text
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AtomDate, self).check_xml(result, path, secure, **kwargs)
+        if self.datetime is None:
+            result.add(path, "not a valid date")
 
 
 class AtomContent(AtomCommon):
@@ -208,8 +347,16 @@ class AtomContent(AtomCommon):
     See section 4.1.3.3. for how XML is parsed and generated. We support
     arbitrary media types. If you want to limit types in your derived
     class, overide :meth:`allow_type`.
+
+    As with :class:`AtomText`, html and xhtml content is sanitized during
+    parsing if the class attribute *sanitize_policy* is set.
+
+    After :meth:`resolve`, *resolved_src* contains the absolute IRI of
+    *src*.
     """
-    standard_tag = QName(atom_ns, "content")
+    standard_tag = atom_tags.content
+    sanitize_policy = None
+    resolved_src = None
 
     def __init__(self, type=None, src=None, content=None, **kwargs):
         super(AtomContent, self).__init__(**kwargs)
@@ -225,8 +372,12 @@ class AtomContent(AtomCommon):
             content = None
         elif type in ("text", "html"):
             content = flatten_xml_content(element)
+            if type == "html" and cls.sanitize_policy is not None:
+                content = cls.sanitize_policy.sanitize_html(content)
         elif type == "xhtml":
-            content = wrap_xml_tree(element, QName(xhtml_ns, "div"))
+            content = wrap_xml_tree(element, xhtml_tags.div)
+            if cls.sanitize_policy is not None:
+                content = cls.sanitize_policy.sanitize_xml(content)
         elif (type in ('text/xml', 'application/xml',
                        'text/xml-external-parsed-entity',
                        'application/xml-external-parsed-entity',
@@ -237,7 +388,7 @@ class AtomContent(AtomCommon):
             else:
                 content = element
         elif type.startswith("text/"):
-            content = flatten_xml_content(elment)
+            content = flatten_xml_content(element)
         else:
             # XXX This is probably not robust enough.
             content = base64.b64decode(element.text)
@@ -245,12 +396,16 @@ class AtomContent(AtomCommon):
                                                 src=src, content=content,
                                                 **kwargs)
 
+    def resolve(self, base=None, lang=None):
+        super(AtomContent, self).resolve(base, lang)
+        self.resolved_src = join_url(self.resolved_base, self.src)
+
     def prepare_xml(self, element):
         super(AtomContent, self).prepare_xml(element)
         if self.type:
             element.attrib["type"] = self.type
         if self.src:
-            element.attrib["src"] = src
+            element.attrib["src"] = self.src
         elif self.type is None or self.type in ("text", "html"):
             element.text = unicode(self.content)
         elif (self.type in ("xhtml", 'text/xml', 'application/xml',
@@ -258,9 +413,9 @@ class AtomContent(AtomCommon):
                             'application/xml-external-parsed-entity',
                             'application/xml-dtd')
               or self.type.endswith('+xml') or self.type.endswith('/xml')):
-            if hasattr(self.text, "create_xml"):
+            if hasattr(self.content, "create_xml"):
                 self.content.create_xml(element)
-            elif self.content.tag == QName(atom_ns, "content"):
+            elif self.content.tag == atom_tags.content:
                 element.text = self.content.text
                 element.extend(self.content)
             else:
@@ -270,6 +425,33 @@ class AtomContent(AtomCommon):
         else:
             element.text = base64.b64encode(self.content)
 
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AtomContent, self).check_xml(result, path, secure, **kwargs)
+        type = self.type or "text"
+        if self.src:
+            if type in ("text", "html", "xhtml"):
+                result.add(path + "/@type", "must be a media type with src")
+        elif type.startswith("multipart/"):
+            result.add(path + "/@type", "composite types are not allowed")
+        elif type == "xhtml":
+            if getattr(self.content, "tag", None) != xhtml_tags.div:
+                result.add(path, "xhtml content needs a single xhtml:div")
+            elif secure and is_unsafe_xml(self.content):
+                result.add(path, "potentially unsafe xhtml")
+        elif secure and type == "html" and is_unsafe_html(self.content):
+            result.add(path, "potentially unsafe html")
+
+    def get_plain_text(self, limit=None):
+        """Return textual content as normalized plain text.
+
+        This works like :meth:`AtomText.get_plain_text` for text, html,
+        xhtml, and XML content as well as text media types. For content
+        given via *src* and binary content, an empty string is returned.
+        """
+        if self.src or self.is_binary():
+            return u""
+        return get_plain_text(self.type or "text", self.content, limit)
+
     def is_binary(self):
         """Is the content binary and needs base-64 encoding?"""
         return (not self.src and self.type
@@ -281,7 +463,7 @@ class AtomContent(AtomCommon):
                 and not self.type.endswith('+xml')
                 and not self.type.endswith('/xml'))
 
-class AtomCategory(AtomCommon):
+class AtomCategory(AtomFlyweight):
     """4.2.2.  The "atom:category" Element
 
     Contains information about a category.
@@ -289,8 +471,10 @@ class AtomCategory(AtomCommon):
     The category's name is given in the attribute *term*. If the term is
     part of a specific scheme, that is given as a IRI in *scheme*. Finally,
     there may be a human-readable label in the attribute *label*.
+
+    Categories can be shared. See :class:`AtomFlyweight`.
     """
-    standard_tag = QName(atom_ns, "category")
+    standard_tag = atom_tags.category
 
     def __init__(self, term=None, scheme=None, label=None, **kwargs):
         super(AtomCategory, self).__init__(**kwargs)
@@ -300,10 +484,11 @@ class AtomCategory(AtomCommon):
 
     @classmethod
     def from_xml(cls, element, **kwargs):
+        intern = cls.interner
         return super(AtomCategory, cls).from_xml(element,
-                term=element.attrib.get("term"),
-                scheme=element.attrib.get("scheme"),
-                label=element.attrib.get("label"),
+                term=intern(element.attrib.get("term")),
+                scheme=intern(element.attrib.get("scheme")),
+                label=intern(element.attrib.get("label")),
                 **kwargs)
 
     def prepare_xml(self, element):
@@ -314,6 +499,11 @@ class AtomCategory(AtomCommon):
         if self.label:
             element.attrib["label"] = self.label
 
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AtomCategory, self).check_xml(result, path, secure, **kwargs)
+        if not self.term:
+            result.add(path + "/@term", "term is required")
+
 
 class AtomGenerator(AtomCommon):
     """4.2.4.  The "atom:generator" Element
@@ -321,7 +511,7 @@ class AtomGenerator(AtomCommon):
     Identifies the user agent that created the XML. There is an *uri* and
     a *version* attribute besides the actual name in *text*.
     """
-    standard_tag = QName(atom_ns, "generator")
+    standard_tag = atom_tags.generator
 
     def __init__(self, text=None, uri=None, version=None, **kwargs):
         super(AtomGenerator, self).__init__(**kwargs)
@@ -355,8 +545,11 @@ class AtomLink(AtomCommon):
     *hreflang* the natural language of the linked dcument, optional
     *title* the document's title, and optional *length* the length in
     octets.
+
+    After :meth:`resolve`, *resolved_href* contains the absolute IRI.
     """
-    standard_tag = QName(atom_ns, "link")
+    standard_tag = atom_tags.link
+    resolved_href = None
 
     def __init__(self, href=None, rel=None, type=None, hreflang=None,
                  title=None, length=None, **kwargs):
@@ -370,15 +563,20 @@ class AtomLink(AtomCommon):
 
     @classmethod
     def from_xml(cls, element, **kwargs):
+        intern = cls.interner
         return super(AtomLink, cls).from_xml(element,
                 href=element.attrib.get("href"),
-                rel=element.attrib.get("rel"),
-                type=element.attrib.get("type"),
-                hreflang=element.attrib.get("hreflang"),
+                rel=intern(element.attrib.get("rel")),
+                type=intern(element.attrib.get("type")),
+                hreflang=intern(element.attrib.get("hreflang")),
                 title=element.attrib.get("title"),
                 length=element.attrib.get("length"),
                 **kwargs)
 
+    def resolve(self, base=None, lang=None):
+        super(AtomLink, self).resolve(base, lang)
+        self.resolved_href = join_url(self.resolved_base, self.href)
+
     def prepare_xml(self, element):
         super(AtomLink, self).prepare_xml(element)
         element.attrib["href"] = self.href or ""
@@ -393,6 +591,13 @@ class AtomLink(AtomCommon):
         if self.length is not None:
             element.attrib["length"] = self.length
 
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AtomLink, self).check_xml(result, path, secure, **kwargs)
+        if not self.href:
+            result.add(path + "/@href", "href is required")
+        elif secure and self.href.strip().lower().startswith("javascript:"):
+            result.add(path + "/@href", "potentially unsafe href")
+
 
 class AtomMeta(AtomCommon):
     """Meta data common to atom:source, atom:entry, and atom:feed."""
@@ -405,6 +610,16 @@ class AtomMeta(AtomCommon):
         "title": AtomText.from_xml,
         "updated": AtomDate.from_xml,
     }
+    field_tags = {
+        "authors": atom_tags.author,
+        "categories": atom_tags.category,
+        "contributors": atom_tags.contributor,
+        "id": atom_tags.id,
+        "links": atom_tags.link,
+        "rights": atom_tags.rights,
+        "title": atom_tags.title,
+        "updated": atom_tags.updated,
+    }
 
     def __init__(self, authors=(), categories=(), contributors=(),
                  id=None, links=(), rights=(), title=None, updated=None,
@@ -425,45 +640,83 @@ class AtomMeta(AtomCommon):
         kwargs.setdefault("categories", [])
         kwargs.setdefault("contributors", [])
         kwargs.setdefault("links", [])
+        skipped = cls.get_skipped_tags(kwargs.get("projection"))
         for sub in element:
-            if sub.tag == QName(atom_ns, "author"):
+            if sub.tag in skipped:
+                continue
+            elif sub.tag == atom_tags.author:
                 kwargs["authors"].append(cls.inner_from_xml("author", sub))
-            elif sub.tag == QName(atom_ns, "category"):
+            elif sub.tag == atom_tags.category:
                 kwargs["categories"].append(cls.inner_from_xml("category",
                                                                sub))
-            elif sub.tag == QName(atom_ns, "contributor"):
+            elif sub.tag == atom_tags.contributor:
                 kwargs["contributors"].append(
                         cls.inner_from_xml("contributor", sub))
-            elif sub.tag == QName(atom_ns, "id"):
+            elif sub.tag == atom_tags.id:
                 kwargs["id"] = from_text_xml(sub)
-            elif sub.tag == QName(atom_ns, "link"):
+            elif sub.tag == atom_tags.link:
                 kwargs["links"].append(cls.inner_from_xml("link", sub))
-            elif sub.tag == QName(atom_ns, "rights"):
+            elif sub.tag == atom_tags.rights:
                 kwargs["rights"] = cls.inner_from_xml("rights", sub)
-            elif sub.tag == QName(atom_ns, "title"):
+            elif sub.tag == atom_tags.title:
                 kwargs["title"] = cls.inner_from_xml("title", sub)
-            elif sub.tag == QName(atom_ns, "updated"):
+            elif sub.tag == atom_tags.updated:
                 kwargs["updated"] = cls.inner_from_xml("updated", sub)
         return super(AtomMeta, cls).from_xml(element, **kwargs)
 
     def prepare_xml(self, element):
         super(AtomMeta, self).prepare_xml(element)
         for author in self.authors:
-            author.create_xml(element, QName(atom_ns, "author"))
+            author.create_xml(element, atom_tags.author)
         for category in self.categories:
-            category.create_xml(element, QName(atom_ns, "category"))
+            category.create_xml(element, atom_tags.category)
         for contributor in self.contributors:
-            contributor.create_xml(element, QName(atom_ns, "contributor"))
+            contributor.create_xml(element, atom_tags.contributor)
         if self.id is not None:
-            create_text_xml(self.id, element, QName(atom_ns, "id"))
+            create_text_xml(self.id, element, atom_tags.id)
         for link in self.links:
-            link.create_xml(element, QName(atom_ns, "link"))
+            link.create_xml(element, atom_tags.link)
         if self.rights:
-            self.rights.create_xml(element, QName(atom_ns, "rights"))
+            self.rights.create_xml(element, atom_tags.rights)
         if self.title:
-            self.title.create_xml(element, QName(atom_ns, "title"))
+            self.title.create_xml(element, atom_tags.title)
         if self.updated:
-            self.updated.create_xml(element, QName(atom_ns, "updated"))
+            self.updated.create_xml(element, atom_tags.updated)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AtomMeta, self).check_xml(result, path, secure, **kwargs)
+        for n, item in enumerate(self.authors, 1):
+            item.check_xml(result, "%s/atom:author[%d]" % (path, n), secure)
+        for n, item in enumerate(self.categories, 1):
+            item.check_xml(result, "%s/atom:category[%d]" % (path, n),
+                           secure)
+        for n, item in enumerate(self.contributors, 1):
+            item.check_xml(result, "%s/atom:contributor[%d]" % (path, n),
+                           secure)
+        alternates = set()
+        for n, item in enumerate(self.links, 1):
+            link_path = "%s/atom:link[%d]" % (path, n)
+            item.check_xml(result, link_path, secure)
+            if item.rel in (None, "alternate"):
+                key = (item.type, item.hreflang)
+                if key in alternates:
+                    result.add(link_path, "duplicate alternate link")
+                alternates.add(key)
+        if self.rights:
+            self.rights.check_xml(result, path + "/atom:rights", secure)
+        if self.title:
+            self.title.check_xml(result, path + "/atom:title", secure)
+        if self.updated:
+            self.updated.check_xml(result, path + "/atom:updated", secure)
+
+    def check_required(self, result, path):
+        """Check the elements required in atom:feed and atom:entry."""
+        if not self.id:
+            result.add(path + "/atom:id", "id is required")
+        if not self.title:
+            result.add(path + "/atom:title", "title is required")
+        if not self.updated:
+            result.add(path + "/atom:updated", "updated is required")
 
     def get_link(self, rel):
         """Return the href of the first link with *rel* or None."""
@@ -500,11 +753,17 @@ class AtomSource(AtomMeta):
 
     There is loads of attributes. See the source.
     """
-    standard_tag = QName(atom_ns, "source")
+    standard_tag = atom_tags.source
     inner_factory = {
         "generator": AtomGenerator.from_xml,
         "subtitle": AtomText.from_xml,
     }
+    field_tags = {
+        "generator": atom_tags.generator,
+        "icon": atom_tags.icon,
+        "logo": atom_tags.logo,
+        "subtitle": atom_tags.subtitle,
+    }
 
     def __init__(self, generator=None, icon=None, logo=None, subtitle=None,
                  **kwargs):
@@ -516,27 +775,35 @@ class AtomSource(AtomMeta):
 
     @classmethod
     def from_xml(cls, element, **kwargs):
+        skipped = cls.get_skipped_tags(kwargs.get("projection"))
         for sub in element:
-            if sub.tag == QName(atom_ns, "generator"):
+            if sub.tag in skipped:
+                continue
+            elif sub.tag == atom_tags.generator:
                 kwargs["generator"] = cls.inner_from_xml("generator", sub)
-            elif sub.tag == QName(atom_ns, "icon"):
+            elif sub.tag == atom_tags.icon:
                 kwargs["icon"] = from_text_xml(sub)
-            elif sub.tag == QName(atom_ns, "logo"):
+            elif sub.tag == atom_tags.logo:
                 kwargs["logo"] = from_text_xml(sub)
-            elif sub.tag == QName(atom_ns, "subtitle"):
+            elif sub.tag == atom_tags.subtitle:
                 kwargs["subtitle"] = cls.inner_from_xml("subtitle", sub)
         return super(AtomSource, cls).from_xml(element, **kwargs)
 
     def prepare_xml(self, element):
         super(AtomSource, self).prepare_xml(element)
         if self.generator:
-            self.generator.create_xml(element, QName(atom_ns, "generator"))
+            self.generator.create_xml(element, atom_tags.generator)
         if self.icon is not None:
-            create_text_xml(self.icon, element, QName(atom_ns, "icon"))
+            create_text_xml(self.icon, element, atom_tags.icon)
         if self.logo is not None:
-            create_text_xml(self.logo, element, QName(atom_ns, "logo"))
+            create_text_xml(self.logo, element, atom_tags.logo)
+        if self.subtitle:
+            self.subtitle.create_xml(element, atom_tags.subtitle)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AtomSource, self).check_xml(result, path, secure, **kwargs)
         if self.subtitle:
-            self.subtitle.create_xml(element, QName(atom_ns, "subtitle"))
+            self.subtitle.check_xml(result, path + "/atom:subtitle", secure)
 
 
 class AtomEntry(AtomMeta):
@@ -550,7 +817,13 @@ class AtomEntry(AtomMeta):
         "source": AtomSource.from_xml,
         "summary": AtomText.from_xml,
     }
-    standard_tag = QName(atom_ns, "entry")
+    field_tags = {
+        "content": atom_tags.content,
+        "published": atom_tags.published,
+        "source": atom_tags.source,
+        "summary": atom_tags.summary,
+    }
+    standard_tag = atom_tags.entry
     content_type = "application/atom+xml;type=entry"
 
     def __init__(self, content=None, published=None, source=None,
@@ -563,30 +836,69 @@ class AtomEntry(AtomMeta):
 
     @classmethod
     def from_xml(cls, element, **kwargs):
+        skipped = cls.get_skipped_tags(kwargs.get("projection"))
         for sub in element:
-            if sub.tag == QName(atom_ns, "content"):
+            if sub.tag in skipped:
+                continue
+            elif sub.tag == atom_tags.content:
                 kwargs["content"] = cls.inner_from_xml("content", sub)
-            elif sub.tag == QName(atom_ns, "publised"):
+            elif sub.tag == atom_tags.published:
                 kwargs["published"] = cls.inner_from_xml("published", sub)
-            elif sub.tag == QName(atom_ns, "source"):
+            elif sub.tag == atom_tags.source:
                 kwargs["source"] = cls.inner_from_xml("source", sub)
-            elif sub.tag == QName(atom_ns, "summary"):
+            elif sub.tag == atom_tags.summary:
                 kwargs["summary"] = cls.inner_from_xml("summary", sub)
         return super(AtomEntry, cls).from_xml(element, **kwargs)
 
     def prepare_xml(self, element):
         super(AtomEntry, self).prepare_xml(element)
         if self.content:
-            self.content.create_xml(element, QName(atom_ns, "content"))
+            self.content.create_xml(element, atom_tags.content)
+        if self.published:
+            self.published.create_xml(element, atom_tags.published)
+        if self.source:
+            self.source.create_xml(element, atom_tags.source)
+        if self.summary:
+            self.summary.create_xml(element, atom_tags.summary)
+
+    def check_xml(self, result, path, secure=True, feed_authors=False,
+                  **kwargs):
+        """Check the entry.
+
+        Set *feed_authors* to ``True`` if the entry is contained in a
+        feed that has authors.
+        """
+        super(AtomEntry, self).check_xml(result, path, secure, **kwargs)
+        self.check_required(result, path)
+        if not feed_authors and not self.get_authors():
+            result.add(path + "/atom:author", "author is required")
+        if self.content:
+            self.content.check_xml(result, path + "/atom:content", secure)
+            if ((self.content.src or self.content.is_binary())
+                    and not self.summary):
+                result.add(path + "/atom:summary", "summary is required")
+        elif self.get_link("alternate") is None and not any(
+                link.rel is None for link in self.links):
+            result.add(path + "/atom:link", "alternate link is required")
         if self.published:
-            self.published.create_xml(element, QName(atom_ns, "published"))
+            self.published.check_xml(result, path + "/atom:published",
+                                     secure)
         if self.source:
-            self.source.create_xml(element, QName(atom_ns, "source"))
+            self.source.check_xml(result, path + "/atom:source", secure)
         if self.summary:
-            self.summary.create_xml(element, QName(atom_ns, "summary"))
+            self.summary.check_xml(result, path + "/atom:summary", secure)
 
     # A bunch of helpers to make life easier
     #
+    def get_plain_texts(self, limit=None):
+        """Return the plain text of title, summary, and content.
+
+        Returns a triple of strings, each of at most *limit* characters.
+        Missing items are returned as empty strings.
+        """
+        return tuple(item.get_plain_text(limit) if item else u""
+                     for item in (self.title, self.summary, self.content))
+
     def get_authors(self):
         """Return all authors."""
         res = []
@@ -604,12 +916,16 @@ class AtomFeed(AtomSource):
     :class:`AtomEntry`. There is some extra conditions for the meta-data.
     Certain elements must be present. This is enforced by
     :meth:`prepare_xml`.
+
+    A projection given to :meth:`from_xml` applies to the feed and all its
+    entries. The entries themselves are always there.
     """
     inner_factory = {
         "entry": AtomEntry.from_xml
     }
-    standard_tag = QName(atom_ns, "feed")
+    standard_tag = atom_tags.feed
     content_type = "application/atom+xml"
+    entries_marker = "atomtools:entries"  # placeholder used by iterencode()
     
     def __init__(self, entries=(), **kwargs):
         super(AtomFeed, self).__init__(**kwargs)
@@ -618,13 +934,244 @@ class AtomFeed(AtomSource):
     @classmethod
     def from_xml(cls, element, **kwargs):
         entries = kwargs.setdefault("entries", [])
+        projection = kwargs.get("projection")
         for sub in element:
-            if sub.tag == QName(atom_ns, "entry"):
-                entries.append(cls.inner_from_xml("entry", sub))
+            if sub.tag == atom_tags.entry:
+                if projection is None:
+                    entries.append(cls.inner_from_xml("entry", sub))
+                else:
+                    entries.append(cls.inner_from_xml("entry", sub,
+                                                      projection=projection))
         return super(AtomFeed, cls).from_xml(element, **kwargs)
 
+    def add_entry(self, entry):
+        """Add *entry* to the end of the feed.
+
+        Use this instead of changing *entries* directly, so that the
+        content hash and version of the feed are updated, too.
+        """
+        self.entries.append(entry)
+        self.clear_content_hash()
+
+    def get_version(self):
+        """Return a string that changes whenever the feed changes.
+
+        Unlike :meth:`get_content_hash`, the version is derived from the
+        atom:id and atom:updated of the feed and its entries only, so it
+        is cheap to calculate. It is kept until :meth:`add_entry` or
+        :meth:`clear_content_hash` is called.
+        """
+        try:
+            return self.__dict__["_version"]
+        except KeyError:
+            pass
+        digest = sha1()
+        for item in [self] + self.entries:
+            if item.id is not None:
+                digest.update(unicode(item.id).encode("utf-8"))
+            digest.update("\0")
+            if item.updated is not None and item.updated.datetime:
+                digest.update(item.updated.datetime.isoformat())
+            digest.update("\0")
+        result = self.__dict__["_version"] = digest.hexdigest()
+        return result
+
+    def clear_content_hash(self):
+        super(AtomFeed, self).clear_content_hash()
+        self.__dict__.pop("_version", None)
+
+    def diff(self, other):
+        """Compare the entries of this feed with those of newer *other*.
+
+        Returns a triple of lists of entries: those that have been added
+        in *other*, those that have been removed, and those that have
+        changed as determined by :meth:`get_content_hash`. Removed entries
+        are taken from this feed, all others from *other*.
+
+        Entries are matched by their atom:id. Entries without one are
+        ignored, as are all but the first of several entries with the
+        same atom:id.
+        """
+        old = {}
+        for entry in self.entries:
+            if entry.id is not None:
+                old.setdefault(entry.id, entry)
+        added = []
+        changed = []
+        seen = set()
+        for entry in other.entries:
+            if entry.id is None or entry.id in seen:
+                continue
+            seen.add(entry.id)
+            previous = old.get(entry.id)
+            if previous is None:
+                added.append(entry)
+            elif previous.get_content_hash() != entry.get_content_hash():
+                changed.append(entry)
+        removed = [entry for id, entry in old.iteritems() if id not in seen]
+        return added, removed, changed
+
+    def iter_plain_texts(self, limit=None):
+        """Iterate over the plain text of all entries.
+
+        Yields a quadruple of the entry and the result of its
+        :meth:`AtomEntry.get_plain_texts` for each entry.
+        """
+        for entry in self.entries:
+            yield (entry,) + entry.get_plain_texts(limit)
+
+    @classmethod
+    def iterparse_from_xml(cls, source, parser=None, validate=False,
+                           secure=True, rejected=None, projection=None,
+                           compression=None, accept=None):
+        """Iterate over the entries of the feed document in *source*.
+
+        Each entry is produced as soon as it has been parsed, so this
+        works with feeds of any size. The meta data of the feed itself is
+        not available.
+
+        If *validate* is ``True``, each entry is validated right after
+        it has been created and only valid entries are produced. For each
+        invalid entry, *rejected*, if given, is called with the entry and
+        the :class:`.atomtools.xml.ValidationResult`. Entries without an
+        atom:author are only valid if the feed has one before them, as an
+        atom:author following the entries hasn't been parsed yet.
+
+        If *projection* is given, only the attributes named in it are
+        filled. See :meth:`XMLObject.from_xml`. Don't combine this with
+        *validate* unless the projection contains all required attributes.
+
+        If *compression* is given, *source* is decompressed on the fly.
+        See :class:`.atomtools.xml.DecompressingReader` for the possible
+        values.
+
+        If *accept* is given, it is called with the element of each entry
+        before the entry is created. Entries for which it returns a false
+        value are skipped without being created.
+        """
+        kwargs = {}
+        if projection is not None:
+            kwargs["projection"] = frozenset(projection)
+        path = "/%s/atom:entry" % xpath_name(cls.standard_tag)
+        context = None
+        count = 0
+        feed_authors = False
+        for root, sub in iterparse_children(source, cls.standard_tag,
+                                            parser, compression):
+            if sub.tag != atom_tags.entry:
+                if sub.tag == atom_tags.author:
+                    feed_authors = True
+                continue
+            count += 1
+            if accept is not None and not accept(sub):
+                continue
+            entry = cls.inner_from_xml("entry", sub, **kwargs)
+            if context is None:
+                context = (root.attrib.get(xml_tags.base),
+                           root.attrib.get(xml_tags.lang))
+            entry.resolve(*context)
+            if validate:
+                result = ValidationResult()
+                entry.check_xml(result, "%s[%d]" % (path, count), secure,
+                                feed_authors=feed_authors)
+                if result:
+                    if rejected is not None:
+                        rejected(entry, result)
+                    continue
+            yield entry
+
     def prepare_xml(self, element):
         super(AtomFeed, self).prepare_xml(element)
         for entry in self.entries:
             entry.create_xml(element)
 
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AtomFeed, self).check_xml(result, path, secure, **kwargs)
+        self.check_required(result, path)
+        feed_authors = bool(self.authors)
+        for n, entry in enumerate(self.entries, 1):
+            entry.check_xml(result, "%s/atom:entry[%d]" % (path, n), secure,
+                            feed_authors=feed_authors)
+
+    def set_page(self, entries, page=1, page_size=20, uri=None):
+        """Turn the feed into page *page* of a larger feed.
+
+        The iterable *entries* has to produce the entries of the larger
+        feed by descending atom:updated, starting with the first entry of
+        the page. Only as many as needed are taken from it: *page_size*
+        entries for the page plus one more to learn whether there is a
+        next page.
+
+        The atom:updated of the feed is set to that of the newest entry on
+        the page. If *uri* is given, it is used for the "first" link and,
+        with a "page" query parameter, for the "previous" and "next" links.
+
+        Returns whether there is a next page.
+        """
+        entries = iter(entries)
+        self.entries = list(islice(entries, page_size))
+        self.clear_content_hash()
+        more = next(entries, None) is not None
+        for entry in self.entries:
+            if entry.updated is not None and entry.updated.datetime:
+                self.updated = AtomDate(datetime=entry.updated.datetime)
+                break
+        if uri is not None:
+            page_uri = uri + ("&" if "?" in uri else "?") + "page=%d"
+            self.replace_link("first", uri)
+            if page > 1:
+                self.replace_link("previous", page_uri % (page - 1))
+            else:
+                self.remove_links("previous")
+            if more:
+                self.replace_link("next", page_uri % (page + 1))
+            else:
+                self.remove_links("next")
+        return more
+
+    def iterencode_page(self, entries, page=1, page_size=20, uri=None):
+        """Encode a page of a larger feed piece by piece.
+
+        This is :meth:`set_page` followed by :meth:`iterencode`. The
+        *entries* are only taken once encoding starts.
+        """
+        self.set_page(entries, page, page_size, uri)
+        for data in self.iterencode():
+            yield data
+
+    def iterencode(self):
+        """Encode the feed piece by piece.
+
+        Only the meta data of the feed is turned into an element tree as
+        a whole. Each entry is encoded separately when it is its turn, so
+        the tree for the entire feed never exists. The output may contain
+        namespace declarations on the entries that :meth:`encode` would
+        only have on the root element.
+        """
+        header = copy(self)
+        header.entries = []
+        element = header.create_root_xml()
+        element.append(Comment(self.entries_marker))
+        head, tail = serialize_xml(element, True).rsplit(
+                                    "<!--%s-->" % self.entries_marker, 1)
+        yield head
+        for entry in self.entries:
+            yield serialize_xml(entry.create_root_xml())
+        yield tail
+
+
+def get_plain_text(type, text, limit=None):
+    """Return normalized plain text for *text* of *type*.
+
+    The *type* is the value of a type attribute of text constructs or
+    atom:content.
+    """
+    if text is None:
+        return u""
+    if type == "html":
+        return extract_html_text(text, limit)
+    if hasattr(text, "tag"):
+        return extract_xml_text(text, limit)
+    collector = TextCollector(limit)
+    collector.add(text)
+    return collector.get_text()
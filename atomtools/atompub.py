@@ -4,13 +4,15 @@ The document you are looking for is RFC 5023.
 """
 
 from __future__ import absolute_import
-from xml.etree.ElementTree import QName
 
-from atomtools.atom import (atom_ns, AtomCommon, AtomCategory, AtomText,
+from atomtools.atom import (atom_tags, AtomCommon, AtomCategory, AtomText,
                             AtomSource, AtomEntry, AtomFeed)
-from atomtools.xml import define_namespace, XMLObject
+from atomtools.exceptions import IncompleteObjectError
+from atomtools.xml import define_namespace, define_tags, XMLObject
 
 app_ns = define_namespace("app", "http://www.w3.org/2007/app")
+app_tags = define_tags(app_ns, "accept", "categories", "collection",
+                       "control", "draft", "edited", "service", "workspace")
 
 
 class AppCategories(AtomCommon):
@@ -20,7 +22,7 @@ class AppCategories(AtomCommon):
     inner_factory = {
         "category": AtomCategory.from_xml,
     }
-    standard_tag = QName(app_ns, "categories")
+    standard_tag = app_tags.categories
     content_type = "application/atomcat+xml"
 
     def __init__(self, fixed=False, scheme=None, href=None, categories=(),
@@ -38,14 +40,15 @@ class AppCategories(AtomCommon):
             kwargs["fixed"] = False
             kwargs["scheme"] = None
             kwargs["categories"] = ()
+            kwargs["href"] = href
         else:
             kwargs["fixed"] = element.attrib.get("fixed", "").lower() == "yes"
             kwargs["scheme"] = element.attrib.get("scheme")
-            kwargs.setdefault(category, [])
+            kwargs.setdefault("categories", [])
             for sub in element:
-                if sub.tag == QName(atom_ns, "category"):
-                    kwargs["category"].append(cls.inner_from_xml("category",
-                                                                 sub))
+                if sub.tag == atom_tags.category:
+                    kwargs["categories"].append(
+                            cls.inner_from_xml("category", sub))
         return super(AppCategories, cls).from_xml(element, **kwargs)
 
     def prepare_xml(self, element):
@@ -55,17 +58,25 @@ class AppCategories(AtomCommon):
         else:
             if self.fixed:
                 element.attrib["fixed"] = "yes"
-            if self.schema is not None:
-                element.attrib["schema"] = self.schema
+            if self.scheme is not None:
+                element.attrib["scheme"] = self.scheme
             for item in self.categories:
-                item.create_xml(element, QName(atom_ns, "category"))
+                item.create_xml(element, atom_tags.category)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AppCategories, self).check_xml(result, path, secure, **kwargs)
+        if self.href is not None and self.categories:
+            result.add(path + "/@href", "href doesn't allow categories")
+        for n, item in enumerate(self.categories, 1):
+            item.check_xml(result, "%s/atom:category[%d]" % (path, n),
+                           secure)
 
 
 class AppAccept(AtomCommon):
     """8.3.4  The "app:accept" Element
 
     """
-    standard_tag = QName(app_ns, "accept")
+    standard_tag = app_tags.accept
 
     def __init__(self, media_range=None, **kwargs):
         super(AppAccept, self).__init__(**kwargs)
@@ -91,7 +102,7 @@ class AppCollection(AtomCommon):
         "accept": AppAccept.from_xml,
         "categories": AppCategories.from_xml,
     }
-    standard_tag = QName(app_ns, "collection")
+    standard_tag = app_tags.collection
 
     def __init__(self, href=None, title=None, accept=(), categories=(),
                  **kwargs):
@@ -103,14 +114,15 @@ class AppCollection(AtomCommon):
 
     @classmethod
     def from_xml(cls, element, **kwargs):
+        kwargs["href"] = element.attrib.get("href")
         accept = kwargs.setdefault("accept", [])
         categories = kwargs.setdefault("categories", [])
         for sub in element:
-            if sub.tag == QName(atom_ns, "title"):
+            if sub.tag == atom_tags.title:
                 kwargs["title"] = cls.inner_from_xml("title", sub)
-            elif sub.tag == QName(app_ns, "accept"):
+            elif sub.tag == app_tags.accept:
                 accept.append(cls.inner_from_xml("accept", sub))
-            elif sub.tag == QName(app_ns, "categories"):
+            elif sub.tag == app_tags.categories:
                 categories.append(cls.inner_from_xml("categories", sub))
         return super(AppCollection, cls).from_xml(element, **kwargs)
 
@@ -121,11 +133,23 @@ class AppCollection(AtomCommon):
             raise IncompleteObjectError, "title is required"
         super(AppCollection, self).prepare_xml(element)
         element.attrib["href"] = self.href
-        self.title.create_xml(element, QName(atom_ns, "title"))
+        self.title.create_xml(element, atom_tags.title)
         for item in self.accept:
-            item.create_xml(element, QName(app_ns, "accept"))
+            item.create_xml(element, app_tags.accept)
         for item in self.categories:
-            item.create_xml(element, QName(app_ns, "categories"))
+            item.create_xml(element, app_tags.categories)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AppCollection, self).check_xml(result, path, secure, **kwargs)
+        if not self.href:
+            result.add(path + "/@href", "href is required")
+        if not self.title:
+            result.add(path + "/atom:title", "title is required")
+        else:
+            self.title.check_xml(result, path + "/atom:title", secure)
+        for n, item in enumerate(self.categories, 1):
+            item.check_xml(result, "%s/app:categories[%d]" % (path, n),
+                           secure)
 
 
 class AppWorkspace(AtomCommon):
@@ -136,7 +160,7 @@ class AppWorkspace(AtomCommon):
         "title": AtomText.from_xml,
         "collection": AppCollection.from_xml
     }
-    standard_tag = QName(app_ns, "workspace")
+    standard_tag = app_tags.workspace
 
     def __init__(self, title=None, collections=(), **kwargs):
         super(AppWorkspace, self).__init__(**kwargs)
@@ -147,9 +171,9 @@ class AppWorkspace(AtomCommon):
     def from_xml(cls, element, **kwargs):
         collections = kwargs.setdefault("collections", [])
         for sub in element:
-            if sub.tag == QName(atom_ns, "title"):
+            if sub.tag == atom_tags.title:
                 kwargs["title"] = cls.inner_from_xml("title", sub)
-            elif sub.tag == QName(app_ns, "collection"):
+            elif sub.tag == app_tags.collection:
                 collections.append(cls.inner_from_xml("collection", sub))
         return super(AppWorkspace, cls).from_xml(element, **kwargs)
 
@@ -157,9 +181,19 @@ class AppWorkspace(AtomCommon):
         if not self.title:
             raise IncompleteObjectError, "title is required"
         super(AppWorkspace, self).prepare_xml(element)
-        self.title.create_xml(element, QName(atom_ns, "title"))
+        self.title.create_xml(element, atom_tags.title)
         for item in self.collections:
-            item.create_xml(element, QName(app_ns, "collection"))
+            item.create_xml(element, app_tags.collection)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AppWorkspace, self).check_xml(result, path, secure, **kwargs)
+        if not self.title:
+            result.add(path + "/atom:title", "title is required")
+        else:
+            self.title.check_xml(result, path + "/atom:title", secure)
+        for n, item in enumerate(self.collections, 1):
+            item.check_xml(result, "%s/app:collection[%d]" % (path, n),
+                           secure)
 
 
 class AppService(AtomCommon):
@@ -169,7 +203,7 @@ class AppService(AtomCommon):
     inner_factory = {
         "workspace": AppWorkspace.from_xml,
     }
-    standard_tag = QName(app_ns, "service")
+    standard_tag = app_tags.service
     content_type = "application/atomsvc+xml"
 
     def __init__(self, workspaces=(), **kwargs):
@@ -180,21 +214,29 @@ class AppService(AtomCommon):
     def from_xml(cls, element, **kwargs):
         workspaces = kwargs.setdefault("workspaces", [])
         for sub in element:
-            if sub.tag == QName(app_ns, "workspace"):
+            if sub.tag == app_tags.workspace:
                 workspaces.append(cls.inner_from_xml("workspace", sub))
         return super(AppService, cls).from_xml(element, **kwargs)
 
-    def create_xml(self, parent, tag=QName(app_ns, "service")):
+    def create_xml(self, parent, tag=app_tags.service):
         return super(AppService, self).create_xml(parent, tag)
 
-    def create_root_xml(self, tag=QName(app_ns, "service"),
+    def create_root_xml(self, tag=app_tags.service,
                         element_class=None):
         return super(AppService, self).create_root_xml(tag, element_class)
 
     def prepare_xml(self, element):
         super(AppService, self).prepare_xml(element)
         for item in self.workspaces:
-            item.create_xml(element, QName(app_ns, "workspace"))
+            item.create_xml(element, app_tags.workspace)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AppService, self).check_xml(result, path, secure, **kwargs)
+        if not self.workspaces:
+            result.add(path + "/app:workspace", "workspace is required")
+        for n, item in enumerate(self.workspaces, 1):
+            item.check_xml(result, "%s/app:workspace[%d]" % (path, n),
+                           secure)
 
 
 # 8.3.5.  Usage in Atom Feed Documents
@@ -210,16 +252,22 @@ class AppSource(AtomSource):
 
     @classmethod
     def from_xml(cls, element, **kwargs):
-        collection = element.find(QName(app_ns, "collection"))
-        if collection:
+        collection = element.find(app_tags.collection)
+        if collection is not None:
             collection = cls.inner_from_xml("collection", collection)
         return super(AppSource, cls).from_xml(element, collection=collection,
                                               **kwargs)
 
     def prepare_xml(self, element):
-        super(AppSource, element).prepare_xml(self, element)
+        super(AppSource, self).prepare_xml(element)
+        if self.collection:
+            self.collection.create_xml(element, app_tags.collection)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AppSource, self).check_xml(result, path, secure, **kwargs)
         if self.collection:
-            self.collection.prepare_xml(element, QName(app_ns, "collection"))
+            self.collection.check_xml(result, path + "/app:collection",
+                                      secure)
 
 
 class AppEntry(AtomEntry):
@@ -233,6 +281,9 @@ class AppFeed(AtomFeed):
         "entry": AppEntry.from_xml,
         "collection": AppCollection.from_xml,
     }
+    field_tags = {
+        "collection": app_tags.collection,
+    }
 
     def __init__(self, collection=None, **kwargs):
         super(AppFeed, self).__init__(**kwargs)
@@ -240,13 +291,22 @@ class AppFeed(AtomFeed):
 
     @classmethod
     def from_xml(cls, element, **kwargs):
+        skipped = cls.get_skipped_tags(kwargs.get("projection"))
         for sub in element:
-            if sub.tag == QName(app_ns, "collection"):
+            if sub.tag in skipped:
+                continue
+            elif sub.tag == app_tags.collection:
                 kwargs["collection"] = cls.inner_from_xml("collection", sub)
         return super(AppFeed, cls).from_xml(element, **kwargs)
 
     def prepare_xml(self, element):
         super(AppFeed, self).prepare_xml(element)
         if self.collection:
-            self.collection.create_xml(element, QName(app_ns, "collection"))
+            self.collection.create_xml(element, app_tags.collection)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(AppFeed, self).check_xml(result, path, secure, **kwargs)
+        if self.collection:
+            self.collection.check_xml(result, path + "/app:collection",
+                                      secure)
 
@@ -0,0 +1,217 @@
+"""Parsing a single large feed on several processors.
+
+Parsing a feed document is bound to a single processor no matter how
+big the document is. :func:`parse_feed_parallel` spreads the work for a
+feed in a file over several processes instead:
+
+1. The file is scanned once for the byte ranges of the children of the
+   root element. This is done by expat without building any elements.
+
+2. The entries are split into chunks of roughly equal size. Each chunk
+   is turned into a document of its own by putting the original prolog
+   and the original start tag of the root element around it. This way,
+   namespace declarations, xml:base, xml:lang, and entity declarations
+   work exactly as in the original document. Worker processes parse
+   these documents and send the resulting entries back pickled.
+
+3. The meta data of the feed is parsed in the calling process from a
+   document that contains all the children of the root that aren't
+   entries.
+
+The entries end up in document order and are the same as those
+produced by :meth:`AtomFeed.parse_from_xml` for the same file.
+"""
+
+from __future__ import absolute_import
+import mmap
+from multiprocessing import Pool
+import xml.parsers.expat
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from atomtools.atom import atom_tags, AtomFeed
+from atomtools.xml import ParseError, start_tag_re, XMLParser
+
+
+class FeedLayout(object):
+    """The byte ranges of the parts of a feed document.
+
+    The *prolog* is everything before the root element, *root_start* the
+    start tag of the root element and *root_end* a matching end tag. The
+    lists *entries* and *others* contain pairs of start and end offsets
+    of the entries and all other children of the root element.
+    """
+    def __init__(self, prolog, root_start, root_end, entries, others):
+        self.prolog = prolog
+        self.root_start = root_start
+        self.root_end = root_end
+        self.entries = entries
+        self.others = others
+
+    def wrap(self, chunks):
+        """Return a complete document for the list of byte strings."""
+        return "".join([self.prolog, self.root_start]
+                       + chunks + [self.root_end])
+
+
+def scan_feed(filename, tag=AtomFeed.standard_tag,
+              entry_tag=atom_tags.entry):
+    """Scan the feed in *filename* and return its :class:`FeedLayout`.
+
+    Raises :exc:`ParseError` if the file isn't well-formed or the root
+    element doesn't have *tag*.
+    """
+    with open(filename, "rb") as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return _scan(file, data, tag, entry_tag)
+        finally:
+            data.close()
+
+
+def _scan(file, data, tag, entry_tag):
+    parser = xml.parsers.expat.ParserCreate(namespace_separator="}")
+    entries = []
+    others = []
+    state = {"depth": 0}
+    root = []
+
+    def handle_start(name, attrs):
+        depth = state["depth"]
+        state["depth"] = depth + 1
+        if depth > 1:
+            return
+        index = parser.CurrentByteIndex
+        match = start_tag_re.match(data, index)
+        if match is None:
+            raise ParseError("cannot find start tag at offset %d" % index)
+        if depth == 0:
+            if "{" + name != tag:
+                raise ParseError("expected '%s' element, got '%s'"
+                                 % (tag, "{" + name))
+            root.extend((index, match.end(), match.group(1)))
+        else:
+            state["start"] = index
+            state["empty"] = match.group(2) == "/"
+            state["empty_end"] = match.end()
+            state["entry"] = "{" + name == entry_tag
+
+    def handle_end(name):
+        depth = state["depth"] = state["depth"] - 1
+        if depth != 1:
+            return
+        if state["empty"]:
+            end = state["empty_end"]
+        else:
+            end = data.find(">", parser.CurrentByteIndex) + 1
+        if state["entry"]:
+            entries.append((state["start"], end))
+        else:
+            others.append((state["start"], end))
+
+    parser.StartElementHandler = handle_start
+    parser.EndElementHandler = handle_end
+    try:
+        parser.ParseFile(file)
+    except xml.parsers.expat.ExpatError, err:
+        raise ParseError(str(err))
+    start, end, name = root
+    return FeedLayout(data[:start], data[start:end], "</%s>" % name,
+                      entries, others)
+
+
+def split_entries(entries, chunk_size):
+    """Split the byte ranges *entries* into lists of *chunk_size* bytes.
+    """
+    chunks = []
+    chunk = []
+    size = 0
+    for start, end in entries:
+        chunk.append((start, end))
+        size += end - start
+        if size >= chunk_size:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def parse_entries(args):
+    """Parse a chunk of entries and return them as a list.
+
+    The argument *args* is a tuple of the feed class, the file name, the
+    :class:`FeedLayout`, a list of byte ranges, and the keyword arguments
+    for the entries' from_xml.
+    """
+    cls, filename, layout, ranges, kwargs = args
+    with open(filename, "rb") as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            document = layout.wrap([data[start:end] for start, end in ranges])
+        finally:
+            data.close()
+    parser = XMLParser()
+    parser.feed(document)
+    root = parser.close()
+    return [cls.inner_from_xml("entry", sub, **kwargs) for sub in root]
+
+
+def parse_pickled_entries(args):
+    """Parse a chunk of entries and return the pickled list.
+
+    This is what runs in the worker processes. See :func:`parse_entries`
+    for *args*.
+    """
+    return pickle.dumps(parse_entries(args), 2)
+
+
+def parse_feed_parallel(filename, cls=AtomFeed, processes=None,
+                        chunk_size=4 << 20, projection=None):
+    """Parse the feed in *filename* using several processes.
+
+    The feed is parsed as an instance of *cls*. Entries are handed out to
+    *processes* worker processes in chunks of about *chunk_size* bytes.
+    If *processes* is ``None``, the number of processors is used. If
+    *projection* is given, only the attributes named in it are filled.
+    See :meth:`XMLObject.from_xml`.
+
+    The entries are sent back from the workers pickled, so *cls* and all
+    classes used for its inner objects must be importable in the worker
+    processes.
+    """
+    layout = scan_feed(filename, cls.standard_tag)
+    kwargs = {}
+    if projection is not None:
+        kwargs["projection"] = frozenset(projection)
+    chunks = split_entries(layout.entries, chunk_size)
+    jobs = [(cls, filename, layout, ranges, kwargs) for ranges in chunks]
+    entries = []
+    if len(jobs) > 1 and processes != 1:
+        pool = Pool(processes)
+        try:
+            for data in pool.imap(parse_pickled_entries, jobs):
+                entries.extend(pickle.loads(data))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for job in jobs:
+            entries.extend(parse_entries(job))
+    with open(filename, "rb") as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            document = layout.wrap([data[start:end]
+                                    for start, end in layout.others])
+        finally:
+            data.close()
+    parser = XMLParser()
+    parser.feed(document)
+    feed = cls.from_xml(parser.close(), **kwargs)
+    feed.entries = entries
+    feed.resolve()
+    return feed
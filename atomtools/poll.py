@@ -0,0 +1,308 @@
+"""Scheduling when to poll feeds.
+
+Polling every feed at the same fixed interval wastes requests on feeds
+that rarely change and misses updates of busy ones. The
+:class:`PollScheduler` instead estimates how often each feed gets new
+entries and polls it about once per expected update.
+
+The estimate is a rate of new entries per second, smoothed over polls by
+an exponentially weighted moving average. The first time a feed is seen,
+the rate is taken from the spread of the atom:updated (or, lacking that,
+atom:published) dates of its entries. Afterwards, every poll contributes
+the number of entries newer than any seen before divided by the time
+since the last poll. Polls that find nothing new, including responses
+with status 304, contribute a rate of zero and thus make the intervals
+grow. Failed polls back off exponentially. All intervals are kept
+between *min_interval* and *max_interval* and get some random jitter so
+that feeds added together don't stay in lockstep.
+
+The feeds are kept in a heap ordered by their next poll time, so picking
+the feeds that are due is cheap even for millions of them. Time is taken
+from *clock* which defaults to :func:`time.time`. Pass a
+:class:`SimulatedClock` to test schedules without waiting::
+
+    clock = SimulatedClock()
+    scheduler = PollScheduler(clock=clock)
+    scheduler.add("http://example.com/feed")
+    for url in scheduler.get_due():
+        headers = scheduler.get_request_headers(url)
+        ...
+        scheduler.record_feed(url, feed, etag, last_modified)
+    clock.advance(scheduler.get_next_time() - clock())
+"""
+
+from __future__ import absolute_import
+import heapq
+from math import ceil, log
+import random
+import time
+
+from atomtools.utils import timestamp_from_date
+
+
+class SimulatedClock(object):
+    """A clock that only moves when told to.
+
+    Calling it returns the current time in seconds since the epoch, just
+    like :func:`time.time`.
+    """
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        """Move the clock *seconds* forward."""
+        self.now += max(seconds, 0)
+
+
+class FeedState(object):
+    """What the scheduler knows about a single feed.
+
+    The *rate* is the estimated number of new entries per second or
+    ``None`` before the first successful poll. The *newest* is the time
+    of the newest entry seen so far in seconds since the epoch. The
+    *etag* and *last_modified* are the validators of the last response.
+    """
+    __slots__ = ("url", "due", "interval", "rate", "newest", "last_poll",
+                 "etag", "last_modified", "failures")
+
+    def __init__(self, url, interval):
+        self.url = url
+        self.due = None
+        self.interval = interval
+        self.rate = None
+        self.newest = None
+        self.last_poll = None
+        self.etag = None
+        self.last_modified = None
+        self.failures = 0
+
+
+def get_entry_times(feed):
+    """Return the times of the entries of *feed* in seconds since the epoch.
+
+    Each entry's atom:updated is used or, if it doesn't have one, its
+    atom:published. Entries with neither are left out.
+    """
+    result = []
+    for entry in feed.entries:
+        date = entry.updated
+        if date is None or date.datetime is None:
+            date = getattr(entry, "published", None)
+        timestamp = timestamp_from_date(date)
+        if timestamp is not None:
+            result.append(timestamp / 1e6)
+    return result
+
+
+class PollScheduler(object):
+    """Decides when to poll which feed.
+
+    New feeds are polled right away and then every *initial_interval*
+    seconds until a poll succeeds. The rate estimate is smoothed with
+    *smoothing*, the weight of the newest observation. The interval is
+    one expected update, clamped to *min_interval* and *max_interval*.
+    After failures, it is multiplied by *backoff* for each failure in a
+    row. Each interval is randomly lengthened or shortened by up to the
+    fraction *jitter*.
+
+    The *clock* is a function returning the current time in seconds and
+    *random* a function returning a random float in [0, 1).
+    """
+    min_interval = 5 * 60
+    max_interval = 24 * 60 * 60
+    initial_interval = 60 * 60
+    smoothing = 0.3
+    backoff = 2.0
+    jitter = 0.1
+
+    def __init__(self, min_interval=None, max_interval=None,
+                 initial_interval=None, smoothing=None, backoff=None,
+                 jitter=None, clock=time.time, random=random.random):
+        if min_interval is not None:
+            self.min_interval = min_interval
+        if max_interval is not None:
+            self.max_interval = max_interval
+        if initial_interval is not None:
+            self.initial_interval = initial_interval
+        if smoothing is not None:
+            self.smoothing = smoothing
+        if backoff is not None:
+            self.backoff = backoff
+        if jitter is not None:
+            self.jitter = jitter
+        self.clock = clock
+        self.random = random
+        self.feeds = {}
+        self.heap = []
+
+    def __len__(self):
+        return len(self.feeds)
+
+    def __contains__(self, url):
+        return url in self.feeds
+
+    def get_state(self, url):
+        """Return the :class:`FeedState` of *url*."""
+        return self.feeds[url]
+
+    def add(self, url, due=None):
+        """Start scheduling the feed *url*.
+
+        It will first be due at *due* or right away. Adding a feed that
+        is already scheduled only moves its next poll to *due* if given.
+        """
+        state = self.feeds.get(url)
+        if state is None:
+            state = self.feeds[url] = FeedState(url, self.initial_interval)
+        elif due is None:
+            return
+        self.schedule(state, self.clock() if due is None else due)
+
+    def remove(self, url):
+        """Stop scheduling the feed *url*."""
+        del self.feeds[url]
+        if len(self.heap) > 2 * len(self.feeds) + 64:
+            self.rebuild_heap()
+
+    def get_next_time(self):
+        """Return when the next feed is due or ``None`` without feeds."""
+        heap = self.heap
+        while heap:
+            due, url = heap[0]
+            state = self.feeds.get(url)
+            if state is not None and state.due == due:
+                return due
+            heapq.heappop(heap)
+        return None
+
+    def get_due(self, limit=None):
+        """Return a list of the URLs of the feeds due for polling.
+
+        At most *limit* URLs are returned, most overdue first. Report the
+        result of each poll through :meth:`record_feed`,
+        :meth:`record_not_modified`, or :meth:`record_failure`. Until you
+        do, the feed is considered to be still in progress and will only
+        be handed out again after its current interval.
+        """
+        now = self.clock()
+        heap = self.heap
+        result = []
+        while heap and heap[0][0] <= now:
+            if limit is not None and len(result) >= limit:
+                break
+            due, url = heapq.heappop(heap)
+            state = self.feeds.get(url)
+            if state is None or state.due != due:
+                continue
+            result.append(url)
+            self.schedule(state, now + state.interval)
+        return result
+
+    def get_request_headers(self, url):
+        """Return a dict with the headers for a conditional GET of *url*.
+        """
+        state = self.feeds[url]
+        headers = {}
+        if state.etag is not None:
+            headers["If-None-Match"] = state.etag
+        if state.last_modified is not None:
+            headers["If-Modified-Since"] = state.last_modified
+        return headers
+
+    def record_feed(self, url, feed, etag=None, last_modified=None):
+        """Record a successful poll of *url* that returned *feed*.
+
+        The *etag* and *last_modified* are the values of the ETag and
+        Last-Modified headers of the response, if any.
+        """
+        state = self.feeds[url]
+        now = self.clock()
+        times = get_entry_times(feed)
+        if state.newest is None:
+            if len(times) > 1:
+                span = max(times) - min(times)
+                rate = (len(times) - 1) / span if span > 0 else None
+            else:
+                rate = None
+            if rate is not None:
+                state.rate = rate
+        else:
+            count = sum(1 for item in times if item > state.newest)
+            self.update_rate(state, now, count)
+        if times:
+            newest = max(times)
+            if state.newest is None or newest > state.newest:
+                state.newest = newest
+        state.etag = etag
+        state.last_modified = last_modified
+        self.succeeded(state, now)
+
+    def record_not_modified(self, url):
+        """Record a poll of *url* that resulted in a 304 response."""
+        state = self.feeds[url]
+        now = self.clock()
+        self.update_rate(state, now, 0)
+        self.succeeded(state, now)
+
+    def record_failure(self, url, retry_after=None):
+        """Record a failed poll of *url*.
+
+        If the server asked to retry after *retry_after* seconds, the next
+        poll won't happen before that.
+        """
+        state = self.feeds[url]
+        now = self.clock()
+        state.failures += 1
+        interval = self.get_interval(state)
+        failures = state.failures
+        if self.backoff > 1 and interval > 0:
+            # Beyond this many failures, the interval is at the maximum
+            # anyway. Capping keeps the power from overflowing.
+            steps = log(self.max_interval / float(interval), self.backoff)
+            failures = min(failures, max(int(ceil(steps)), 0))
+        interval = min(interval * self.backoff ** failures, self.max_interval)
+        if retry_after is not None:
+            interval = max(interval, retry_after)
+        self.schedule(state, now + self.add_jitter(interval))
+
+    def update_rate(self, state, now, count):
+        if state.last_poll is None or now <= state.last_poll:
+            return
+        sample = count / float(now - state.last_poll)
+        if state.rate is None:
+            state.rate = sample
+        else:
+            state.rate += self.smoothing * (sample - state.rate)
+
+    def succeeded(self, state, now):
+        state.last_poll = now
+        state.failures = 0
+        state.interval = self.get_interval(state)
+        self.schedule(state, now + self.add_jitter(state.interval))
+
+    def get_interval(self, state):
+        """Return the interval for *state* without backoff and jitter."""
+        if state.rate is None:
+            return state.interval
+        if state.rate <= 0:
+            return self.max_interval
+        return min(max(1.0 / state.rate, self.min_interval),
+                   self.max_interval)
+
+    def add_jitter(self, interval):
+        return interval * (1 + self.jitter * (2 * self.random() - 1))
+
+    def schedule(self, state, due):
+        state.due = due
+        heapq.heappush(self.heap, (due, state.url))
+        if len(self.heap) > 2 * len(self.feeds) + 64:
+            self.rebuild_heap()
+
+    def rebuild_heap(self):
+        """Drop stale items from the heap."""
+        self.heap = [(state.due, url) for url, state in self.feeds.iteritems()
+                     if state.due is not None]
+        heapq.heapify(self.heap)
@@ -0,0 +1,273 @@
+"""Sanitizing HTML and XHTML content.
+
+:class:`AtomText` and :class:`AtomContent` keep whatever markup they find.
+The :class:`SanitizePolicy` here cleans up such markup according to an
+allowlist of elements and attributes. It works directly on the element
+trees of xhtml content and on the text of html content.
+
+To have text and content sanitized right when it is parsed, set the
+*sanitize_policy* attribute of :class:`AtomText` and :class:`AtomContent`
+or, better, of classes derived from them that you wire into your entry
+classes via their *inner_factory*::
+
+    class SafeText(AtomText):
+        sanitize_policy = default_policy
+
+    class SafeEntry(AtomEntry):
+        inner_factory = {
+            "title": SafeText.from_xml,
+            "summary": SafeText.from_xml,
+        }
+
+Results are cached by a hash of the input, so the same markup appearing
+in many entries or in repeated fetches of a feed is only sanitized once.
+Cached element trees are shared between all the objects they are used
+for, so you must not modify them.
+"""
+
+from __future__ import absolute_import
+from cgi import escape
+from collections import OrderedDict
+from hashlib import sha1
+from HTMLParser import HTMLParser, HTMLParseError
+from threading import Lock
+
+from atomtools.xhtml import xhtml_ns
+from atomtools.xml import xml_tags
+
+
+def get_tree_key(element):
+    """Return a digest of the tags, attributes and text of *element*.
+
+    This is cheaper than hashing the serialized tree. The tail of the
+    element itself doesn't count.
+    """
+    items = [(item.tag, item.attrib, item.text, item.tail, len(item))
+             for item in element.iter()]
+    items[0] = items[0][:3] + items[0][4:]
+    return sha1(repr(items)).digest()
+
+
+class SanitizePolicy(object):
+    """An allowlist policy for sanitizing HTML and XHTML.
+
+    The *elements* and *attributes* are sets of the local names of the
+    elements and attributes to keep. Elements not allowed are replaced by
+    their content unless they are in *drop_elements* in which case they
+    go with all their content. Attributes in *url_attributes* are only
+    kept if their value is a relative URL or an absolute URL with one of
+    the *url_schemes*.
+
+    At most *cache_size* results are cached.
+    """
+    elements = frozenset((
+        "a", "abbr", "acronym", "address", "b", "big", "blockquote", "br",
+        "caption", "cite", "code", "col", "colgroup", "dd", "del", "dfn",
+        "div", "dl", "dt", "em", "h1", "h2", "h3", "h4", "h5", "h6", "hr",
+        "i", "img", "ins", "kbd", "li", "ol", "p", "pre", "q", "s", "samp",
+        "small", "span", "strike", "strong", "sub", "sup", "table", "tbody",
+        "td", "tfoot", "th", "thead", "tr", "tt", "u", "ul", "var"))
+    attributes = frozenset((
+        "abbr", "alt", "cite", "colspan", "datetime", "dir", "height",
+        "href", "hreflang", "lang", "rowspan", "src", "title", "width"))
+    drop_elements = frozenset(("script", "style", "object", "embed",
+                               "applet", "iframe", "frameset", "noscript"))
+    url_attributes = frozenset(("href", "src", "cite", "longdesc"))
+    url_schemes = frozenset(("http", "https", "ftp", "mailto"))
+    void_elements = frozenset(("br", "col", "hr", "img"))
+
+    def __init__(self, elements=None, attributes=None, drop_elements=None,
+                 url_schemes=None, cache_size=1024):
+        if elements is not None:
+            self.elements = frozenset(elements)
+        if attributes is not None:
+            self.attributes = frozenset(attributes)
+        if drop_elements is not None:
+            self.drop_elements = frozenset(drop_elements)
+        if url_schemes is not None:
+            self.url_schemes = frozenset(url_schemes)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = Lock()
+
+    def sanitize_xml(self, element):
+        """Return a sanitized copy of the xhtml tree *element*.
+
+        The root element itself is always kept, but loses all attributes
+        that aren't allowed.
+        """
+        key = "x" + get_tree_key(element)
+        result = self.get_cached(key)
+        if result is None:
+            result = element.makeelement(element.tag,
+                                         self.clean_attrib(element.attrib))
+            result.text = element.text
+            self.clean_children(element, result)
+            self.set_cached(key, result)
+        return result
+
+    def sanitize_html(self, text):
+        """Return a sanitized version of the HTML *text*."""
+        if not text:
+            return text
+        key = "h" + sha1(text.encode("utf-8")
+                         if isinstance(text, unicode) else text).digest()
+        result = self.get_cached(key)
+        if result is None:
+            parser = HTMLSanitizer(self)
+            try:
+                parser.feed(text)
+                parser.close()
+            except HTMLParseError:
+                pass # we keep what we've got so far
+            result = parser.get_result()
+            self.set_cached(key, result)
+        return result
+
+    def allow_attribute(self, name, value):
+        """Should the attribute *name* with *value* be kept?"""
+        if name not in self.attributes:
+            return False
+        if name in self.url_attributes:
+            scheme, colon, rest = value.strip().partition(":")
+            if colon and "/" not in scheme:
+                return scheme.lower() in self.url_schemes
+        return True
+
+    def clean_attrib(self, attrib):
+        result = {}
+        for key, value in attrib.iteritems():
+            if key == xml_tags.lang:
+                result[key] = value
+            elif key[:1] != "{" and self.allow_attribute(key.lower(), value):
+                result[key] = value
+        return result
+
+    def clean_children(self, source, target):
+        """Append cleaned copies of the children of *source* to *target*.
+        """
+        for child in source:
+            tag = child.tag
+            if isinstance(tag, basestring) and tag[:1] == "{":
+                ns, local = tag[1:].split("}", 1)
+            else:
+                ns, local = None, None
+            if ns == xhtml_ns and local in self.elements:
+                item = child.makeelement(tag, self.clean_attrib(child.attrib))
+                item.text = child.text
+                item.tail = child.tail
+                target.append(item)
+                self.clean_children(child, item)
+            else:
+                if ns == xhtml_ns and local not in self.drop_elements:
+                    self.append_text(target, child.text)
+                    self.clean_children(child, target)
+                self.append_text(target, child.tail)
+
+    @staticmethod
+    def append_text(element, text):
+        """Append *text* to the content of *element*."""
+        if not text:
+            return
+        if len(element):
+            last = element[-1]
+            last.tail = (last.tail or "") + text
+        else:
+            element.text = (element.text or "") + text
+
+    def get_cached(self, key):
+        with self.lock:
+            try:
+                result = self.cache.pop(key)
+            except KeyError:
+                return None
+            self.cache[key] = result
+            return result
+
+    def set_cached(self, key, result):
+        with self.lock:
+            cache = self.cache
+            cache[key] = result
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+
+class HTMLSanitizer(HTMLParser):
+    """A parser producing a sanitized version of HTML text.
+
+    The result is always balanced: End tags are only kept if they close
+    an element opened before and all elements still open at the end are
+    closed by :meth:`get_result`.
+    """
+    def __init__(self, policy):
+        HTMLParser.__init__(self)
+        self.policy = policy
+        self.result = []
+        self.dropping = 0
+        self.open_elements = []
+
+    def get_result(self):
+        self.close_elements(0)
+        return u"".join(self.result)
+
+    def close_elements(self, depth):
+        """Close all open elements above *depth*."""
+        open_elements = self.open_elements
+        while len(open_elements) > depth:
+            self.result.append(u"</%s>" % open_elements.pop())
+
+    def handle_starttag(self, tag, attrs):
+        policy = self.policy
+        if tag in policy.drop_elements:
+            if tag not in policy.void_elements:
+                self.dropping += 1
+            return
+        if self.dropping or tag not in policy.elements:
+            return
+        self.result.append(u"<%s" % tag)
+        for key, value in attrs:
+            value = value or u""
+            if policy.allow_attribute(key, value):
+                self.result.append(u' %s="%s"' % (key, escape(value, True)))
+        self.result.append(u">")
+        if tag not in policy.void_elements:
+            self.open_elements.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        policy = self.policy
+        if tag in policy.void_elements:
+            return
+        if tag in policy.drop_elements:
+            self.dropping -= 1
+        elif not self.dropping and tag in policy.elements:
+            self.close_elements(len(self.open_elements) - 1)
+
+    def handle_endtag(self, tag):
+        policy = self.policy
+        if tag in policy.void_elements:
+            return
+        if tag in policy.drop_elements:
+            self.dropping = max(self.dropping - 1, 0)
+        elif not self.dropping and tag in self.open_elements:
+            # Implicitly close everything opened inside the element.
+            open_elements = self.open_elements
+            depth = len(open_elements) - 1
+            while open_elements[depth] != tag:
+                depth -= 1
+            self.close_elements(depth)
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.result.append(escape(data))
+
+    def handle_entityref(self, name):
+        if not self.dropping:
+            self.result.append(u"&%s;" % name)
+
+    def handle_charref(self, name):
+        if not self.dropping:
+            self.result.append(u"&#%s;" % name)
+
+
+default_policy = SanitizePolicy()
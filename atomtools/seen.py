@@ -0,0 +1,316 @@
+"""Keeping track of the entries already processed.
+
+When polling feeds, most entries of each fetched document have been seen
+before. The :class:`SeenEntries` here remembers the atom:id and
+atom:updated of each entry of each feed, so that you only need to
+process the new and updated ones.
+
+It doesn't keep the ids themselves. Instead, the feed and id of an entry
+are hashed into a single integer key. Keys and the times of atom:updated
+are kept in two sorted arrays taking 16 bytes per entry. Keys added since
+the arrays were last sorted wait in a dict until there are enough of
+them for merging them to be worthwhile. Two different entries could end
+up with the same key. With 64 bit keys, this is very unlikely even for
+billions of entries.
+
+Optionally, a Bloom filter can be put in front of the arrays. For most
+new entries, it can then tell without a lookup in the arrays that they
+haven't been seen.
+
+Entries can be checked before they are turned into objects::
+
+    seen = SeenEntries()
+    for entry in seen.iterparse_new(url, source):
+        ...
+
+The state can be saved into a file with :meth:`SeenEntries.save` and
+loaded with :meth:`SeenEntries.load`.
+"""
+
+from __future__ import absolute_import
+from array import array
+from bisect import bisect_left
+from hashlib import sha1
+import math
+import struct
+import sys
+
+from atomtools.atom import atom_tags, AtomDate, AtomFeed
+from atomtools.utils import timestamp_from_date
+
+MAGIC = "ATSE"
+VERSION = 1
+
+header_format = struct.Struct("<4sHBBQQB")
+
+# Keys are unsigned longs, so they are 64 bits wide on most platforms
+# but only 32 bits on some.
+#
+key_type = "L"
+key_size = array(key_type).itemsize
+key_format = struct.Struct("<Q" if key_size == 8 else "<I")
+
+# The time of atom:updated for entries without one
+#
+missing = float("-inf")
+
+
+def get_entry_key(feed, id):
+    """Return the integer key for the entry *id* in *feed*.
+
+    Both *feed* and *id* are strings. The *feed* can be anything that
+    identifies the feed, such as its atom:id or its URL. Whitespace
+    around *id* doesn't count, so ids taken from objects and elements get
+    the same keys.
+    """
+    if isinstance(feed, unicode):
+        feed = feed.encode("utf-8")
+    id = id.strip()
+    if isinstance(id, unicode):
+        id = id.encode("utf-8")
+    digest = sha1("%s\0%s" % (feed, id)).digest()
+    return key_format.unpack(digest[:key_format.size])[0]
+
+
+def get_updated_time(date):
+    """Return the time of the AtomDate *date* in seconds or `missing`."""
+    timestamp = timestamp_from_date(date)
+    if timestamp is None:
+        return missing
+    return timestamp / 1e6
+
+
+class BloomFilter(object):
+    """A Bloom filter for integer keys.
+
+    The filter has *size* bits and sets *hashes* of them for every key.
+    Use :meth:`for_capacity` to get a filter sized for a number of keys
+    and a rate of false positives.
+    """
+    def __init__(self, size, hashes):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        """Return a filter for *capacity* keys and the given *error_rate*.
+        """
+        size = int(math.ceil(-capacity * math.log(error_rate)
+                             / math.log(2) ** 2))
+        hashes = int(round(size / float(capacity) * math.log(2)))
+        return cls(max(size, 8), max(hashes, 1))
+
+    def get_positions(self, key):
+        # The key is a hash already, so we can use double hashing on its
+        # two halves.
+        low = key & 0xffffffff
+        high = (key >> 32) | 1
+        size = self.size
+        return [(low + i * high) % size for i in xrange(self.hashes)]
+
+    def add(self, key):
+        bits = self.bits
+        for pos in self.get_positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        for pos in self.get_positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class SeenEntries(object):
+    """The entries seen so far.
+
+    If *bloom_capacity* is given, a :class:`BloomFilter` for this many
+    entries with *bloom_error_rate* false positives is put in front of
+    the exact store. It keeps working with more entries, only with more
+    false positives.
+    """
+    def __init__(self, bloom_capacity=None, bloom_error_rate=0.01):
+        self.keys = array(key_type)
+        self.times = array("d")
+        self.pending = {}
+        if bloom_capacity:
+            self.bloom = BloomFilter.for_capacity(bloom_capacity,
+                                                  bloom_error_rate)
+        else:
+            self.bloom = None
+
+    def __len__(self):
+        self.merge()
+        return len(self.keys)
+
+    def get_time(self, key):
+        """Return the stored time for *key* or ``None`` if it is unknown.
+        """
+        try:
+            return self.pending[key]
+        except KeyError:
+            pass
+        if self.bloom is not None and key not in self.bloom:
+            return None
+        keys = self.keys
+        index = bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            return self.times[index]
+        return None
+
+    def is_new(self, feed, id, updated=None):
+        """Is the entry *id* of *feed* new or updated since it was seen?
+
+        The *updated* is the atom:updated of the entry as an AtomDate. An
+        entry is updated if its atom:updated is later than when it was
+        last seen.
+        """
+        return self.is_new_key(get_entry_key(feed, id),
+                               get_updated_time(updated))
+
+    def is_new_key(self, key, time):
+        stored = self.get_time(key)
+        return stored is None or time > stored
+
+    def add(self, feed, id, updated=None):
+        """Remember the entry *id* of *feed* with *updated*."""
+        self.add_key(get_entry_key(feed, id), get_updated_time(updated))
+
+    def add_key(self, key, time):
+        stored = self.get_time(key)
+        if stored is None or time > stored:
+            self._store(key, time)
+
+    def _store(self, key, time):
+        self.pending[key] = time
+        if self.bloom is not None:
+            self.bloom.add(key)
+        if len(self.pending) > max(65536, len(self.keys) // 8):
+            self.merge()
+
+    def add_entry(self, feed, entry):
+        """Remember the AtomEntry *entry* of *feed*."""
+        self.add(feed, entry.id, entry.updated)
+
+    def filter_entries(self, feed, entries, record=True):
+        """Iterate over the new or updated entries among *entries*.
+
+        The entries are AtomEntry objects of *feed*. If *record* is
+        ``True``, they are remembered right away. Otherwise, use
+        :meth:`add_entry` once you are done with an entry.
+        """
+        for entry in entries:
+            if entry.id is None:
+                continue
+            key = get_entry_key(feed, entry.id)
+            time = get_updated_time(entry.updated)
+            if self.is_new_key(key, time):
+                if record:
+                    self._store(key, time)
+                yield entry
+
+    def iterparse_new(self, feed, source, cls=AtomFeed, record=True,
+                      **kwargs):
+        """Iterate over the new or updated entries in the document *source*.
+
+        The document is parsed with *cls*.iterparse_from_xml, passing on
+        *kwargs*. Entries are checked while they are still elements, so
+        only the new and updated ones are turned into objects. See
+        :meth:`filter_entries` for *record*.
+        """
+        def accept(element):
+            id = element.findtext(atom_tags.id)
+            if id is None:
+                return False
+            key = get_entry_key(feed, id)
+            updated = element.find(atom_tags.updated)
+            if updated is None:
+                time = missing
+            else:
+                time = get_updated_time(AtomDate.from_xml(updated))
+            if not self.is_new_key(key, time):
+                return False
+            if record:
+                self._store(key, time)
+            return True
+        return cls.iterparse_from_xml(source, accept=accept, **kwargs)
+
+    def merge(self):
+        """Move the pending keys into the sorted arrays."""
+        pending = self.pending
+        if not pending:
+            return
+        keys, times = self.keys, self.times
+        new_keys = array(key_type)
+        new_times = array("d")
+        start = 0
+        for key in sorted(pending):
+            index = bisect_left(keys, key, start)
+            new_keys.extend(keys[start:index])
+            new_times.extend(times[start:index])
+            new_keys.append(key)
+            new_times.append(pending[key])
+            start = index
+            if index < len(keys) and keys[index] == key:
+                start += 1
+        new_keys.extend(keys[start:])
+        new_times.extend(times[start:])
+        self.keys, self.times = new_keys, new_times
+        self.pending = {}
+
+    def save(self, file):
+        """Write the entries into the file object *file*."""
+        self.merge()
+        bloom = self.bloom
+        file.write(header_format.pack(MAGIC, VERSION,
+                                      sys.byteorder == "little", key_size,
+                                      len(self.keys),
+                                      bloom.size if bloom else 0,
+                                      bloom.hashes if bloom else 0))
+        file.write(buffer(self.keys))
+        file.write(buffer(self.times))
+        if bloom is not None:
+            file.write(buffer(bloom.bits))
+
+    @classmethod
+    def load(cls, file):
+        """Return the entries saved into the file object *file*.
+
+        Raises :exc:`ValueError` if the file wasn't written by
+        :meth:`save` on a platform with the same size of keys.
+        """
+        data = file.read(header_format.size)
+        if len(data) < header_format.size:
+            raise ValueError("not a seen entries file")
+        (magic, version, little, size, count, bloom_size,
+         bloom_hashes) = header_format.unpack(data)
+        if magic != MAGIC:
+            raise ValueError("not a seen entries file")
+        if version != VERSION:
+            raise ValueError("unsupported seen entries version %d" % version)
+        if size != key_size:
+            raise ValueError("seen entries written with %d bit keys"
+                             % (size * 8))
+        result = cls()
+        result.keys = read_array(file, key_type, count)
+        result.times = read_array(file, "d", count)
+        if bool(little) != (sys.byteorder == "little"):
+            result.keys.byteswap()
+            result.times.byteswap()
+        if bloom_size:
+            result.bloom = BloomFilter(bloom_size, bloom_hashes)
+            bits = file.read(len(result.bloom.bits))
+            if len(bits) != len(result.bloom.bits):
+                raise ValueError("truncated seen entries file")
+            result.bloom.bits[:] = bits
+        return result
+
+
+def read_array(file, type, count):
+    result = array(type)
+    data = file.read(count * result.itemsize)
+    if len(data) != count * result.itemsize:
+        raise ValueError("truncated seen entries file")
+    result.fromstring(data)
+    return result
@@ -0,0 +1,376 @@
+"""Binary snapshots of parsed documents.
+
+Parsing large feeds from XML over and over again is expensive. Instead,
+you can save the parsed objects into a snapshot file with
+:func:`write_snapshot` and load them again through a
+:class:`SnapshotReader`. Loading a snapshot doesn't involve any XML
+parsing except for XML payloads such as xhtml content which are stored
+pre-serialized.
+
+A snapshot file looks like this::
+
+    header      magic "ATSN", format version, marshal version
+    meta data   the feed without its entries
+    entries     one record per entry
+    classes     the names of all classes used by the records
+    index       the offsets of all entry records
+    trailer     offsets of the above and the number of entries
+
+All records are :mod:`marshal` data, so snapshots can only be read by
+the same Python version that wrote them. Since there is an index, the
+reader can memory-map the file and decode entries one by one.
+
+Objects are stored with all their attributes and restored without
+calling their constructor. Dates are stored as seconds since the epoch
+plus their time zone offset. Values of types not known here are pickled.
+
+Only load snapshots you wrote yourself. Both class names and pickled
+values are restricted to the classes of atomtools, a few harmless
+standard library types, and the modules you pass as *trusted_modules*,
+which keeps a forged file from running arbitrary code on load. But
+:mod:`marshal` itself is not meant for untrusted data and a malicious
+file may still crash the interpreter.
+"""
+
+from __future__ import absolute_import
+from calendar import timegm
+from copy import copy
+from datetime import datetime, timedelta
+import marshal
+import mmap
+from StringIO import StringIO
+import struct
+import sys
+from xml.etree.ElementTree import Element, fromstring
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from atomtools.tzinfo import TzInfoFixedOffset, TzInfoUTC
+from atomtools.xml import serialize_xml
+
+MAGIC = "ATSN"
+VERSION = 1
+
+header_format = struct.Struct("<4sHH")
+trailer_format = struct.Struct("<QQQQ4s")
+
+# Tags for encoded values. Values of type None, bool, int, long, float,
+# str, and unicode are stored as they are, lists and dicts are stored as
+# lists and dicts of encoded values, everything else as a tuple whose
+# first item is one of these tags.
+#
+OBJECT, TUPLE, DATETIME, ELEMENT, PICKLE = range(5)
+
+# Time zone kinds for DATETIME
+#
+TZ_NAIVE, TZ_UTC, TZ_FIXED = range(3)
+
+plain_types = frozenset((type(None), bool, int, long, float, str, unicode))
+epoch = datetime(1970, 1, 1)
+
+# Globals that pickled values may refer to besides trusted classes
+#
+pickle_globals = frozenset((
+    ("copy_reg", "__newobj__"), ("copy_reg", "_reconstructor"),
+    ("__builtin__", "object"), ("__builtin__", "set"),
+    ("__builtin__", "frozenset"), ("__builtin__", "complex"),
+    ("datetime", "date"), ("datetime", "datetime"), ("datetime", "time"),
+    ("datetime", "timedelta"), ("decimal", "Decimal"),
+))
+
+
+class SnapshotError(ValueError):
+    """The file is not a snapshot this module can read."""
+
+
+class Encoder(object):
+    """Turns objects into structures that :mod:`marshal` can handle."""
+    def __init__(self):
+        self.classes = {}
+        self.class_names = []
+
+    def encode(self, value):
+        kind = type(value)
+        if kind in plain_types:
+            return value
+        if kind is list:
+            return [self.encode(item) for item in value]
+        if kind is dict:
+            return dict((key, self.encode(item))
+                        for key, item in value.iteritems())
+        if kind is tuple:
+            return (TUPLE, [self.encode(item) for item in value])
+        if kind is datetime:
+            return self.encode_datetime(value)
+        if isinstance(value, Element):
+            return self.encode_element(value)
+        if hasattr(value, "prepare_xml"):
+            # Most attributes are plain values. Keeping them separate
+            # saves looking at each of them when decoding.
+            plain = {}
+            encoded = {}
+            for key, item in value.__dict__.iteritems():
+                if type(item) in plain_types:
+                    plain[key] = item
+                else:
+                    encoded[key] = self.encode(item)
+            return (OBJECT, self.get_class_id(kind), plain, encoded)
+        return (PICKLE, pickle.dumps(value, 2))
+
+    def encode_datetime(self, value):
+        tzinfo = value.tzinfo
+        if tzinfo is None:
+            kind, offset = TZ_NAIVE, 0
+        elif type(tzinfo) is TzInfoUTC:
+            kind, offset = TZ_UTC, 0
+        elif type(tzinfo) is TzInfoFixedOffset:
+            kind = TZ_FIXED
+            delta = tzinfo.utcoffset(value)
+            offset = delta.days * 1440 + delta.seconds // 60
+        else:
+            return (PICKLE, pickle.dumps(value, 2))
+        return (DATETIME, timegm(value.utctimetuple()), value.microsecond,
+                kind, offset)
+
+    def encode_element(self, value):
+        tail = value.tail
+        if tail is not None:
+            value = copy(value)
+            value.tail = None
+        return (ELEMENT, serialize_xml(value), tail)
+
+    def get_class_id(self, cls):
+        try:
+            return self.classes[cls]
+        except KeyError:
+            id = self.classes[cls] = len(self.class_names)
+            self.class_names.append("%s.%s" % (cls.__module__, cls.__name__))
+            return id
+
+
+class Decoder(object):
+    """Turns the result of :class:`Encoder` back into objects.
+
+    Classes must come from atomtools or one of the *trusted_modules*.
+    """
+    def __init__(self, class_names, trusted_modules=()):
+        self.trusted_modules = frozenset(trusted_modules)
+        self.classes = [self.resolve_class(name) for name in class_names]
+
+    def is_trusted(self, module):
+        return (module == "atomtools" or module.startswith("atomtools.")
+                or module in self.trusted_modules)
+
+    def resolve_class(self, name):
+        module, dot, name = name.rpartition(".")
+        if not self.is_trusted(module):
+            raise SnapshotError("untrusted class %s.%s" % (module, name))
+        try:
+            __import__(module)
+        except ImportError:
+            raise SnapshotError("unknown class %s.%s" % (module, name))
+        cls = getattr(sys.modules[module], name, None)
+        if not isinstance(cls, type) or not hasattr(cls, "prepare_xml"):
+            raise SnapshotError("unknown class %s.%s" % (module, name))
+        return cls
+
+    def find_global(self, module, name):
+        """Return the global *name* in *module* for unpickling."""
+        if (module, name) in pickle_globals:
+            __import__(module)
+        elif self.is_trusted(module):
+            try:
+                __import__(module)
+            except ImportError:
+                raise SnapshotError("unknown global %s.%s" % (module, name))
+        else:
+            raise SnapshotError("untrusted global %s.%s" % (module, name))
+        return getattr(sys.modules[module], name)
+
+    def unpickle(self, data):
+        unpickler = pickle.Unpickler(StringIO(data))
+        if pickle.__name__ == "cPickle":
+            unpickler.find_global = self.find_global
+        else:
+            unpickler.find_class = self.find_global
+        return unpickler.load()
+
+    def decode(self, value):
+        kind = type(value)
+        if kind is tuple:
+            tag = value[0]
+            if tag == OBJECT:
+                cls = self.classes[value[1]]
+                obj = cls.__new__(cls)
+                attrs = obj.__dict__
+                attrs.update(value[2])
+                decode = self.decode
+                for key, item in value[3].iteritems():
+                    attrs[key] = decode(item)
+                return obj
+            if tag == TUPLE:
+                return tuple(self.decode(item) for item in value[1])
+            if tag == DATETIME:
+                return self.decode_datetime(*value[1:])
+            if tag == ELEMENT:
+                element = fromstring(value[1])
+                element.tail = value[2]
+                return element
+            if tag == PICKLE:
+                return self.unpickle(value[1])
+            raise SnapshotError("unknown tag %r" % tag)
+        if kind is list:
+            return [self.decode(item) for item in value]
+        if kind is dict:
+            return dict((key, self.decode(item))
+                        for key, item in value.iteritems())
+        return value
+
+    @staticmethod
+    def decode_datetime(seconds, microsecond, kind, offset):
+        value = epoch + timedelta(seconds=seconds, microseconds=microsecond)
+        if kind == TZ_UTC:
+            return value.replace(tzinfo=TzInfoUTC())
+        if kind == TZ_FIXED:
+            value += timedelta(minutes=offset)
+            return value.replace(tzinfo=TzInfoFixedOffset(offset))
+        return value
+
+
+def dumps(obj):
+    """Return a byte string with a snapshot of the single object *obj*."""
+    encoder = Encoder()
+    data = encoder.encode(obj)
+    return (header_format.pack(MAGIC, VERSION, marshal.version)
+            + marshal.dumps((encoder.class_names, data)))
+
+def loads(data, trusted_modules=()):
+    """Return the object from a byte string created by :func:`dumps`.
+
+    Classes from modules outside of atomtools are only restored if the
+    module is in *trusted_modules*.
+    """
+    check_header(data[:header_format.size])
+    try:
+        class_names, data = marshal.loads(data[header_format.size:])
+    except (EOFError, ValueError, TypeError):
+        raise SnapshotError("truncated snapshot")
+    return Decoder(class_names, trusted_modules).decode(data)
+
+
+def write_snapshot(feed, file):
+    """Write a snapshot of *feed* into the file object *file*.
+
+    The *feed* should be an :class:`AtomFeed` or something else with a
+    list of inner objects in its *entries* attribute.
+    """
+    encoder = Encoder()
+    header = copy(feed)
+    header.entries = []
+    file.write(header_format.pack(MAGIC, VERSION, marshal.version))
+    offset = header_format.size
+    header_offset = offset
+    data = marshal.dumps(encoder.encode(header))
+    file.write(data)
+    offset += len(data)
+    index = []
+    for entry in feed.entries:
+        index.append(offset)
+        data = marshal.dumps(encoder.encode(entry))
+        file.write(data)
+        offset += len(data)
+    classes_offset = offset
+    index.append(offset)
+    data = marshal.dumps(encoder.class_names)
+    file.write(data)
+    offset += len(data)
+    index_offset = offset
+    file.write(struct.pack("<%dQ" % len(index), *index))
+    file.write(trailer_format.pack(header_offset, classes_offset,
+                                   index_offset, len(feed.entries), MAGIC))
+
+
+def check_header(data):
+    """Raise :exc:`SnapshotError` if *data* isn't a known header."""
+    if len(data) < header_format.size:
+        raise SnapshotError("not a snapshot")
+    magic, version, marshal_version = header_format.unpack(data)
+    if magic != MAGIC:
+        raise SnapshotError("not a snapshot")
+    if version != VERSION:
+        raise SnapshotError("unsupported snapshot version %d" % version)
+    if marshal_version != marshal.version:
+        raise SnapshotError("snapshot written by different Python version")
+
+
+class SnapshotReader(object):
+    """Read a snapshot written by :func:`write_snapshot`.
+
+    The argument *file* is a file object opened for reading in binary
+    mode. It is memory-mapped, so entries are only read and decoded when
+    you access them. Classes from modules outside of atomtools are only
+    restored if the module is in *trusted_modules*.
+
+    The reader works like a read-only sequence of entries. The meta data
+    is available through :meth:`get_header` and everything at once
+    through :meth:`load`.
+    """
+    def __init__(self, file, trusted_modules=()):
+        self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.open(trusted_modules)
+        except Exception:
+            self.data.close()
+            raise
+
+    def open(self, trusted_modules):
+        data = self.data
+        check_header(data[:header_format.size])
+        if len(data) < header_format.size + trailer_format.size:
+            raise SnapshotError("truncated snapshot")
+        (self.header_offset, classes_offset, index_offset, self.count,
+         magic) = trailer_format.unpack(data[-trailer_format.size:])
+        index_end = index_offset + 8 * (self.count + 1)
+        if magic != MAGIC or index_end != len(data) - trailer_format.size:
+            raise SnapshotError("truncated snapshot")
+        if not (header_format.size <= self.header_offset <= classes_offset
+                <= index_offset):
+            raise SnapshotError("broken snapshot")
+        self.index = struct.unpack("<%dQ" % (self.count + 1),
+                                   data[index_offset:index_end])
+        try:
+            class_names = marshal.loads(data[classes_offset:index_offset])
+        except (EOFError, ValueError, TypeError):
+            raise SnapshotError("truncated snapshot")
+        self.decoder = Decoder(class_names, trusted_modules)
+
+    def close(self):
+        self.data.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("snapshot index out of range")
+        return self.decoder.decode(marshal.loads(
+                        self.data[self.index[index]:self.index[index + 1]]))
+
+    def __iter__(self):
+        for index in xrange(self.count):
+            yield self[index]
+
+    def get_header(self):
+        """Return the feed without its entries."""
+        return self.decoder.decode(marshal.loads(
+                        self.data[self.header_offset:self.index[0]]))
+
+    def load(self):
+        """Return the complete feed."""
+        feed = self.get_header()
+        feed.entries = list(self)
+        return feed
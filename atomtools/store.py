@@ -0,0 +1,269 @@
+"""A persistent store for Atom entries.
+
+The :class:`EntryStore` keeps entries in an SQLite database rather than
+in memory. Entries are stored as snapshots (see :mod:`atomtools.snapshot`)
+together with a few index tables for their atom:id, atom:updated,
+categories, and links. Queries return iterators that only decode an
+entry when you get to it, so producing a page of a feed only costs as
+much as the entries on that page.
+
+Skipping entries with *offset* still makes SQLite step over them. To
+page through many entries, pass the key of the last entry of a page
+(see :meth:`EntryStore.get_key`) as *start* when asking for the next::
+
+    entries = list(store.get_entries(limit=20))
+    more = store.get_entries(limit=20, start=store.get_key(entries[-1]))
+
+Dates are stored as microseconds since the epoch in UTC. Dates without a
+time zone are taken to be UTC, too.
+"""
+
+from __future__ import absolute_import
+import sqlite3
+
+from atomtools.snapshot import dumps, loads
+from atomtools.utils import timestamp_from_date
+
+
+schema = """
+    CREATE TABLE IF NOT EXISTS entries (
+        id TEXT PRIMARY KEY,
+        updated INTEGER,
+        data BLOB NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS entries_updated_id ON entries (updated, id);
+    CREATE TABLE IF NOT EXISTS categories (
+        entry_id TEXT NOT NULL,
+        term TEXT NOT NULL,
+        scheme TEXT
+    );
+    CREATE INDEX IF NOT EXISTS categories_entry
+        ON categories (entry_id, term, scheme);
+    CREATE INDEX IF NOT EXISTS categories_term ON categories (term, scheme);
+    CREATE TABLE IF NOT EXISTS links (
+        entry_id TEXT NOT NULL,
+        rel TEXT NOT NULL,
+        href TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS links_entry ON links (entry_id, rel, href);
+    CREATE INDEX IF NOT EXISTS links_rel_href ON links (rel, href);
+"""
+
+
+class EntryStore(object):
+    """A persistent collection of entries.
+
+    The argument *path* is the filename of the SQLite database or
+    ``":memory:"`` for a database that goes away with the store.
+
+    Entries are identified by their atom:id. Entries without an id can't
+    be stored. Storing an entry replaces an entry with the same id only if
+    the new entry's atom:updated is later, so you can feed whatever you
+    fetch into the store without checking first.
+
+    If you store entries of classes defined outside of atomtools, pass
+    their modules as *trusted_modules*. See :mod:`atomtools.snapshot`.
+    """
+    def __init__(self, path, trusted_modules=()):
+        self.trusted_modules = trusted_modules
+        self.connection = sqlite3.connect(path)
+        self.connection.text_factory = unicode
+        self.connection.executescript(schema)
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute(
+                    "SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def __contains__(self, id):
+        return self.connection.execute(
+                    "SELECT 1 FROM entries WHERE id = ?",
+                    (id,)).fetchone() is not None
+
+    def add(self, entry):
+        """Store *entry* unless there is a newer or equally new one.
+
+        Returns whether the entry has been stored.
+        """
+        with self.connection:
+            return self._add(entry)
+
+    def add_entries(self, entries):
+        """Store all *entries* and return how many have been stored."""
+        with self.connection:
+            return sum(1 for entry in entries if self._add(entry))
+
+    def add_feed(self, feed):
+        """Store all entries of *feed*, an AtomFeed or AppFeed."""
+        return self.add_entries(feed.entries)
+
+    def _add(self, entry):
+        if entry.id is None:
+            raise ValueError("cannot store an entry without atom:id")
+        id = unicode(entry.id)
+        updated = timestamp_from_date(entry.updated)
+        cursor = self.connection.cursor()
+        row = cursor.execute("SELECT updated FROM entries WHERE id = ?",
+                             (id,)).fetchone()
+        if row is not None:
+            if (row[0] is not None
+                    and (updated is None or updated <= row[0])):
+                return False
+            self._delete(cursor, id)
+        cursor.execute("INSERT INTO entries (id, updated, data) "
+                       "VALUES (?, ?, ?)",
+                       (id, updated, sqlite3.Binary(dumps(entry))))
+        cursor.executemany("INSERT INTO categories (entry_id, term, scheme) "
+                           "VALUES (?, ?, ?)",
+                           [(id, item.term, item.scheme)
+                            for item in entry.categories
+                            if item.term is not None])
+        cursor.executemany("INSERT INTO links (entry_id, rel, href) "
+                           "VALUES (?, ?, ?)",
+                           [(id, item.rel or "alternate", item.href)
+                            for item in entry.links
+                            if item.href is not None])
+        return True
+
+    def remove(self, id):
+        """Remove the entry *id*. Returns whether there was such an entry.
+        """
+        with self.connection:
+            return self._delete(self.connection.cursor(), id)
+
+    @staticmethod
+    def _delete(cursor, id):
+        cursor.execute("DELETE FROM categories WHERE entry_id = ?", (id,))
+        cursor.execute("DELETE FROM links WHERE entry_id = ?", (id,))
+        cursor.execute("DELETE FROM entries WHERE id = ?", (id,))
+        return cursor.rowcount > 0
+
+    def get(self, id):
+        """Return the entry *id* or ``None``."""
+        row = self.connection.execute(
+                    "SELECT data FROM entries WHERE id = ?",
+                    (id,)).fetchone()
+        if row is None:
+            return None
+        return loads(str(row[0]), self.trusted_modules)
+
+    def get_updated(self, id):
+        """Return the atom:updated of entry *id* in microseconds or None.
+
+        Returns ``None``, too, if there is no such entry.
+        """
+        row = self.connection.execute(
+                    "SELECT updated FROM entries WHERE id = ?",
+                    (id,)).fetchone()
+        return None if row is None else row[0]
+
+    @staticmethod
+    def get_key(entry):
+        """Return the key of *entry* for the *start* of queries.
+
+        Entries are ordered by their keys. The key consists of the
+        atom:updated in microseconds and the atom:id.
+        """
+        return timestamp_from_date(entry.updated), unicode(entry.id)
+
+    def get_entries(self, before=None, after=None, limit=None, offset=0,
+                    start=None):
+        """Iterate over entries by descending atom:updated.
+
+        Only entries updated before the date *before* and after the date
+        *after* are included. Both can be datetimes or AtomDates. At most
+        *limit* entries are returned after skipping the first *offset*.
+        If *start* is given, only entries following the entry with this
+        key are included. Entries with the same atom:updated are ordered
+        by descending atom:id, entries without atom:updated come last.
+        """
+        where, args = [], []
+        if before is not None:
+            where.append("updated < ?")
+            args.append(timestamp_from_date(before))
+        if after is not None:
+            where.append("updated > ?")
+            args.append(timestamp_from_date(after))
+        return self._iter_query(where, args, limit, offset, start)
+
+    def get_by_category(self, term, scheme=None, limit=None, offset=0,
+                        start=None):
+        """Iterate over entries with a category *term* by descending
+        atom:updated.
+
+        If *scheme* is not ``None``, the category also has to have this
+        scheme. See :meth:`get_entries` for the other arguments.
+        """
+        where = ("EXISTS (SELECT 1 FROM categories "
+                 "WHERE categories.entry_id = entries.id "
+                 "AND categories.term = ?")
+        args = [term]
+        if scheme is not None:
+            where += " AND categories.scheme = ?"
+            args.append(scheme)
+        return self._iter_query([where + ")"], args, limit, offset, start)
+
+    def get_by_link(self, rel, href=None, limit=None, offset=0, start=None):
+        """Iterate over entries with a link *rel* by descending updated.
+
+        Links without a rel attribute are stored as "alternate". If *href*
+        is not ``None``, the link also has to point to this IRI. See
+        :meth:`get_entries` for the other arguments.
+        """
+        where = ("EXISTS (SELECT 1 FROM links "
+                 "WHERE links.entry_id = entries.id AND links.rel = ?")
+        args = [rel]
+        if href is not None:
+            where += " AND links.href = ?"
+            args.append(href)
+        return self._iter_query([where + ")"], args, limit, offset, start)
+
+    def _iter_query(self, where, args, limit, offset, start):
+        if start is None:
+            return self._execute(where, args, limit, offset)
+        updated, id = start
+        if updated is None:
+            return self._execute(where + ["entries.updated IS NULL",
+                                          "entries.id < ?"],
+                                 args + [id], limit, offset)
+        return self._iter_after(where, args, limit, offset, updated, id)
+
+    def _iter_after(self, where, args, limit, offset, updated, id):
+        # Entries without atom:updated come after all others, but a query
+        # that includes them can't use a range of the index.
+        dated = where + ["(entries.updated < ? OR (entries.updated = ? "
+                         "AND entries.id < ?))"]
+        dated_args = args + [updated, updated, id]
+        count = 0
+        for entry in self._execute(dated, dated_args, limit, offset):
+            count += 1
+            yield entry
+        if limit is not None:
+            limit -= count
+            if limit <= 0:
+                return
+        if count:
+            offset = 0
+        elif offset:
+            offset = max(offset - self._count(dated, dated_args), 0)
+        for entry in self._execute(where + ["entries.updated IS NULL"],
+                                   args, limit, offset):
+            yield entry
+
+    def _count(self, where, args):
+        query = "SELECT COUNT(*) FROM entries WHERE " + " AND ".join(where)
+        return self.connection.execute(query, args).fetchone()[0]
+
+    def _execute(self, where, args, limit=None, offset=0):
+        query = ["SELECT entries.data FROM entries"]
+        if where:
+            query.append("WHERE " + " AND ".join(where))
+        query.append("ORDER BY entries.updated DESC, entries.id DESC")
+        if limit is not None or offset:
+            query.append("LIMIT ? OFFSET ?")
+            args = args + [-1 if limit is None else limit, offset]
+        cursor = self.connection.execute(" ".join(query), args)
+        trusted_modules = self.trusted_modules
+        return (loads(str(data), trusted_modules) for data, in cursor)
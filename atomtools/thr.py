@@ -3,12 +3,14 @@
 The document you are looking for is RFC 4685.
 """
 
-from atomtools.atom import AtomCommon, AtomLink, AtomText
-from atomtools.xml import define_namespace, QName, XMLObject
+from atomtools.atom import AtomCommon, AtomEntry, AtomFeed, AtomLink
+from atomtools.utils import create_text_xml, int_from_text
+from atomtools.xml import define_namespace, define_tags, XMLObject
 
 # Namespaces
 #
 thr_ns = define_namespace("thr", "http://purl.org/syndication/thread/1.0")
+thr_tags = define_tags(thr_ns, "count", "in-reply-to", "total", "updated")
 
 class ThrInReplyTo(AtomCommon):
     """3.  The 'in-reply-to' Extension Element.
@@ -30,7 +32,7 @@ class ThrInReplyTo(AtomCommon):
                 type=element.attrib.get("type"),
                 **kwargs)
 
-    def create_xml(self, parent, tag=QName(thr_ns, "in-reply-to")):
+    def create_xml(self, parent, tag=thr_tags.in_reply_to):
         return super(ThrInReplyTo, self).create_xml(parent, tag)
 
     def prepare_xml(self, element):
@@ -44,10 +46,17 @@ class ThrInReplyTo(AtomCommon):
         if self.type is not None:
             element.attrib["type"] = self.type
 
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(ThrInReplyTo, self).check_xml(result, path, secure, **kwargs)
+        if not self.ref:
+            result.add(path + "/@ref", "ref is required")
+
 
 class ThrLink(AtomLink):
     """4.  The 'replies' Link Relation
 
+    The thr:count attribute is available as an integer in *count*, the
+    thr:updated attribute as a string in *updated*.
     """
     def __init__(self, count=None, updated=None, **kwargs):
         super(ThrLink, self).__init__(**kwargs)
@@ -57,27 +66,41 @@ class ThrLink(AtomLink):
     @classmethod
     def from_xml(cls, element, **kwargs):
         return super(ThrLink, cls).from_xml(element,
-                count=element.attrib.get(QName(thr_ns, "count")),
-                updated=element.attrib.get(QName(thr_ns, "updated")),
+                count=int_from_text(element.attrib.get(
+                                                thr_tags.count)),
+                updated=element.attrib.get(thr_tags.updated),
                 **kwargs)
 
     def prepare_xml(self, element):
         super(ThrLink, self).prepare_xml(element)
         if self.count is not None:
-            element.attrib[QName(thr_ns, "count")] = self.count
+            element.attrib[thr_tags.count] = str(self.count)
         if self.updated is not None:
-            element.attrib[QName(thr_ns, "updated")] = self.updated
+            element.attrib[thr_tags.updated] = self.updated
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(ThrLink, self).check_xml(result, path, secure, **kwargs)
+        if self.count is not None and self.count < 0:
+            result.add(path + "/@thr:count", "count must not be negative")
 
 
 class ThrMixin(XMLObject):
     """5.  The 'total' Extension Element
 
+    Mix this into a class derived from :class:`AtomEntry` to add the
+    thread extensions. The content of thr:total is available as an
+    integer in *total*, all thr:in-reply-to elements as a list of
+    :class:`ThrInReplyTo` objects in *in_reply_tos*. Links are created
+    as :class:`ThrLink` objects.
     """
-    inner_factor = {
-        "total": AtomText.from_xml,
+    inner_factory = {
         "link": ThrLink.from_xml,
         "in-reply-to": ThrInReplyTo.from_xml
     }
+    field_tags = {
+        "in_reply_tos": thr_tags.in_reply_to,
+        "total": thr_tags.total,
+    }
 
     def __init__(self, total=None, in_reply_tos=(), **kwargs):
         super(ThrMixin, self).__init__(**kwargs)
@@ -87,17 +110,236 @@ class ThrMixin(XMLObject):
     @classmethod
     def from_xml(cls, element, **kwargs):
         kwargs.setdefault("in_reply_tos", [])
+        skipped = cls.get_skipped_tags(kwargs.get("projection"))
         for sub in element:
-            if sub.tag == QName(thr_ns, "total"):
-                kwargs["total"] = cls.inner_from_xml("total", sub)
-            if sub.tag == QName(thr_ns, "in-reply-to"):
+            if sub.tag in skipped:
+                continue
+            elif sub.tag == thr_tags.total:
+                kwargs["total"] = int_from_text(sub.text)
+            elif sub.tag == thr_tags.in_reply_to:
                 kwargs["in_reply_tos"].append(
-                        cls.inner_from_xml("in_reply_to", sub))
+                        cls.inner_from_xml("in-reply-to", sub))
         return super(ThrMixin, cls).from_xml(element, **kwargs)
 
     def prepare_xml(self, element):
         super(ThrMixin, self).prepare_xml(element)
-        if self.total:
-            self.total.create_xml(element, QName(thr_ns, "total"))
+        if self.total is not None:
+            create_text_xml(str(self.total), element, thr_tags.total)
         for item in self.in_reply_tos:
             item.create_xml(element)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        super(ThrMixin, self).check_xml(result, path, secure, **kwargs)
+        if self.total is not None and self.total < 0:
+            result.add(path + "/thr:total", "total must not be negative")
+        for n, item in enumerate(self.in_reply_tos, 1):
+            item.check_xml(result, "%s/thr:in-reply-to[%d]" % (path, n),
+                           secure)
+
+    def get_replies_link(self):
+        """Return the first replies link as a :class:`ThrLink` or None."""
+        for link in self.links:
+            if link.rel == "replies":
+                return link
+        return None
+
+
+class ThrEntry(ThrMixin, AtomEntry):
+    """An atom:entry with thread extensions."""
+
+
+class ThrFeed(AtomFeed):
+    """An atom:feed whose entries are :class:`ThrEntry` objects."""
+    inner_factory = {
+        "entry": ThrEntry.from_xml,
+    }
+
+
+class ThrIndex(object):
+    """An index of the reply trees formed by a bunch of entries.
+
+    Entries are added one by one through :meth:`add` in any order. Each
+    entry is placed into the tree below the entry referenced by its first
+    thr:in-reply-to element. Entries whose parent hasn't been added yet
+    are orphans until it arrives. Entries without any thr:in-reply-to
+    element are the roots of threads.
+
+    The number of direct replies and the most recent atom:updated of all
+    direct replies are kept up to date as entries are added. The total
+    number of replies in a subtree is counted when first asked for and
+    then updated along the parent chain of each new entry. These are the
+    values needed for a thr:total element and the thr:count and
+    thr:updated attributes of a replies link.
+
+    Entries are identified by their atom:id. Adding an entry with an id
+    that is already present replaces the entry but keeps its place in the
+    tree. An entry whose thr:in-reply-to would close a cycle is treated
+    as the root of a thread instead.
+    """
+    def __init__(self, entries=()):
+        self.entries = {}
+        self.parents = {}
+        self.children = {}
+        self.totals = {}
+        self.latest = {}
+        self.roots = []
+        # Union-find over all ids linked so far. Each id gets its parent
+        # only once, so an id and its parent share a set exactly when
+        # linking them would create a cycle.
+        self.links = {}
+        for entry in entries:
+            self.add(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, id):
+        return id in self.entries
+
+    def __getitem__(self, id):
+        return self.entries[id]
+
+    def add(self, entry):
+        """Add *entry* to the index."""
+        id = entry.id
+        known = id in self.entries
+        self.entries[id] = entry
+        if known:
+            parent = self.parents.get(id)
+        else:
+            parent = None
+            for item in getattr(entry, "in_reply_tos", ()):
+                if item.ref is not None:
+                    parent = item.ref
+                    break
+            if parent is not None:
+                root, parent_root = self.find(id), self.find(parent)
+                if root == parent_root:
+                    parent = None
+                else:
+                    self.links[root] = parent_root
+            if parent is None:
+                self.roots.append(id)
+            else:
+                self.parents[id] = parent
+                self.children.setdefault(parent, []).append(id)
+                self.update_totals(id, parent)
+        if parent is not None:
+            updated = getattr(entry, "updated", None)
+            updated = getattr(updated, "datetime", None)
+            if updated is not None:
+                latest = self.latest.get(parent)
+                if latest is None or updated > latest:
+                    self.latest[parent] = updated
+
+    def get_parent(self, id):
+        """Return the id of the entry *id* replies to or ``None``."""
+        return self.parents.get(id)
+
+    def get_replies(self, id):
+        """Return the ids of all direct replies to *id* in order of arrival.
+        """
+        return list(self.children.get(id, ()))
+
+    def get_count(self, id):
+        """Return the number of direct replies to *id*."""
+        return len(self.children.get(id, ()))
+
+    def get_total(self, id):
+        """Return the total number of replies in the subtree of *id*."""
+        totals = self.totals
+        if id in totals:
+            return totals[id]
+        children = self.children
+        # Iterative post-order walk that fills in totals for the whole
+        # subtree, so that asking for the totals of all entries stays
+        # linear.
+        stack = [(id, False)]
+        while stack:
+            item, done = stack.pop()
+            if done:
+                totals[item] = sum(1 + totals[reply]
+                                   for reply in children.get(item, ()))
+            elif item not in totals:
+                stack.append((item, True))
+                stack.extend((reply, False)
+                             for reply in children.get(item, ()))
+        return totals[id]
+
+    def update_totals(self, id, parent):
+        """Add the subtree of the new entry *id* to the totals above it.
+
+        Totals are only ever counted for entire subtrees, so if a total
+        isn't known, neither are those of any entries further up and we
+        can stop there.
+        """
+        totals = self.totals
+        if parent not in totals:
+            return
+        added = 1 + self.get_total(id)
+        parents = self.parents
+        while parent in totals:
+            totals[parent] += added
+            parent = parents.get(parent)
+
+    def find(self, id):
+        """Return the representative of the set of linked ids of *id*."""
+        links = self.links
+        root = id
+        while root in links:
+            root = links[root]
+        while id != root:
+            links[id], id = root, links[id]
+        return root
+
+    def get_updated(self, id):
+        """Return the datetime of the latest direct reply to *id* or None.
+        """
+        return self.latest.get(id)
+
+    def get_orphans(self):
+        """Return the ids of all entries whose parent is still missing."""
+        return [id for id, parent in self.parents.iteritems()
+                if parent not in self.entries]
+
+    def iter_flat(self, id=None):
+        """Iterate over a thread in depth-first order.
+
+        Yields pairs of the depth and the entry. If *id* is given, only
+        the subtree of that entry is produced, with the entry itself at
+        depth 0. Otherwise all threads are produced in the order their
+        roots arrived, followed by all subtrees whose parent is missing.
+
+        Replies are ordered by arrival.
+        """
+        if id is not None:
+            stack = [(0, id)]
+        else:
+            stack = [(0, item) for item in reversed(self.get_orphans())]
+            stack.extend((0, item) for item in reversed(self.roots))
+        children = self.children
+        entries = self.entries
+        while stack:
+            depth, item = stack.pop()
+            yield depth, entries[item]
+            replies = children.get(item)
+            if replies:
+                depth += 1
+                stack.extend((depth, reply) for reply in reversed(replies))
+
+    def get_nested(self, id=None):
+        """Return threads as nested lists.
+
+        Each node in the result is a pair of an entry and a list of nodes
+        for its replies. If *id* is given, a list with only the node for
+        that entry is returned. Otherwise the list contains the nodes for
+        all threads in the same order as :meth:`iter_flat`.
+        """
+        result = []
+        path = [result]
+        for depth, entry in self.iter_flat(id):
+            del path[depth + 1:]
+            node = (entry, [])
+            path[depth].append(node)
+            path.append(node[1])
+        return result
@@ -15,7 +15,8 @@ class TzInfoFixedOffset(tzinfo):
     def __init__(self, offset):
         if isinstance(offset, timedelta):
             self.__offset = offset
-            offset = self.__offset.seconds // 60
+            offset = (self.__offset.days * 86400
+                      + self.__offset.seconds) // 60
         else:
             self.__offset = timedelta(minutes=offset)
 
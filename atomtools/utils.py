@@ -1,6 +1,11 @@
 """Various utility functions."""
 
 from __future__ import absolute_import
+from calendar import timegm
+from htmlentitydefs import name2codepoint
+from HTMLParser import HTMLParser, HTMLParseError
+import re
+from urlparse import urljoin
 from xml.etree.ElementTree import SubElement
 from xml.etree.ElementTree import tostring as to_xml_string
 
@@ -11,14 +16,22 @@ def create_text_xml(text, parent, tag):
     return element
 
 def flatten_xml_content(element):
-    """Returns a flat version of the content of *element*."""
+    """Returns a flat version of the content of *element*.
+
+    If the element was created by :class:`atomtools.xml.SourceParser`, any
+    markup is taken verbatim from the source document. Otherwise, it has
+    to be serialized again.
+    """
     if len(element) > 0:
-        # XXX Not sure if this is smart
-        text = [element.text]
-        text.extend((to_xml_string(e) for e in element))
-        text = ''.join(text)
+        get_source_content = getattr(element, "get_source_content", None)
+        text = get_source_content and get_source_content()
+        if text is None:
+            # XXX Not sure if this is smart
+            text = [element.text or ""]
+            text.extend((to_xml_string(e) for e in element))
+            text = ''.join(text)
     else:
-        text = element.text
+        text = element.text or ""
     return text.strip()
 
 def from_text_xml(element):
@@ -28,6 +41,88 @@ def from_text_xml(element):
     """
     return element.text
 
+def int_from_text(text):
+    """Convert *text* to an integer or return ``None`` if that fails."""
+    try:
+        return int(text.strip())
+    except (AttributeError, ValueError):
+        return None
+
+class Interner(object):
+    """Deduplicates equal values.
+
+    Calling the interner with a value returns an earlier value equal to
+    it if there is one, so all equal values end up being the same
+    object. :meth:`share` does the same for objects created from a key.
+
+    At most *size* values are kept. Once there are more, all of them are
+    forgotten. If *size* is 0, nothing is ever kept.
+    """
+    def __init__(self, size=65536):
+        self.size = size
+        self.values = {}
+
+    def __call__(self, value):
+        if value is None or not self.size:
+            return value
+        values = self.values
+        try:
+            return values[value]
+        except KeyError:
+            if len(values) >= self.size:
+                values.clear()
+            values[value] = value
+            return value
+
+    def share(self, key, create):
+        """Return the value for *key*, calling *create* if there is none.
+        """
+        if not self.size:
+            return create()
+        values = self.values
+        try:
+            return values[key]
+        except KeyError:
+            if len(values) >= self.size:
+                values.clear()
+            value = values[key] = create()
+            return value
+
+default_interner = Interner()
+
+def timestamp_from_date(date):
+    """Return microseconds since the epoch for a datetime or AtomDate.
+
+    Returns ``None`` if *date* is ``None`` or has no datetime.
+    """
+    date = getattr(date, "datetime", date)
+    if date is None:
+        return None
+    if date.tzinfo is not None:
+        seconds = timegm(date.utctimetuple())
+    else:
+        seconds = timegm(date.timetuple())
+    return seconds * 1000000 + date.microsecond
+
+def join_url(base, url):
+    """Return *url* resolved against *base*.
+
+    If either is ``None``, returns the other. Results are cached, since
+    the same pairs come up again and again.
+    """
+    if base is None or url is None:
+        return url if base is None else base
+    key = (base, url)
+    try:
+        return _joined_urls[key]
+    except KeyError:
+        if len(_joined_urls) >= 65536:
+            _joined_urls.clear()
+        result = _joined_urls[key] = urljoin(base, url)
+        return result
+
+_joined_urls = {}
+
 def wrap_xml_tree(element, tag):
     """Wrap content of element in a *tag* element if it isn't already."""
     if len(element) == 1 and element[0].tag == tag:
@@ -38,6 +133,184 @@ def wrap_xml_tree(element, tag):
         res.extend(e for e in element)
         return res
 
+class TextCollector(object):
+    """Collects pieces of text into normalized plain text.
+
+    Runs of whitespace are collapsed into a single space. Once at least
+    *limit* characters have been collected, :meth:`add` returns ``True``
+    and the result is cut to *limit* characters.
+    """
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.words = []
+        self.length = -1
+        self.join = False
+
+    def add(self, text):
+        """Add *text*, return whether the limit has been reached."""
+        if not text:
+            return False
+        words = text.split()
+        if not words:
+            self.join = False
+            return False
+        if self.join and not text[0].isspace():
+            self.length += len(words[0])
+            self.words[-1] += words[0]
+            words = words[1:]
+        for word in words:
+            self.length += len(word) + 1
+        self.words.extend(words)
+        self.join = not text[-1].isspace()
+        return self.limit is not None and self.length >= self.limit
+
+    def separate(self):
+        """Make sure the next text starts a new word."""
+        self.join = False
+
+    def get_text(self):
+        text = u" ".join(self.words)
+        if self.limit is not None:
+            text = text[:self.limit]
+        return text
+
+
+block_elements = frozenset(("address", "blockquote", "br", "dd", "div",
+                            "dl", "dt", "h1", "h2", "h3", "h4", "h5", "h6",
+                            "hr", "li", "ol", "p", "pre", "table", "td",
+                            "th", "tr", "ul"))
+hidden_elements = frozenset(("script", "style"))
+
+def extract_xml_text(element, limit=None):
+    """Return the normalized plain text content of *element*.
+
+    Walks the tree of *element* once, stopping as soon as *limit*
+    characters have been found. Block-level XHTML elements separate
+    words, other elements don't. The content of script and style
+    elements is left out.
+    """
+    collector = TextCollector(limit)
+    if collector.add(element.text):
+        return collector.get_text()
+    stack = [(element, iter(element))]
+    while stack:
+        for item in stack[-1][1]:
+            tag = item.tag
+            if not isinstance(tag, basestring):
+                # comments and processing instructions
+                if collector.add(item.tail):
+                    return collector.get_text()
+                continue
+            local = tag.rsplit("}", 1)[-1].lower()
+            if local in hidden_elements:
+                if collector.add(item.tail):
+                    return collector.get_text()
+                continue
+            if local in block_elements:
+                collector.separate()
+            if collector.add(item.text):
+                return collector.get_text()
+            stack.append((item, iter(item)))
+            break
+        else:
+            item = stack.pop()[0]
+            if stack:
+                if item.tag.rsplit("}", 1)[-1].lower() in block_elements:
+                    collector.separate()
+                if collector.add(item.tail):
+                    return collector.get_text()
+    return collector.get_text()
+
+def extract_html_text(text, limit=None):
+    """Return the normalized plain text of the HTML *text*.
+
+    The text is scanned once, stopping as soon as *limit* characters have
+    been found.
+    """
+    extractor = HTMLTextExtractor(limit)
+    try:
+        extractor.feed(text)
+        extractor.close()
+    except (HTMLTextExtractor.Done, HTMLParseError):
+        pass
+    return extractor.collector.get_text()
+
+class HTMLTextExtractor(HTMLParser):
+    """Collects the text of HTML into a :class:`TextCollector`."""
+    class Done(Exception):
+        pass
+
+    skip_elements = hidden_elements
+
+    def __init__(self, limit=None):
+        HTMLParser.__init__(self)
+        self.collector = TextCollector(limit)
+        self.skipping = 0
+
+    def add(self, text):
+        if not self.skipping and self.collector.add(text):
+            raise self.Done
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skip_elements:
+            self.skipping += 1
+        elif tag in block_elements:
+            self.collector.separate()
+
+    def handle_endtag(self, tag):
+        if tag in self.skip_elements:
+            self.skipping = max(self.skipping - 1, 0)
+        elif tag in block_elements:
+            self.collector.separate()
+
+    def handle_data(self, data):
+        self.add(data)
+
+    def handle_entityref(self, name):
+        try:
+            self.add(unichr(name2codepoint[name]))
+        except KeyError:
+            self.add(u"&%s;" % name)
+
+    def handle_charref(self, name):
+        try:
+            if name[:1] in "xX":
+                self.add(unichr(int(name[1:], 16)))
+            else:
+                self.add(unichr(int(name)))
+        except (ValueError, OverflowError):
+            pass
+
+unsafe_elements = frozenset(("script", "style", "iframe", "frame",
+                             "frameset", "object", "embed", "applet",
+                             "form", "base", "link", "meta"))
+
+def is_unsafe_xml(element):
+    """Does the tree of *element* contain potentially harmful markup?
+
+    This looks for elements that can run code or load stuff, attributes
+    for event handlers, and javascript: URLs.
+    """
+    for item in element.iter():
+        tag = item.tag
+        if not isinstance(tag, basestring):
+            continue # comments and processing instructions
+        if tag.rsplit("}", 1)[-1].lower() in unsafe_elements:
+            return True
+        for key, value in item.attrib.iteritems():
+            if key.rsplit("}", 1)[-1].lower().startswith("on"):
+                return True
+            if value.strip().lower().startswith("javascript:"):
+                return True
+    return False
+
+unsafe_html_re = re.compile(r"<\s*/?\s*(%s)\b|\son\w+\s*=|javascript:"
+                            % "|".join(unsafe_elements), re.I)
+
+def is_unsafe_html(text):
+    """Does the HTML *text* contain potentially harmful markup?"""
+    return bool(text) and unsafe_html_re.search(text) is not None
+
 def print_xml_tree(element, prefix=""):
     from sys import stderr
     stderr.write(prefix)
@@ -0,0 +1,288 @@
+"""A WSGI application receiving feed updates via WebSub.
+
+The document you are looking for is the W3C Recommendation WebSub. It
+used to be known as PubSubHubbub.
+
+Instead of polling a feed, a subscriber asks the feed's hub to send it
+new content. The :class:`WebSubSubscriber` here sends these requests,
+answers the hub's verification requests, and receives the content. It
+is a WSGI application that needs to be reachable under the *base_url*
+you give it. Each subscription gets its own callback URL below that::
+
+    <base_url>/<token>            the callback of a subscription
+
+Content is delivered as fat pings, i.e., as feed documents containing
+the new entries. They are stored in a temporary file while their HMAC
+signature is checked and then parsed entry by entry via
+:meth:`AtomFeed.iterparse_from_xml`. If you give the subscriber a
+:class:`SeenEntries` object, entries seen before are skipped before they
+are turned into objects. Once the entire document has been parsed, each
+remaining entry is passed on together with the topic URL either to a
+*handler* function or put into a *queue*. A broken document is answered
+with status 400 without passing on anything, so the hub's redelivery
+doesn't produce duplicates.
+"""
+
+from __future__ import absolute_import
+import hashlib
+import hmac
+import os
+from tempfile import SpooledTemporaryFile
+from threading import Lock
+import time
+from urllib import urlencode
+import urllib2
+from urlparse import parse_qs
+
+from atomtools.appserver import InputReader
+from atomtools.atom import AtomFeed
+from atomtools.xml import ParseError
+
+
+class WebSubError(RuntimeError):
+    """The hub refused a subscription request."""
+
+
+class Subscription(object):
+    """A subscription to *topic* at *hub* with callback *token*.
+
+    The *mode* is ``"subscribe"`` or ``"unsubscribe"`` while a request is
+    pending, ``"active"`` after the hub has verified the subscription,
+    and ``"denied"`` if the hub refused it. The *expires* is the time in
+    seconds when an active subscription runs out or ``None``.
+    """
+    def __init__(self, topic, hub, token, secret=None, lease_seconds=None):
+        self.topic = topic
+        self.hub = hub
+        self.token = token
+        self.secret = secret
+        self.lease_seconds = lease_seconds
+        self.mode = "subscribe"
+        self.expires = None
+
+
+# The hash algorithms allowed in X-Hub-Signature headers
+#
+signature_methods = {
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+    "sha384": hashlib.sha384,
+    "sha512": hashlib.sha512,
+}
+
+
+class WebSubSubscriber(object):
+    """A WSGI application for receiving WebSub content.
+
+    The application has to be reachable under *base_url*. Received
+    entries are passed to *handler* as ``handler(topic, entry)`` or, if
+    a *queue* is given instead, put into it as ``(topic, entry)`` pairs.
+    Feeds are parsed using *feed_class*. If *seen* is a
+    :class:`SeenEntries`, only new and updated entries are passed on.
+
+    Content is kept in memory while being checked if it is smaller than
+    *spool_size* bytes and in a temporary file otherwise.
+    """
+    feed_class = AtomFeed
+    spool_size = 1 << 20
+    chunk_size = 64 * 1024
+
+    def __init__(self, base_url, handler=None, queue=None, feed_class=None,
+                 seen=None, clock=time.time):
+        if (handler is None) == (queue is None):
+            raise TypeError("need either handler or queue")
+        self.base_url = base_url.rstrip("/")
+        self.handler = handler
+        self.queue = queue
+        if feed_class is not None:
+            self.feed_class = feed_class
+        self.seen = seen
+        self.clock = clock
+        self.subscriptions = {}
+        self.lock = Lock()
+
+    # Talking to the hub
+    #
+    def subscribe(self, topic, hub, secret=None, lease_seconds=None):
+        """Ask *hub* to send updates of *topic* and return the
+        :class:`Subscription`.
+
+        If *secret* is given, the hub signs all content with it. The hub
+        will verify the request before it is active.
+        """
+        token = os.urandom(16).encode("hex")
+        subscription = Subscription(topic, hub, token, secret,
+                                    lease_seconds)
+        with self.lock:
+            self.subscriptions[token] = subscription
+        try:
+            self.send_request(subscription, "subscribe")
+        except:
+            with self.lock:
+                self.subscriptions.pop(token, None)
+            raise
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Ask the hub to stop sending updates for *subscription*."""
+        subscription.mode = "unsubscribe"
+        self.send_request(subscription, "unsubscribe")
+
+    def renew(self, subscription):
+        """Ask the hub to extend the lease of *subscription*."""
+        self.send_request(subscription, "subscribe")
+
+    def get_expiring(self, seconds):
+        """Return the active subscriptions that run out within *seconds*.
+        """
+        limit = self.clock() + seconds
+        with self.lock:
+            return [item for item in self.subscriptions.itervalues()
+                    if item.mode == "active" and item.expires is not None
+                    and item.expires <= limit]
+
+    def get_callback(self, subscription):
+        return "%s/%s" % (self.base_url, subscription.token)
+
+    def send_request(self, subscription, mode):
+        params = [("hub.mode", mode), ("hub.topic", subscription.topic),
+                  ("hub.callback", self.get_callback(subscription))]
+        if mode == "subscribe":
+            if subscription.secret is not None:
+                params.append(("hub.secret", subscription.secret))
+            if subscription.lease_seconds is not None:
+                params.append(("hub.lease_seconds",
+                               str(subscription.lease_seconds)))
+        request = urllib2.Request(subscription.hub, urlencode(params),
+                                  {"Content-Type":
+                                        "application/x-www-form-urlencoded"})
+        try:
+            urllib2.urlopen(request).close()
+        except urllib2.HTTPError, err:
+            raise WebSubError("hub refused %s request: %s %s"
+                              % (mode, err.code, err.msg))
+
+    # The WSGI application
+    #
+    def __call__(self, environ, start_response):
+        token = environ.get("PATH_INFO", "").strip("/")
+        with self.lock:
+            subscription = self.subscriptions.get(token)
+        if subscription is None:
+            return self.respond(start_response, "404 Not Found")
+        method = environ["REQUEST_METHOD"]
+        if method == "GET":
+            return self.handle_verify(environ, start_response, subscription)
+        if method == "POST":
+            return self.handle_content(environ, start_response,
+                                       subscription)
+        return self.respond(start_response, "405 Method Not Allowed",
+                            [("Allow", "GET, POST")])
+
+    def handle_verify(self, environ, start_response, subscription):
+        """Answer the hub's verification of intent or denial."""
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        mode = query.get("hub.mode", [None])[0]
+        topic = query.get("hub.topic", [None])[0]
+        if topic != subscription.topic:
+            return self.respond(start_response, "404 Not Found")
+        if mode == "denied":
+            subscription.mode = "denied"
+            with self.lock:
+                self.subscriptions.pop(subscription.token, None)
+            return self.respond(start_response, "200 OK")
+        challenge = query.get("hub.challenge", [None])[0]
+        if challenge is None:
+            return self.respond(start_response, "400 Bad Request")
+        if mode == "subscribe" and subscription.mode in ("subscribe",
+                                                         "active"):
+            subscription.mode = "active"
+            try:
+                lease = int(query["hub.lease_seconds"][0])
+            except (KeyError, ValueError):
+                subscription.expires = None
+            else:
+                subscription.expires = self.clock() + lease
+        elif mode == "unsubscribe" and subscription.mode == "unsubscribe":
+            with self.lock:
+                self.subscriptions.pop(subscription.token, None)
+        else:
+            return self.respond(start_response, "404 Not Found")
+        start_response("200 OK", [("Content-Type", "text/plain"),
+                                  ("Content-Length", str(len(challenge)))])
+        return [challenge]
+
+    def handle_content(self, environ, start_response, subscription):
+        """Receive content for *subscription* and pass on its entries.
+
+        Content with a missing or wrong signature is acknowledged but
+        otherwise ignored, as the spec demands.
+        """
+        if subscription.mode != "active":
+            return self.respond(start_response, "404 Not Found")
+        digest = None
+        if subscription.secret is not None:
+            method, _, signature = (environ.get("HTTP_X_HUB_SIGNATURE", "")
+                                           .partition("="))
+            if method not in signature_methods:
+                return self.respond(start_response, "202 Accepted")
+            digest = hmac.new(subscription.secret,
+                              digestmod=signature_methods[method])
+        spool = SpooledTemporaryFile(self.spool_size)
+        try:
+            reader = InputReader(environ)
+            while True:
+                data = reader.read(self.chunk_size)
+                if not data:
+                    break
+                if digest is not None:
+                    digest.update(data)
+                spool.write(data)
+            if (digest is not None
+                    and not hmac.compare_digest(digest.hexdigest(),
+                                                signature.lower())):
+                return self.respond(start_response, "202 Accepted")
+            spool.seek(0)
+            compression = environ.get("HTTP_CONTENT_ENCODING")
+            if compression not in ("gzip", "deflate"):
+                compression = None
+            try:
+                entries = list(self.iter_entries(subscription, spool,
+                                                 compression))
+            except ParseError:
+                return self.respond(start_response, "400 Bad Request")
+        finally:
+            spool.close()
+        if self.seen is not None:
+            # Entries are only remembered now that the document is known
+            # to be good, so a redelivery after an error still has them.
+            entries = self.seen.filter_entries(subscription.topic, entries)
+        for entry in entries:
+            self.dispatch(subscription, entry)
+        return self.respond(start_response, "200 OK")
+
+    def iter_entries(self, subscription, source, compression=None):
+        """Iterate over the entries of the feed document in *source*.
+
+        With a :class:`SeenEntries`, only new and updated entries are
+        produced, but they aren't remembered yet.
+        """
+        if self.seen is not None:
+            return self.seen.iterparse_new(subscription.topic, source,
+                                           self.feed_class, record=False,
+                                           compression=compression)
+        return self.feed_class.iterparse_from_xml(source,
+                                                  compression=compression)
+
+    def dispatch(self, subscription, entry):
+        if self.queue is not None:
+            self.queue.put((subscription.topic, entry))
+        else:
+            self.handler(subscription.topic, entry)
+
+    def respond(self, start_response, status, headers=()):
+        """Respond with *status* and *headers* but without a body."""
+        headers = list(headers)
+        headers.append(("Content-Length", "0"))
+        start_response(status, headers)
+        return []
@@ -1,5 +1,6 @@
 """XHTML."""
 
-from atomtools.xml import define_namespace
+from atomtools.xml import define_namespace, define_tags
 
 xhtml_ns = define_namespace("xhtml", "http://www.w3.org/1999/xhtml")
+xhtml_tags = define_tags(xhtml_ns, "div")
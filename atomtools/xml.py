@@ -1,10 +1,16 @@
 """Basic XML handling."""
 
 from __future__ import absolute_import
+from hashlib import sha1
+import re
+import zlib
 from xml.etree.ElementTree import (Element, ElementTree, register_namespace,
-                                   SubElement)
+                                   SubElement, TreeBuilder, XMLParser)
+from xml.etree.ElementTree import iterparse as xml_iterparse
 from xml.etree.ElementTree import parse as xml_parse
 
+from atomtools.exceptions import ValidationError
+
 # Imports carried over. You are encouraged to import these names from here
 #
 from xml.etree.ElementTree import QName
@@ -12,11 +18,51 @@ from xml.etree.ElementTree import ParseError
 
 def define_namespace(prefix, url):
     register_namespace(prefix, url)
+    namespace_prefixes[url] = prefix
     return url
 
+namespace_prefixes = {}
+
+
+class Tags(object):
+    """The names of a namespace in Clark notation.
+
+    Each name is available as an attribute with any dashes replaced by
+    underscores and through indexing with the name as it is. The values
+    are interned strings that are created once when the namespace is
+    defined, so comparing them against element tags needs no allocation
+    at all.
+    """
+    def __init__(self, ns, names):
+        for name in names:
+            setattr(self, name.replace("-", "_"), intern_tag(ns, name))
+
+    def __getitem__(self, name):
+        return self.__dict__[name.replace("-", "_")]
+
+
+def define_tags(ns, *names):
+    """Return a :class:`Tags` object for *names* in namespace *ns*."""
+    return Tags(ns, names)
+
+
+def intern_tag(ns, name):
+    """Return the interned Clark notation tag for *name* in *ns*."""
+    key = (ns, name)
+    try:
+        return registered_tags[key]
+    except KeyError:
+        tag = registered_tags[key] = intern("{%s}%s" % (ns, name))
+        return tag
+
+registered_tags = {}
+no_tags = frozenset()
+_skipped_tags = {}
+
 # Namespaces
 #
 xml_ns = define_namespace("xml", "http://www.w3.org/XML/1998/namespace")
+xml_tags = define_tags(xml_ns, "base", "lang", "space")
 
 
 class XMLObject(object):
@@ -54,23 +100,79 @@ class XMLObject(object):
         want, you can note the errors so that :meth:`validate` can give
         specific information.
 
+        If the keyword argument *projection* is given, it is a set of
+        the names of the attributes that should be filled. Child elements
+        for all other attributes should be skipped entirely. Use
+        :meth:`get_skipped_tags` for finding out which.
+
         The implementation here in the base class simply creates the
         instance with all the collected arguments.
         """
+        kwargs.pop("projection", None)
         return cls(**kwargs)
 
     @classmethod
-    def parse_from_xml(cls, source, tag=None, parser=None):
-        """Create an instance from an XML file object."""
+    def parse_from_xml(cls, source, tag=None, parser=None, projection=None,
+                       compression=None):
+        """Create an instance from an XML file object.
+
+        If *projection* is given, only the attributes named in it are
+        filled. See :meth:`from_xml`.
+
+        If *compression* is given, *source* is decompressed on the fly.
+        See :class:`DecompressingReader` for the possible values.
+
+        The result has already been resolved via :meth:`resolve`.
+        """
         tag = tag or cls.standard_tag
-        tree = xml_parse(source, parser)
+        if compression is None:
+            tree = xml_parse(source, parser)
+        else:
+            reader = DecompressingReader(source, compression)
+            try:
+                tree = xml_parse(reader, parser)
+            finally:
+                reader.close()
         element = tree.getroot()
         if element.tag != tag:
             raise ParseError("expected '%s' element, got '%s'"
                                 % (tag, element.tag))
-        return cls.from_xml(element)
+        if projection is None:
+            result = cls.from_xml(element)
+        else:
+            result = cls.from_xml(element, projection=frozenset(projection))
+        result.resolve()
+        return result
+
+    @classmethod
+    def get_skipped_tags(cls, projection):
+        """Return the set of tags of child elements not in *projection*.
+
+        The *projection* is a set of attribute names as passed to
+        :meth:`from_xml` or ``None`` if all attributes are wanted.
+
+        In order to be able to skip child elements, add a class attribute
+        *field_tags* to your class. It should be a dictionary mapping the
+        names of your attributes to the tag of the child element they are
+        created from. As with *inner_factory*, the dictionaries of all
+        classes in the method resolution order are used.
+        """
+        if not projection:
+            return no_tags
+        key = (cls, frozenset(projection))
+        try:
+            return _skipped_tags[key]
+        except KeyError:
+            pass
+        skipped = set()
+        for type in cls.__mro__:
+            for name, tag in type.__dict__.get("field_tags", {}).iteritems():
+                if name not in projection:
+                    skipped.add(tag)
+        skipped = _skipped_tags[key] = frozenset(skipped)
+        return skipped
 
-    def validate(self, secure=True):
+    def validate(self, secure=True, fail_fast=False):
         """Validate whether the object would result in proper XML.
 
         The function returns a :class:`ValidationResult` object. Truth
@@ -82,11 +184,65 @@ class XMLObject(object):
         attribute *secure* is ``True`` (the default), it should also
         check whether the result should be considered safe, whatever that
         means.
+
+        If *fail_fast* is ``True``, validation stops at the first error
+        by raising :exc:`.atomtools.exceptions.ValidationError` instead.
+
+        The actual work happens in :meth:`check_xml`.
+        """
+        result = ValidationResult(fail_fast)
+        tag = getattr(self, "standard_tag", None)
+        if tag is None:
+            name = self.__class__.__name__
+        else:
+            name = xpath_name(tag)
+        self.check_xml(result, "/" + name, secure)
+        return result
+
+    def resolve(self, base=None, lang=None):
+        """Resolve the context of this object and all inner objects.
+
+        Some things, such as xml:base and xml:lang, apply to an element
+        and everything inside it. Since :meth:`from_xml` creates inner
+        objects before their containers, they don't know about such
+        things yet. This method passes them down the object tree once the
+        tree is complete. The *base* and *lang* are the effective values
+        for the container of the object.
+
+        The implementation here calls :meth:`resolve` for all objects in
+        attributes or lists in attributes. If you override it, do your
+        thing and call the parent implementation with the values that
+        apply to your inner objects.
+
+        :meth:`parse_from_xml` and similar methods call this for you. If
+        you know the URI of the document, you can call it again with the
+        URI as *base*.
         """
-        return ValidationResult()
+        for value in self.__dict__.itervalues():
+            if isinstance(value, XMLObject):
+                value.resolve(base, lang)
+            elif type(value) is list:
+                for item in value:
+                    if isinstance(item, XMLObject):
+                        item.resolve(base, lang)
+
+    def check_xml(self, result, path, secure=True, **kwargs):
+        """Add all the problems of this object to *result*.
+
+        The *path* is the XPath of the element for this object.
+        Implementations call the parent implementation(s) via super, add
+        their own errors via ``result.add(path, text)`` and then call
+        :meth:`check_xml` on their inner objects with an extended path.
+        This way, the entire object graph is validated in one go.
+
+        Use the keyword arguments for information an object needs from
+        its container. Swallow those you understand and pass the rest on
+        to the parent implementation.
+        """
+        pass
 
     @classmethod
-    def inner_from_xml(cls, name, sub):
+    def inner_from_xml(cls, name, sub, **kwargs):
         """Create an instance of an inner object identified by *name*.
 
         This method provides a way to change the class for inner objects
@@ -100,8 +256,8 @@ class XMLObject(object):
         methods.
 
         The method will resolve the factory function in the same way Python
-        resolves methods and will then call it with ``*args`` and
-        ``**kwargs``, returning the result. If no function for *name* can
+        resolves methods and will then call it with *sub* and ``**kwargs``,
+        returning the result. If no function for *name* can
         be found, it will raise :exc:`KeyError`.
         """
         for type in cls.__mro__:
@@ -109,7 +265,7 @@ class XMLObject(object):
                 factory = type.__dict__["inner_factory"][name]
             except KeyError: 
                 continue
-            return factory(sub)
+            return factory(sub, **kwargs)
         raise KeyError, name
 
     def create_xml(self, parent, tag=None):
@@ -149,15 +305,56 @@ class XMLObject(object):
 
     def encode(self):
         """Encode the object into a byte string."""
-        class dummy:
-            pass
-        data = []
-        file = dummy()
-        file.write = data.append
-        ElementTree(self.create_root_xml()).write(file, "utf-8", True, "xml")
-        return "".join(data)
-        element = self.create_root_xml()
-        return tostring(element)
+        return serialize_xml(self.create_root_xml(), True)
+
+    def iterencode(self):
+        """Encode the object into a sequence of byte strings.
+
+        Joining the byte strings gives a document equivalent to what
+        :meth:`encode` returns. Classes that contain potentially large
+        lists of inner objects should override this to produce their
+        output piece by piece instead of having to create the element
+        tree for the entire document first. The implementation here just
+        returns the result of :meth:`encode`.
+        """
+        yield self.encode()
+
+    def write_xml(self, file, compression=None, level=6):
+        """Write the encoded object to the file object *file*.
+
+        The output is produced piece by piece via :meth:`iterencode`. If
+        *compression* is given, it is compressed on the fly. See
+        :func:`iter_compressed` for the possible values and *level*.
+        """
+        chunks = self.iterencode()
+        if compression is not None:
+            chunks = iter_compressed(chunks, compression, level)
+        for data in chunks:
+            file.write(data)
+
+    def get_content_hash(self):
+        """Return a hash of the content of the object.
+
+        The hash is the hex digest of a SHA-1 over the canonical
+        serialization of the object, i.e., the result of :meth:`encode`
+        for its standard tag. Since that only depends on the content of
+        the object, equal objects have equal hashes no matter what the XML
+        they were parsed from looked like.
+
+        The hash is calculated only once and kept in the object. If you
+        change the object afterwards, call :meth:`clear_content_hash`.
+        """
+        try:
+            return self._content_hash
+        except AttributeError:
+            # Set via __dict__ so this works on frozen objects, too.
+            result = self.__dict__["_content_hash"] = sha1(
+                                                self.encode()).hexdigest()
+            return result
+
+    def clear_content_hash(self):
+        """Forget the hash calculated by :meth:`get_content_hash`."""
+        self.__dict__.pop("_content_hash", None)
 
     def prepare_xml(self, element):
         """Prepare this object's XML element.
@@ -174,14 +371,309 @@ class XMLObject(object):
         pass
 
 
+def iterparse_children(source, tag=None, parser=None, compression=None):
+    """Iterate over the children of the root element of *source*.
+
+    The argument *source* is a file object or file name. Yields pairs of
+    the root element and a child element as soon as the child has been
+    parsed completely. Afterwards the child is removed from the root, so
+    that only ever one child is kept in memory. Consequently, the root
+    element only contains the children not yet produced.
+
+    If *tag* is given, the root element must have this tag or
+    :exc:`ParseError` is raised.
+
+    If *compression* is given, *source* is decompressed on the fly.
+    See :class:`DecompressingReader` for the possible values.
+    """
+    reader = None
+    if compression is not None:
+        source = reader = DecompressingReader(source, compression)
+    try:
+        depth = 0
+        root = None
+        for event, element in xml_iterparse(source, ("start", "end"),
+                                            parser):
+            if event == "start":
+                if depth == 0:
+                    if tag is not None and element.tag != tag:
+                        raise ParseError("expected '%s' element, got '%s'"
+                                            % (tag, element.tag))
+                    root = element
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 1:
+                    yield root, element
+                    root.remove(element)
+    finally:
+        if reader is not None:
+            reader.close()
+
+
+# Window bits for zlib for the various kinds of compression
+#
+compression_wbits = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS,
+    "auto": 32 + zlib.MAX_WBITS,
+}
+
+
+class DecompressingReader(object):
+    """A file object decompressing the file object or file name *source*.
+
+    The *compression* is "gzip", "deflate" for the zlib format used by
+    HTTP's deflate content coding (raw deflate data is accepted, too), or
+    "auto" for either gzip or zlib format determined by the data.
+
+    Data is decompressed in chunks as it is read, so neither the
+    compressed nor the decompressed data ever needs to be in memory as a
+    whole. Concatenated gzip members are decompressed one after another.
+    Any data following the end of a zlib or raw deflate stream is
+    ignored.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, source, compression="auto"):
+        if compression not in compression_wbits:
+            raise ValueError("unknown compression %r" % compression)
+        if isinstance(source, basestring):
+            self.file = open(source, "rb")
+            self.owns_file = True
+        else:
+            self.file = source
+            self.owns_file = False
+        self.compression = compression
+        self.wbits = compression_wbits[compression]
+        self.decompressor = zlib.decompressobj(self.wbits)
+        self.started = False
+        self.finished = False
+        self.pending = ""
+        self.buffer = ""
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+
+    def read(self, size=-1):
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            data = self.decompress_chunk()
+            if data is None:
+                break
+            chunks.append(data)
+            length += len(data)
+        data = "".join(chunks)
+        if size < 0:
+            self.buffer = ""
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+    def decompress_chunk(self):
+        """Return the next piece of data or ``None`` at the end."""
+        if self.finished:
+            return None
+        decompressor = self.decompressor
+        data = decompressor.unconsumed_tail or self.pending
+        self.pending = ""
+        if not data:
+            data = self.file.read(self.chunk_size)
+        if not data:
+            self.finished = True
+            return decompressor.flush()
+        try:
+            result = decompressor.decompress(data, self.chunk_size)
+        except zlib.error, err:
+            if self.compression != "deflate" or self.started:
+                raise ParseError("broken %s data: %s" % (self.compression,
+                                                          err))
+            # Some servers send raw deflate data without zlib header.
+            self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            self.started = True
+            self.pending = data
+            return self.decompress_chunk()
+        self.started = True
+        if decompressor.unused_data:
+            if self.compression == "deflate":
+                # The stream has ended, drop whatever trails it.
+                self.finished = True
+                return result + decompressor.flush()
+            self.pending = decompressor.unused_data
+            self.decompressor = zlib.decompressobj(self.wbits)
+        return result
+
+
+def iter_compressed(chunks, compression="gzip", level=6):
+    """Compress the byte strings in *chunks* piece by piece.
+
+    The *compression* is "gzip" or "deflate" for the zlib format used by
+    HTTP's deflate content coding. The *level* is between 1 for fastest
+    and 9 for best compression.
+    """
+    if compression not in ("gzip", "deflate"):
+        raise ValueError("unknown compression %r" % compression)
+    compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                  compression_wbits[compression])
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# A start tag at the beginning of a string. Since the document is known to
+# be well-formed, this needs to care about quoted attribute values only.
+#
+start_tag_re = re.compile(r"""<([^\s/>]+)(?:\s+[^\s=/>]+\s*=\s*"""
+                          r"""(?:"[^"]*"|'[^']*'))*\s*(/?)>""")
+
+
+class SourceElement(Element):
+    """An element that remembers where in the source document it was.
+
+    The attribute *source* is the :class:`SourceBuffer` of the document,
+    *source_start* is the byte offset of the element's start tag and
+    *source_end* the byte offset of its end tag.
+    """
+    source = None
+    source_start = None
+    source_end = None
+
+    def get_source_content(self):
+        """Return the content of the element exactly as in the source.
+
+        The result is a Unicode string containing all the character data
+        and markup between start and end tag, including entity references
+        and CDATA sections. An element without children simply returns
+        its *text*. Returns ``None`` if the source isn't available.
+        """
+        if self.source is None or self.source.data is None:
+            return None
+        if len(self) == 0:
+            return self.text
+        if self.source_start is None or self.source_end is None:
+            return None
+        data = self.source.data
+        match = start_tag_re.match(data, self.source_start)
+        if match is None:
+            return None
+        content = data[match.end():self.source_end]
+        return content.decode(self.source.encoding)
+
+
+class SourceBuffer(object):
+    """The raw bytes of a document parsed by :class:`SourceParser`."""
+    def __init__(self):
+        self.data = None
+        self.encoding = "utf-8"
+
+
+class SourceParser(XMLParser):
+    """An XML parser that keeps the source of the document.
+
+    The parser creates :class:`SourceElement` objects that know the
+    location of their markup in the source document. This allows getting
+    at the content of an element exactly as it was in the source, which
+    is what :func:`atomtools.utils.flatten_xml_content` will use if it is
+    available. Use it like any other parser, for instance with
+    :meth:`XMLObject.parse_from_xml`.
+
+    The parser keeps the entire document in memory until its elements
+    are gone.
+    """
+    def __init__(self, encoding=None):
+        XMLParser.__init__(self,
+                           target=TreeBuilder(element_factory=SourceElement),
+                           encoding=encoding)
+        self.source = SourceBuffer()
+        self.chunks = []
+        expat = self._parser
+        start = expat.StartElementHandler
+        end = expat.EndElementHandler
+        def handle_start(*args):
+            element = start(*args)
+            element.source = self.source
+            element.source_start = expat.CurrentByteIndex
+            return element
+        def handle_end(*args):
+            element = end(*args)
+            element.source_end = expat.CurrentByteIndex
+            return element
+        def handle_xml_decl(version, encoding, standalone):
+            if encoding:
+                self.source.encoding = encoding
+        expat.StartElementHandler = handle_start
+        expat.EndElementHandler = handle_end
+        expat.XmlDeclHandler = handle_xml_decl
+
+    def feed(self, data):
+        self.chunks.append(data)
+        XMLParser.feed(self, data)
+
+    def close(self):
+        self.source.data = "".join(self.chunks)
+        self.chunks = []
+        return XMLParser.close(self)
+
+
+def xpath_name(tag):
+    """Return the prefixed name for *tag* for use in an XPath.
+
+    The *tag* can be in Clark notation or a :class:`QName`. The prefixes
+    are those given to :func:`define_namespace`.
+    """
+    tag = getattr(tag, "text", tag)
+    try:
+        return _xpath_names[tag]
+    except KeyError:
+        pass
+    if tag[:1] == "{":
+        ns, local = tag[1:].split("}", 1)
+        prefix = namespace_prefixes.get(ns)
+        name = local if prefix is None else "%s:%s" % (prefix, local)
+    else:
+        name = tag
+    _xpath_names[tag] = name
+    return name
+
+_xpath_names = {}
+
+
+def serialize_xml(element, xml_declaration=False):
+    """Serialize *element* into a UTF-8 encoded byte string.
+
+    If *xml_declaration* is ``True``, the string will start with an XML
+    declaration, making it a complete document.
+    """
+    class dummy:
+        pass
+    data = []
+    file = dummy()
+    file.write = data.append
+    ElementTree(element).write(file, "utf-8", xml_declaration, None, "xml")
+    return "".join(data)
+
+
 class ValidationResult(list):
     """Result of a validation run.
     
     This is essentially a list of pairs, each representing an error: The
     first item is the XPath to the faulty element, the second a textual
     description of the error.
+
+    If *fail_fast* is ``True``, adding an error raises
+    :exc:`.atomtools.exceptions.ValidationError` right away.
     """
+    def __init__(self, fail_fast=False):
+        super(ValidationResult, self).__init__()
+        self.fail_fast = fail_fast
+
     def add(self, path, text):
+        if self.fail_fast:
+            raise ValidationError("%s: %s" % (path, text))
         self.append((path, text))
 
     def update(self, result, prefix):
@@ -0,0 +1,96 @@
+"""Tests for atomtools.appclient against a wsgiref server."""
+
+from __future__ import absolute_import
+import os
+import socket
+from StringIO import StringIO
+import threading
+import unittest
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+from atomtools import appclient
+from atomtools.appclient import (AppClientError, get_entry, get_media,
+                                 get_media_url, open_media, post_media,
+                                 put_media, send_request)
+from atomtools.appserver import AppServer, MemoryStorage
+from atomtools.atompub import AppCollection
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class ChunkedReader(object):
+    """A file object that hands out its data in small, uneven pieces."""
+    def __init__(self, data):
+        self.data = StringIO(data)
+        self.reads = 0
+
+    def read(self, size):
+        self.reads += 1
+        return self.data.read(min(size, 1000 + self.reads % 7))
+
+
+class AppClientTest(unittest.TestCase):
+    def setUp(self):
+        storage = MemoryStorage()
+        storage.add_collection("media", u"Media", ["*/*"])
+        self.server = make_server("127.0.0.1", 0, AppServer(storage),
+                                  handler_class=QuietHandler)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        self.base = "http://127.0.0.1:%d/" % self.server.server_port
+        self.collection = AppCollection(href="media/")
+        self.collection.resolve(self.base)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_upload_and_download(self):
+        data = os.urandom(3 * appclient.chunk_size + 123)
+        upload = ChunkedReader(data)
+        entry = post_media(self.collection, upload, "image/png",
+                           slug=u"ph\xf6to")
+        self.assertTrue(upload.reads > 100)
+        url = get_media_url(entry, "edit-media")
+        self.assertTrue(url.startswith(self.base + "media/"))
+        self.assertEqual(get_entry(url[:-len("/media")]).id, entry.id)
+        download = StringIO()
+        self.assertEqual(get_media(entry, download), "image/png")
+        self.assertEqual(download.getvalue(), data)
+        put_media(entry, ChunkedReader("new"), "text/plain")
+        response = open_media(entry)
+        try:
+            self.assertEqual(response.getheader("Content-Type"),
+                             "text/plain")
+            self.assertEqual(response.read(2), "ne")
+            self.assertEqual(response.read(), "w")
+        finally:
+            response.close()
+
+    def test_errors(self):
+        collection = AppCollection(href="missing/")
+        collection.resolve(self.base)
+        with self.assertRaises(AppClientError) as context:
+            post_media(collection, ChunkedReader("data"), "text/plain")
+        self.assertEqual(context.exception.status, 404)
+        self.assertRaises(ValueError, send_request, "GET", "ftp://x/")
+
+    def test_timeout(self):
+        listener = socket.socket()
+        try:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen(1)
+            url = "http://127.0.0.1:%d/" % listener.getsockname()[1]
+            self.assertRaises(socket.timeout, send_request, "GET", url,
+                              timeout=0.2)
+        finally:
+            listener.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
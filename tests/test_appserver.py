@@ -0,0 +1,184 @@
+"""Tests for atomtools.appserver."""
+
+from __future__ import absolute_import
+from gzip import GzipFile
+from StringIO import StringIO
+import unittest
+
+from atomtools.appserver import AppServer, MemoryStorage, ResponseCache
+from atomtools.atompub import AppEntry, AppFeed, AppService
+from atomtools.atom import AtomText
+
+
+def call(app, method, path, body=None, **headers):
+    """Call the WSGI *app* and return status, headers, and body."""
+    environ = {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "SCRIPT_NAME": "",
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "wsgi.url_scheme": "http",
+        "wsgi.input": StringIO(body or ""),
+        "CONTENT_LENGTH": str(len(body or "")),
+    }
+    for key, value in headers.iteritems():
+        if key == "content_type":
+            environ["CONTENT_TYPE"] = value
+        else:
+            environ["HTTP_" + key.upper()] = value
+    result = {}
+    def start_response(status, headers):
+        result["status"] = status
+        result["headers"] = dict(headers)
+    data = "".join(app(environ, start_response))
+    return result["status"], result["headers"], data
+
+
+class MemoryStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.storage.add_collection("posts", u"Posts")
+        self.names = [self.storage.post_entry(
+                          "posts", AppEntry(title=AtomText(text=u"%d" % n)))
+                      for n in range(5)]
+
+    def titles(self, start=0, count=10):
+        return [entry.title.text for entry
+                in self.storage.get_entries("posts", start, count)]
+
+    def test_pages(self):
+        self.assertEqual(self.titles(), [u"4", u"3", u"2", u"1", u"0"])
+        self.assertEqual(self.titles(0, 2), [u"4", u"3"])
+        self.assertEqual(self.titles(2, 2), [u"2", u"1"])
+        self.assertEqual(self.titles(4, 2), [u"0"])
+        self.assertEqual(self.titles(5, 2), [])
+        self.assertEqual(self.storage.get_entries("other", 0, 2), [])
+
+    def test_put_and_delete(self):
+        storage = self.storage
+        storage.put_entry("posts", self.names[1],
+                          AppEntry(title=AtomText(text=u"1b")))
+        self.assertEqual(self.titles(), [u"1b", u"4", u"3", u"2", u"0"])
+        self.assertTrue(storage.delete_entry("posts", self.names[3]))
+        self.assertFalse(storage.delete_entry("posts", self.names[3]))
+        self.assertEqual(self.titles(), [u"1b", u"4", u"2", u"0"])
+        self.assertEqual(storage.get_feed("posts").updated.datetime,
+                         storage.get_entry("posts",
+                                           self.names[1]).updated.datetime)
+
+
+class AppServerTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.storage.add_collection("posts", u"Posts")
+        self.storage.add_collection("media", u"Media", ["*/*"])
+        self.app = AppServer(self.storage, page_size=2)
+
+    def post_entry(self, title):
+        entry = AppEntry(title=AtomText(text=title))
+        status, headers, body = call(self.app, "POST", "/posts/",
+                                     entry.encode(),
+                                     content_type="application/atom+xml")
+        self.assertEqual(status, "201 Created")
+        return headers, AppEntry.parse_from_xml(StringIO(body))
+
+    def test_service(self):
+        status, headers, body = call(self.app, "GET", "/")
+        self.assertEqual(status, "200 OK")
+        service = AppService.parse_from_xml(StringIO(body))
+        self.assertEqual([item.href for item
+                          in service.workspaces[0].collections],
+                         ["posts/", "media/"])
+
+    def test_service_encoded_once(self):
+        encoded = []
+        service = self.storage.get_service()
+        original = service.encode
+        def encode(*args, **kwargs):
+            encoded.append(True)
+            return original(*args, **kwargs)
+        service.encode = encode
+        status, headers, body = call(self.app, "GET", "/")
+        status, headers, body = call(self.app, "GET", "/",
+                                     if_none_match=headers["ETag"])
+        self.assertEqual(status, "304 Not Modified")
+        call(self.app, "GET", "/")
+        self.assertEqual(len(encoded), 1)
+
+    def test_post_and_page(self):
+        for n in range(3):
+            headers, entry = self.post_entry(u"Entry %d" % n)
+            self.assertTrue(headers["Location"].startswith(
+                                "http://localhost/posts/"))
+            self.assertTrue(entry.id)
+        status, headers, body = call(self.app, "GET", "/posts/")
+        feed = AppFeed.parse_from_xml(StringIO(body))
+        self.assertEqual(len(feed.entries), 2)
+        self.assertEqual(feed.get_link("next"), "/posts/?page=2")
+        status, headers, body = call(self.app, "GET", "/posts/",
+                                     if_none_match=headers["ETag"])
+        self.assertEqual(status, "304 Not Modified")
+
+    def test_media_etag_changes_on_put(self):
+        status, headers, body = call(self.app, "POST", "/media/", "one",
+                                     content_type="text/plain", slug="a")
+        self.assertEqual(status, "201 Created")
+        status, headers, body = call(self.app, "GET", "/media/a/media")
+        self.assertEqual(body, "one")
+        etag = headers["ETag"]
+        status, headers, body = call(self.app, "PUT", "/media/a/media",
+                                     "two", content_type="text/plain")
+        self.assertEqual(status, "200 OK")
+        status, headers, body = call(self.app, "GET", "/media/a/media",
+                                     if_none_match=etag)
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(body, "two")
+        self.assertNotEqual(headers["ETag"], etag)
+
+
+class CachedAppServerTest(AppServerTest):
+    def setUp(self):
+        super(CachedAppServerTest, self).setUp()
+        self.app.cache = ResponseCache()
+        for n in range(3):
+            self.post_entry(u"Entry %d" % n)
+
+    def test_etag_per_coding(self):
+        status, headers, plain = call(self.app, "GET", "/posts/")
+        self.assertNotIn("Content-Encoding", headers)
+        etag = headers["ETag"]
+        status, headers, body = call(self.app, "GET", "/posts/",
+                                     accept_encoding="gzip")
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertEqual(GzipFile(fileobj=StringIO(body)).read(), plain)
+        gzip_etag = headers["ETag"]
+        self.assertNotEqual(gzip_etag, etag)
+        for tag in etag, gzip_etag:
+            for coding in "gzip", "identity":
+                status, headers, body = call(self.app, "GET", "/posts/",
+                                             if_none_match=tag,
+                                             accept_encoding=coding)
+                self.assertEqual(status, "304 Not Modified")
+                self.assertEqual(headers["ETag"],
+                                 gzip_etag if coding == "gzip" else etag)
+
+    def test_head_builds_no_body(self):
+        original = self.storage.get_feed
+        def iterencode_page(*args, **kwargs):
+            self.fail("HEAD encoded the feed")
+        def get_feed(collection):
+            feed = original(collection)
+            feed.iterencode_page = iterencode_page
+            return feed
+        self.storage.get_feed = get_feed
+        status, headers, body = call(self.app, "HEAD", "/posts/",
+                                     accept_encoding="gzip")
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", headers)
+        self.assertEqual(body, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+"""Tests for atomtools.asoc."""
+
+from __future__ import absolute_import
+from datetime import datetime, timedelta
+from StringIO import StringIO
+import unittest
+
+from atomtools.asoc import (AsocCertificate, AsocCertificateStore, AsocPeer,
+                            AsocPeerIndex, AsocPeers, AsocPost,
+                            AsocTimeline)
+from atomtools.atom import AtomCategory, AtomDate, AtomLink
+from atomtools.xml import ParseError
+from atomtools.tzinfo import TzInfoUTC
+
+start = datetime(2012, 1, 1, tzinfo=TzInfoUTC())
+
+
+def make_post(id, minutes):
+    return AsocPost(id=id,
+                    updated=AtomDate(start + timedelta(minutes=minutes)))
+
+
+class AsocTimelineTest(unittest.TestCase):
+    def test_size(self):
+        self.assertRaises(ValueError, AsocTimeline, 0)
+        timeline = AsocTimeline(1)
+        timeline.add_posts([make_post("a", 1), make_post("b", 2)])
+        self.assertEqual([post.id for post in timeline.get_posts()], ["b"])
+
+    def test_newest_kept(self):
+        timeline = AsocTimeline(3)
+        timeline.add_posts(make_post(str(n), n) for n in range(10))
+        self.assertEqual([post.id for post in timeline.get_posts()],
+                         ["9", "8", "7"])
+
+    def test_updates_are_compacted(self):
+        timeline = AsocTimeline(10)
+        for n in range(10000):
+            timeline.add_posts([make_post(str(n % 5), n)])
+        self.assertEqual(len(timeline), 5)
+        self.assertTrue(len(timeline.heap) <= 2 * len(timeline) + 65)
+        self.assertEqual([post.id for post in timeline.get_posts()],
+                         ["4", "3", "2", "1", "0"])
+        self.assertEqual(timeline.get_posts()[0].updated.datetime,
+                         start + timedelta(minutes=9999))
+
+
+peers_document = """<peers xmlns="http://www.alipedis.com/2012/asoc"
+       xmlns:atom="http://www.w3.org/2005/Atom"
+       xml:base="http://example.com/people/">
+  <peer>
+    <atom:id>urn:alice</atom:id>
+    <uri>http://example.com/alice</uri>
+    <name>Alice</name>
+    <atom:category term="friend"/>
+    <atom:category term="work" scheme="http://example.com/s"/>
+    <atom:link rel="alternate" href="alice.html"/>
+  </peer>
+  <peer>
+    <uri>http://example.com/bob</uri>
+    <name>Bob</name>
+    <atom:category term="friend"/>
+  </peer>
+</peers>"""
+
+
+def make_peer(id, uri=None, name=None, terms=(), hrefs=()):
+    return AsocPeer(id=id, uri=uri, name=name,
+                    categories=[AtomCategory(term=term) for term in terms],
+                    links=[AtomLink(href=href) for href in hrefs])
+
+
+class AsocPeerIndexTest(unittest.TestCase):
+    def test_parse(self):
+        index = AsocPeerIndex.parse_from_xml(StringIO(peers_document))
+        self.assertEqual(len(index), 2)
+        alice = index.get("urn:alice")
+        self.assertEqual(alice.name, "Alice")
+        self.assertIs(index.get_by_uri("http://example.com/alice"), alice)
+        self.assertEqual(alice.links[0].resolved_href,
+                         "http://example.com/people/alice.html")
+        bob = index.get_by_uri("http://example.com/bob")
+        self.assertEqual(bob.name, "Bob")
+        self.assertIs(index.get("http://example.com/bob"), bob)
+
+    def test_parse_matches_tree(self):
+        peers = AsocPeers.parse_from_xml(StringIO(peers_document)).peers
+        streamed = list(AsocPeers.iterparse_from_xml(
+                            StringIO(peers_document)))
+        self.assertEqual([peer.encode() for peer in streamed],
+                         [peer.encode() for peer in peers])
+
+    def test_parse_wrong_root(self):
+        document = '<peer xmlns="http://www.alipedis.com/2012/asoc"/>'
+        self.assertRaises(ParseError, AsocPeerIndex.parse_from_xml,
+                          StringIO(document))
+
+    def test_lookup(self):
+        index = AsocPeerIndex([make_peer("a", "http://example.com/a"),
+                               make_peer(None, "http://example.com/b"),
+                               make_peer("c")])
+        self.assertTrue("a" in index)
+        self.assertTrue("http://example.com/a" in index)
+        self.assertTrue("http://example.com/b" in index)
+        self.assertFalse("b" in index)
+        self.assertEqual(index.get("b"), None)
+        self.assertEqual(index.get_by_uri("http://example.com/c"), None)
+        self.assertEqual(sorted(index.get_key(peer) for peer in index),
+                         ["a", "c", "http://example.com/b"])
+
+    def test_categories(self):
+        index = AsocPeerIndex.parse_from_xml(StringIO(peers_document))
+        self.assertEqual(sorted(peer.name for peer
+                                in index.get_by_category("friend")),
+                         ["Alice", "Bob"])
+        self.assertEqual([peer.name for peer in index.get_by_category(
+                              "work", "http://example.com/s")], ["Alice"])
+        self.assertEqual(index.get_by_category("work", "urn:other"), [])
+        self.assertEqual(index.get_by_category("enemy"), [])
+
+    def test_replace_and_remove(self):
+        index = AsocPeerIndex([make_peer("a", "http://example.com/a",
+                                         terms=["x"])])
+        index.add(make_peer("a", "http://example.com/new", terms=["y"]))
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.get_by_uri("http://example.com/a"), None)
+        self.assertEqual(index.get_by_uri("http://example.com/new").id, "a")
+        self.assertEqual(index.get_by_category("x"), [])
+        self.assertEqual(len(index.get_by_category("y")), 1)
+        index.remove("a")
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.terms, {})
+        self.assertEqual(index.uris, {})
+        self.assertRaises(KeyError, index.remove, "a")
+
+    def test_diff(self):
+        old = AsocPeerIndex([make_peer("a", name="A"),
+                             make_peer("b", terms=["x"]),
+                             make_peer("c", hrefs=["http://example.com/c"]),
+                             make_peer("d")])
+        new = AsocPeerIndex([make_peer("a", name="A"),
+                             make_peer("b", terms=["y"]),
+                             make_peer("c", hrefs=["http://example.com/d"]),
+                             make_peer("e")])
+        added, removed, changed = old.diff(new)
+        self.assertEqual([peer.id for peer in added], ["e"])
+        self.assertEqual([peer.id for peer in removed], ["d"])
+        self.assertEqual(sorted(peer.id for peer in changed), ["b", "c"])
+        self.assertIs(removed[0], old.get("d"))
+        self.assertEqual(new.diff(new), ([], [], []))
+
+
+class AsocCertificateStoreTest(unittest.TestCase):
+    def test_bad_certificate_is_skipped(self):
+        good = AsocCertificate(href="http://example.com/good", name="good",
+                               certificate="-----BEGIN CERTIFICATE-----\n"
+                                           "AAEC\n"
+                                           "-----END CERTIFICATE-----")
+        bad = AsocCertificate(href="http://example.com/bad", name="bad",
+                              certificate="AAECA")
+        store = AsocCertificateStore([bad, good])
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.get("http://example.com/good"), "\0\1\2")
+        self.assertEqual(store.get_by_name("bad"), None)
+        self.assertEqual(store.errors.keys(), ["http://example.com/bad"])
+        bad.certificate = "AAED"
+        store.update([bad, good])
+        self.assertEqual(store.get("http://example.com/bad"), "\0\1\3")
+        self.assertEqual(store.errors, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
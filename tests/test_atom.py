@@ -0,0 +1,357 @@
+"""Tests for atomtools.atom."""
+
+from __future__ import absolute_import
+import copy
+from datetime import datetime, timedelta
+from StringIO import StringIO
+import unittest
+from xml.etree.ElementTree import Element, fromstring
+
+from atomtools.atom import (atom_tags, AtomCategory, AtomContent, AtomDate,
+                            AtomEntry, AtomFeed, AtomPerson, AtomText)
+from atomtools.exceptions import ValidationError
+from atomtools.tzinfo import TzInfoUTC
+from atomtools.xhtml import xhtml_ns
+
+
+xhtml_feed = """<feed xmlns="http://www.w3.org/2005/Atom">
+  <id>urn:feed</id>
+  <title>Feed</title>
+  <updated>2012-01-01T00:00:00Z</updated>
+  <entry>
+    <id>urn:e1</id>
+    <title>One</title>
+    <updated>2012-01-01T00:00:00Z</updated>
+    <content type="xhtml">
+      <div xmlns="http://www.w3.org/1999/xhtml"><p>%s</p></div>
+    </content>
+  </entry>
+  <entry>
+    <id>urn:e2</id>
+    <title>Two</title>
+    <updated>2012-01-01T00:00:00Z</updated>
+    <content type="application/xml"><data xmlns="urn:x">2</data></content>
+  </entry>
+</feed>"""
+
+
+def parse_feed(text):
+    return AtomFeed.parse_from_xml(StringIO(text))
+
+
+class ContentHashTest(unittest.TestCase):
+    def test_xhtml_content_encodes(self):
+        feed = parse_feed(xhtml_feed % "Hello")
+        entry = AtomEntry.parse_from_xml(StringIO(feed.entries[0].encode()))
+        self.assertEqual(entry.content.type, "xhtml")
+        self.assertEqual(entry.content.content.tag, "{%s}div" % xhtml_ns)
+        self.assertEqual(entry.content.content[0].text, "Hello")
+
+    def test_xhtml_content_hash(self):
+        first = parse_feed(xhtml_feed % "Hello")
+        second = parse_feed(xhtml_feed % "Hello")
+        third = parse_feed(xhtml_feed % "Goodbye")
+        self.assertEqual(first.entries[0].get_content_hash(),
+                         second.entries[0].get_content_hash())
+        self.assertNotEqual(first.entries[0].get_content_hash(),
+                            third.entries[0].get_content_hash())
+        self.assertEqual(first.entries[1].get_content_hash(),
+                         second.entries[1].get_content_hash())
+
+    def test_diff_with_xhtml_content(self):
+        old = parse_feed(xhtml_feed % "Hello")
+        new = parse_feed(xhtml_feed % "Goodbye")
+        added, removed, changed = old.diff(new)
+        self.assertEqual(added, [])
+        self.assertEqual(removed, [])
+        self.assertEqual([entry.id for entry in changed], ["urn:e1"])
+
+
+author_feed = """<feed xmlns="http://www.w3.org/2005/Atom">
+  <id>urn:feed</id>
+  <title>Feed</title>
+  <updated>2012-01-01T00:00:00Z</updated>
+  %s
+  <entry>
+    <id>urn:e1</id>
+    <title>One</title>
+    <updated>2012-01-01T00:00:00Z</updated>
+    <link href="http://example.com/1"/>
+    <summary>One</summary>
+  </entry>
+</feed>"""
+
+
+class IterparseTest(unittest.TestCase):
+    def iterparse(self, text):
+        rejected = []
+        entries = list(AtomFeed.iterparse_from_xml(
+            StringIO(text), validate=True,
+            rejected=lambda entry, result: rejected.append(entry.id)))
+        return [entry.id for entry in entries], rejected
+
+    def test_feed_author_covers_entries(self):
+        text = author_feed % "<author><name>Feed</name></author>"
+        self.assertEqual(self.iterparse(text), (["urn:e1"], []))
+
+    def test_entry_without_author_rejected(self):
+        self.assertEqual(self.iterparse(author_feed % ""), ([], ["urn:e1"]))
+
+
+projection_feed = """<feed xmlns="http://www.w3.org/2005/Atom">
+  <id>urn:feed</id>
+  <title>Feed</title>
+  <subtitle>Sub</subtitle>
+  <updated>2012-01-01T00:00:00Z</updated>
+  <entry>
+    <id>urn:e1</id>
+    <title>One</title>
+    <updated>2012-01-02T00:00:00Z</updated>
+    <author><name>A</name></author>
+    <link href="http://example.com/1"/>
+    <category term="t"/>
+    <summary>Summary</summary>
+    <content>Content</content>
+  </entry>
+</feed>"""
+
+
+class ExplodingContent(AtomContent):
+    @classmethod
+    def from_xml(cls, element, **kwargs):
+        raise AssertionError("content should have been skipped")
+
+
+class ExplodingEntry(AtomEntry):
+    inner_factory = {
+        "content": ExplodingContent.from_xml,
+    }
+
+
+class ExplodingFeed(AtomFeed):
+    inner_factory = {
+        "entry": ExplodingEntry.from_xml,
+    }
+
+
+class ProjectionTest(unittest.TestCase):
+    def test_requested_fields(self):
+        feed = AtomFeed.parse_from_xml(StringIO(projection_feed),
+                                       projection=["id", "updated"])
+        self.assertEqual(feed.id, "urn:feed")
+        self.assertEqual(feed.title, None)
+        self.assertEqual(feed.subtitle, None)
+        entry = feed.entries[0]
+        self.assertEqual(entry.id, "urn:e1")
+        self.assertEqual(entry.updated.datetime.day, 2)
+        self.assertEqual((entry.title, entry.summary, entry.content),
+                         (None, None, None))
+        self.assertEqual((entry.authors, entry.links, entry.categories),
+                         ([], [], []))
+
+    def test_unrequested_fields_not_parsed(self):
+        feed = ExplodingFeed.parse_from_xml(StringIO(projection_feed),
+                                            projection=["id", "summary"])
+        self.assertEqual(feed.entries[0].summary.text, "Summary")
+        self.assertRaises(AssertionError, ExplodingFeed.parse_from_xml,
+                          StringIO(projection_feed))
+
+    def test_iterparse(self):
+        entries = list(AtomFeed.iterparse_from_xml(StringIO(projection_feed),
+                                                   projection=["links"]))
+        self.assertEqual(entries[0].id, None)
+        self.assertEqual(entries[0].links[0].resolved_href,
+                         "http://example.com/1")
+
+    def test_no_projection(self):
+        feed = AtomFeed.parse_from_xml(StringIO(projection_feed))
+        self.assertEqual(feed.entries[0].content.content, "Content")
+        self.assertEqual(AtomEntry.get_skipped_tags(None), frozenset())
+
+    def test_skipped_tags(self):
+        skipped = AtomEntry.get_skipped_tags(["id", "title", "content"])
+        self.assertTrue(atom_tags.summary in skipped)
+        self.assertTrue(atom_tags.link in skipped)
+        self.assertFalse(atom_tags.id in skipped)
+        self.assertFalse(atom_tags.content in skipped)
+        self.assertIs(AtomEntry.get_skipped_tags(set(["content", "title",
+                                                      "id"])), skipped)
+
+
+base_feed = """<feed xmlns="http://www.w3.org/2005/Atom"
+      xml:base="http://example.com/blog/" xml:lang="en">
+  <id>urn:feed</id>
+  <title>Feed</title>
+  <updated>2012-01-01T00:00:00Z</updated>
+  <link rel="self" href="feed.atom"/>
+  <entry xml:base="2012/">
+    <id>urn:e1</id>
+    <title xml:lang="de">Eins</title>
+    <updated>2012-01-01T00:00:00Z</updated>
+    <link href="one.html"/>
+    <link xml:base="/other/" href="../x/two.html"/>
+    <link href="http://example.org/abs"/>
+    <content src="one.txt"/>
+  </entry>
+  <entry xml:lang="fr">
+    <id>urn:e2</id>
+    <title>Deux</title>
+    <updated>2012-01-01T00:00:00Z</updated>
+    <link href="/root.html"/>
+    <source xml:base="http://example.net/feed/">
+      <link href="src.html"/>
+    </source>
+  </entry>
+</feed>"""
+
+
+class ResolveTest(unittest.TestCase):
+    def setUp(self):
+        self.feed = parse_feed(base_feed)
+
+    def test_feed(self):
+        feed = self.feed
+        self.assertEqual(feed.resolved_base, "http://example.com/blog/")
+        self.assertEqual(feed.resolved_lang, "en")
+        self.assertEqual(feed.links[0].resolved_href,
+                         "http://example.com/blog/feed.atom")
+        self.assertEqual(feed.links[0].href, "feed.atom")
+
+    def test_nested_base(self):
+        entry = self.feed.entries[0]
+        self.assertEqual(entry.resolved_base, "http://example.com/blog/2012/")
+        self.assertEqual([link.resolved_href for link in entry.links],
+                         ["http://example.com/blog/2012/one.html",
+                          "http://example.com/x/two.html",
+                          "http://example.org/abs"])
+        self.assertEqual(entry.content.resolved_src,
+                         "http://example.com/blog/2012/one.txt")
+        source = self.feed.entries[1].source
+        self.assertEqual(source.links[0].resolved_href,
+                         "http://example.net/feed/src.html")
+        self.assertEqual(self.feed.entries[1].links[0].resolved_href,
+                         "http://example.com/root.html")
+
+    def test_lang(self):
+        first, second = self.feed.entries
+        self.assertEqual(first.resolved_lang, "en")
+        self.assertEqual(first.title.resolved_lang, "de")
+        self.assertEqual(first.links[0].resolved_lang, "en")
+        self.assertEqual(second.resolved_lang, "fr")
+        self.assertEqual(second.title.resolved_lang, "fr")
+        self.assertEqual(second.source.resolved_lang, "fr")
+
+    def test_document_uri(self):
+        feed = parse_feed(base_feed.replace(
+                    'xml:base="http://example.com/blog/"', ""))
+        self.assertEqual(feed.links[0].resolved_href, "feed.atom")
+        feed.resolve("http://example.com/feeds/main")
+        self.assertEqual(feed.links[0].resolved_href,
+                         "http://example.com/feeds/feed.atom")
+        self.assertEqual(feed.entries[0].links[0].resolved_href,
+                         "http://example.com/feeds/2012/one.html")
+
+    def test_iterparse(self):
+        entries = list(AtomFeed.iterparse_from_xml(StringIO(base_feed)))
+        self.assertEqual(entries[0].links[0].resolved_href,
+                         "http://example.com/blog/2012/one.html")
+        self.assertEqual(entries[1].title.resolved_lang, "fr")
+
+
+class AtomDateTest(unittest.TestCase):
+    def parse_date(self, text):
+        element = fromstring('<updated xmlns="http://www.w3.org/2005/Atom">'
+                             '%s</updated>' % text)
+        return AtomDate.from_xml(element)
+
+    def test_offsets(self):
+        utc = datetime(2012, 1, 1, 12, 0, tzinfo=TzInfoUTC())
+        for text, delta in [("2012-01-01T12:00:00Z", 0),
+                            ("2012-01-01T12:00:00+05:30", -330),
+                            ("2012-01-01T12:00:00-05:00", 300),
+                            ("2012-01-01T12:00:00-00:30", 30)]:
+            date = self.parse_date(text)
+            self.assertEqual(date.datetime - utc, timedelta(minutes=delta))
+
+    def test_negative_offset_round_trip(self):
+        date = self.parse_date("2012-01-01T12:00:00-05:00")
+        self.assertEqual(date.datetime.utcoffset(), timedelta(hours=-5))
+        for item in date, copy.deepcopy(date):
+            element = Element("updated")
+            item.prepare_xml(element)
+            self.assertEqual(element.text, "2012-01-01T12:00:00-05:00")
+
+
+class ValidateTest(unittest.TestCase):
+    def test_text(self):
+        self.assertFalse(AtomText(text=u"Hello").validate())
+        result = AtomText(type="rtf", text=u"Hello").validate()
+        self.assertEqual(result, [("/AtomText/@type", "unknown text type")])
+
+    def test_person(self):
+        self.assertFalse(AtomPerson(name=u"A").validate())
+        self.assertEqual(AtomPerson().validate(),
+                         [("/AtomPerson/atom:name", "name is required")])
+
+    def test_date(self):
+        date = AtomDate(datetime(2012, 1, 1, tzinfo=TzInfoUTC()))
+        self.assertFalse(date.validate())
+        self.assertEqual(AtomDate().validate(),
+                         [("/AtomDate", "not a valid date")])
+        self.assertRaises(ValidationError, AtomDate().validate,
+                          fail_fast=True)
+
+    def test_standard_tag(self):
+        self.assertEqual(AtomCategory().validate(),
+                         [("/atom:category/@term", "term is required")])
+
+
+class SharedCategory(AtomCategory):
+    shared = True
+
+
+class SharedPerson(AtomPerson):
+    shared = True
+
+
+class SharedEntry(AtomEntry):
+    inner_factory = {
+        "author": SharedPerson.from_xml,
+        "category": SharedCategory.from_xml,
+    }
+
+
+class SharedFeed(AtomFeed):
+    inner_factory = {
+        "entry": SharedEntry.from_xml,
+    }
+
+
+class FlyweightTest(unittest.TestCase):
+    feed = """<feed xmlns="http://www.w3.org/2005/Atom">
+      <entry><author><name>A</name></author><category term="t"/></entry>
+      <entry><author><name>A</name></author><category term="t"/></entry>
+    </feed>"""
+
+    def test_shared_instances(self):
+        first, second = SharedFeed.parse_from_xml(StringIO(self.feed)).entries
+        self.assertIs(first.authors[0], second.authors[0])
+        self.assertIs(first.categories[0], second.categories[0])
+        category = first.categories[0]
+        self.assertTrue(category.is_frozen())
+        self.assertRaises(TypeError, setattr, category, "term", "u")
+        changed = category.copy()
+        self.assertFalse(changed.is_frozen())
+        changed.term = "u"
+        self.assertEqual((category.term, changed.term), ("t", "u"))
+
+    def test_unshared_instances(self):
+        first, second = AtomFeed.parse_from_xml(StringIO(self.feed)).entries
+        self.assertIsNot(first.categories[0], second.categories[0])
+        self.assertFalse(first.categories[0].is_frozen())
+        first.categories[0].term = "u"
+        self.assertEqual(second.categories[0].term, "t")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Tests for atomtools.parallel."""
+
+from __future__ import absolute_import
+import os
+from tempfile import mkstemp
+import unittest
+
+from atomtools.atom import AtomFeed
+from atomtools.parallel import parse_feed_parallel, scan_feed
+from atomtools.xml import ParseError
+
+
+feed_text = """<?xml version="1.0" encoding="utf-8"?>
+<!-- A feed -->
+<feed xmlns="http://www.w3.org/2005/Atom"
+      xml:base="http://example.com/feed/" xml:lang="en">
+  <id>urn:feed</id>
+  <title>Feed</title>
+  <updated>2012-01-01T00:00:00Z</updated>
+  <link rel="self" href="feed.atom"/>
+  %s
+  <author><name>A</name></author>
+</feed>
+"""
+
+entry_text = """<entry%s>
+    <id>urn:e%d</id>
+    <title>Entry %d</title>
+    <updated>2012-01-01T00:00:00Z</updated>
+    <link href="%d.html"/>
+    <summary type="html">&lt;p&gt;Entry&lt;/p&gt; %d</summary>
+  </entry>
+  <!-- comment after %d -->
+  <?pi after %d?>"""
+
+
+def make_entry(n):
+    if n % 3 == 1:
+        attrs = ' xml:base="sub/%d/"' % n
+    elif n % 3 == 2:
+        attrs = ' xml:lang="de"'
+    else:
+        attrs = ""
+    return entry_text % (attrs, n, n, n, n, n, n)
+
+
+class ParallelTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.filename = mkstemp(suffix=".atom")
+        with os.fdopen(fd, "wb") as file:
+            file.write(feed_text % "\n  ".join(make_entry(n)
+                                               for n in range(50)))
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def assertSameFeed(self, result):
+        with open(self.filename, "rb") as file:
+            expected = AtomFeed.parse_from_xml(file)
+        self.assertEqual(result.encode(), expected.encode())
+        self.assertEqual(result.links[0].resolved_href,
+                         "http://example.com/feed/feed.atom")
+        for entry, other in zip(result.entries, expected.entries):
+            self.assertEqual(entry.links[0].resolved_href,
+                             other.links[0].resolved_href)
+            self.assertEqual(entry.resolved_lang, other.resolved_lang)
+        self.assertEqual(result.entries[1].links[0].resolved_href,
+                         "http://example.com/feed/sub/1/1.html")
+        self.assertEqual(result.entries[2].summary.resolved_lang, "de")
+
+    def test_scan(self):
+        layout = scan_feed(self.filename)
+        self.assertEqual(len(layout.entries), 50)
+        self.assertEqual(len(layout.others), 5)
+        self.assertTrue(layout.prolog.endswith("<!-- A feed -->\n"))
+        self.assertEqual(layout.root_end, "</feed>")
+
+    def test_single_chunk(self):
+        self.assertSameFeed(parse_feed_parallel(self.filename))
+
+    def test_chunks_in_process(self):
+        self.assertSameFeed(parse_feed_parallel(self.filename, processes=1,
+                                                chunk_size=1000))
+
+    def test_chunks_in_workers(self):
+        self.assertSameFeed(parse_feed_parallel(self.filename, processes=2,
+                                                chunk_size=1000))
+
+    def test_wrong_root(self):
+        self.assertRaises(ParseError, scan_feed, self.filename,
+                          "{http://www.w3.org/2005/Atom}entry")
+
+
+if __name__ == "__main__":
+    unittest.main()
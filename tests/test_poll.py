@@ -0,0 +1,242 @@
+"""Tests for atomtools.poll."""
+
+from __future__ import absolute_import
+from datetime import datetime, timedelta
+import unittest
+
+from atomtools.atom import AtomDate, AtomEntry, AtomFeed
+from atomtools.poll import PollScheduler, SimulatedClock
+from atomtools.tzinfo import TzInfoUTC
+
+
+start = datetime(2012, 1, 1, tzinfo=TzInfoUTC())
+epoch = datetime(1970, 1, 1, tzinfo=TzInfoUTC())
+url = "http://example.com/feed"
+
+
+def make_feed(*hours):
+    """Return a feed with an entry for each of *hours* after *start*."""
+    return AtomFeed(entries=[
+        AtomEntry(id="urn:e%d" % n,
+                  updated=AtomDate(start + timedelta(hours=hour)))
+        for n, hour in enumerate(hours)])
+
+
+def at_hours(hours):
+    """Return the time *hours* after *start* in seconds since the epoch."""
+    return (start - epoch).total_seconds() + hours * 3600
+
+
+class PollSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = SimulatedClock(at_hours(10))
+        self.scheduler = PollScheduler(clock=self.clock,
+                                       random=lambda: 0.5)
+
+    def poll(self, feed):
+        self.assertEqual(self.scheduler.get_due(), [url])
+        self.scheduler.record_feed(url, feed)
+        return self.scheduler.get_state(url)
+
+    def test_new_feed_due_now(self):
+        self.scheduler.add(url)
+        self.assertEqual(self.scheduler.get_next_time(), self.clock())
+        self.assertEqual(self.scheduler.get_due(), [url])
+        self.assertEqual(self.scheduler.get_due(), [])
+        self.assertEqual(self.scheduler.get_next_time(),
+                         self.clock() + PollScheduler.initial_interval)
+
+    def test_initial_rate(self):
+        self.scheduler.add(url)
+        state = self.poll(make_feed(0, 2, 4, 6, 8))
+        self.assertAlmostEqual(state.rate, 1 / 7200.0)
+        self.assertAlmostEqual(state.interval, 7200)
+        self.assertAlmostEqual(state.due, self.clock() + 7200)
+        self.assertEqual(state.newest, at_hours(8))
+
+    def test_initial_rate_clamped(self):
+        self.scheduler.add(url)
+        state = self.poll(make_feed(*[n / 600.0 for n in range(10)]))
+        self.assertEqual(state.interval, PollScheduler.min_interval)
+
+    def test_single_entry_keeps_initial_interval(self):
+        self.scheduler.add(url)
+        state = self.poll(make_feed(0))
+        self.assertEqual(state.rate, None)
+        self.assertEqual(state.interval, PollScheduler.initial_interval)
+
+    def test_new_entries_update_rate(self):
+        self.scheduler.add(url)
+        state = self.poll(make_feed(0, 2, 4, 6, 8))
+        self.clock.advance(7200)
+        state = self.poll(make_feed(2, 4, 6, 8, 10.5, 11, 11.5, 12))
+        sample = 4 / 7200.0
+        expected = 1 / 7200.0 + PollScheduler.smoothing * (sample
+                                                           - 1 / 7200.0)
+        self.assertAlmostEqual(state.rate, expected)
+        self.assertAlmostEqual(state.interval, 1 / expected)
+        self.assertEqual(state.newest, at_hours(12))
+
+    def test_not_modified(self):
+        scheduler = self.scheduler
+        scheduler.add(url)
+        state = self.poll(make_feed(0, 2, 4, 6, 8))
+        rates = [state.rate]
+        intervals = [state.interval]
+        for n in range(5):
+            self.clock.advance(state.due - self.clock())
+            self.assertEqual(scheduler.get_due(), [url])
+            scheduler.record_not_modified(url)
+            rates.append(state.rate)
+            intervals.append(state.interval)
+        # Each 304 shrinks the estimated rate, so the feed is polled less
+        # often until the maximum interval is reached.
+        self.assertEqual(rates, sorted(rates, reverse=True))
+        self.assertAlmostEqual(rates[1], rates[0] * (1 - scheduler.smoothing))
+        self.assertEqual(intervals, sorted(intervals))
+        self.assertTrue(intervals[-1] > intervals[0])
+        self.assertTrue(intervals[-1] <= scheduler.max_interval)
+
+    def test_conditional_headers(self):
+        scheduler = self.scheduler
+        scheduler.add(url)
+        self.assertEqual(scheduler.get_request_headers(url), {})
+        scheduler.get_due()
+        scheduler.record_feed(url, make_feed(0), '"x"', "Sun, 01 Jan 2012")
+        self.assertEqual(scheduler.get_request_headers(url),
+                         {"If-None-Match": '"x"',
+                          "If-Modified-Since": "Sun, 01 Jan 2012"})
+
+    def test_backoff(self):
+        scheduler = self.scheduler
+        scheduler.add(url)
+        state = scheduler.get_state(url)
+        delays = []
+        for n in range(8):
+            self.clock.advance(state.due - self.clock())
+            self.assertEqual(scheduler.get_due(), [url])
+            scheduler.record_failure(url)
+            delays.append(state.due - self.clock())
+        initial = scheduler.initial_interval
+        self.assertEqual(delays[:4], [initial * 2, initial * 4,
+                                      initial * 8, initial * 16])
+        self.assertEqual(delays[-1], scheduler.max_interval)
+        self.clock.advance(state.due - self.clock())
+        scheduler.get_due()
+        scheduler.record_feed(url, make_feed(0))
+        self.assertEqual(state.failures, 0)
+        self.assertEqual(state.due - self.clock(), initial)
+
+    def test_long_failure_run(self):
+        scheduler = self.scheduler
+        other = "%s/other" % url
+        scheduler.add(url)
+        state = scheduler.get_state(url)
+        for n in range(5000):
+            self.clock.advance(state.due - self.clock())
+            self.assertEqual(scheduler.get_due(), [url])
+            scheduler.record_failure(url)
+        self.assertEqual(state.failures, 5000)
+        self.assertEqual(state.due - self.clock(), scheduler.max_interval)
+        # Other feeds are still served.
+        scheduler.add(other)
+        self.assertEqual(scheduler.get_due(), [other])
+
+    def test_backoff_below_one(self):
+        scheduler = PollScheduler(clock=self.clock, random=lambda: 0.5,
+                                  backoff=0.5)
+        scheduler.add(url)
+        state = scheduler.get_state(url)
+        for n in range(2000):
+            scheduler.get_due()
+            scheduler.record_failure(url)
+        self.assertEqual(state.due, self.clock())
+
+    def test_retry_after(self):
+        scheduler = self.scheduler
+        scheduler.add(url)
+        scheduler.get_due()
+        scheduler.record_failure(url, retry_after=10 * 3600)
+        state = scheduler.get_state(url)
+        self.assertEqual(state.due - self.clock(), 10 * 3600)
+        scheduler.get_due()
+        # A short Retry-After doesn't undercut the backoff.
+        scheduler.record_failure(url, retry_after=60)
+        self.assertEqual(state.due - self.clock(),
+                         scheduler.initial_interval * 4)
+
+    def test_jitter(self):
+        values = iter([0.0, 0.999999, 0.25])
+        scheduler = PollScheduler(clock=self.clock,
+                                  random=lambda: next(values))
+        interval = scheduler.initial_interval
+        for low, high in [(0.9, 0.9), (1.0999, 1.1), (0.95, 0.95)]:
+            scheduler.add(url, self.clock())
+            scheduler.get_due()
+            scheduler.record_feed(url, make_feed(0))
+            delay = scheduler.get_state(url).due - self.clock()
+            self.assertTrue(interval * low <= delay <= interval * high,
+                            delay)
+
+    def test_jitter_bounds(self):
+        scheduler = PollScheduler(clock=self.clock)
+        for n in range(200):
+            scheduler.add("%s/%d" % (url, n))
+        scheduler.get_due()
+        for n in range(200):
+            scheduler.record_not_modified("%s/%d" % (url, n))
+        interval = scheduler.initial_interval
+        delays = [scheduler.get_state("%s/%d" % (url, n)).due - self.clock()
+                  for n in range(200)]
+        self.assertTrue(min(delays) >= interval * (1 - scheduler.jitter))
+        self.assertTrue(max(delays) <= interval * (1 + scheduler.jitter))
+        self.assertTrue(len(set(delays)) > 1)
+
+    def test_due_order_and_limit(self):
+        scheduler = self.scheduler
+        now = self.clock()
+        for n, offset in enumerate([30, 10, 50, 20, 40]):
+            scheduler.add("%s/%d" % (url, n), now - offset)
+        scheduler.add("%s/later" % url, now + 10)
+        self.assertEqual(scheduler.get_due(limit=2),
+                         ["%s/2" % url, "%s/4" % url])
+        self.assertEqual(scheduler.get_due(),
+                         ["%s/0" % url, "%s/3" % url, "%s/1" % url])
+        self.assertEqual(scheduler.get_due(), [])
+        self.assertEqual(scheduler.get_next_time(), now + 10)
+
+    def test_add_moves_due(self):
+        scheduler = self.scheduler
+        now = self.clock()
+        scheduler.add(url, now + 100)
+        scheduler.add(url)
+        self.assertEqual(scheduler.get_next_time(), now + 100)
+        scheduler.add(url, now + 50)
+        self.assertEqual(scheduler.get_next_time(), now + 50)
+        self.assertEqual(len(scheduler.heap), 2)
+
+    def test_remove(self):
+        scheduler = self.scheduler
+        now = self.clock()
+        scheduler.add("%s/a" % url, now - 10)
+        scheduler.add("%s/b" % url, now - 5)
+        scheduler.remove("%s/a" % url)
+        self.assertFalse("%s/a" % url in scheduler)
+        self.assertEqual(scheduler.get_next_time(), now - 5)
+        self.assertEqual(scheduler.get_due(), ["%s/b" % url])
+
+    def test_remove_drops_stale_entries(self):
+        scheduler = self.scheduler
+        now = self.clock()
+        for n in range(1000):
+            scheduler.add("%s/%d" % (url, n), now - n)
+        for n in range(1, 1000):
+            scheduler.remove("%s/%d" % (url, n))
+        self.assertEqual(len(scheduler), 1)
+        self.assertTrue(len(scheduler.heap) <= 2 * len(scheduler) + 64)
+        self.assertEqual(scheduler.get_due(), ["%s/0" % url])
+        self.assertEqual(scheduler.get_due(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
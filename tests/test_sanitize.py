@@ -0,0 +1,101 @@
+"""Tests for atomtools.sanitize."""
+
+from __future__ import absolute_import
+import unittest
+from xml.etree.ElementTree import fromstring
+
+from atomtools.sanitize import SanitizePolicy
+from atomtools.utils import to_xml_string
+from atomtools.xhtml import xhtml_ns
+
+
+def xhtml(markup):
+    return fromstring('<div xmlns="%s">%s</div>' % (xhtml_ns, markup))
+
+
+class SanitizeHTMLTest(unittest.TestCase):
+    def test_dropped_void_element(self):
+        policy = SanitizePolicy(drop_elements=["img", "script"])
+        self.assertEqual(policy.sanitize_html('<img src="a"/>after'),
+                         u"after")
+        self.assertEqual(policy.sanitize_html('<img src="a">after'),
+                         u"after")
+        self.assertEqual(policy.sanitize_html(
+                             '<img src="a"/><script>x</script>after'),
+                         u"after")
+
+    def test_stray_void_end_tag(self):
+        policy = SanitizePolicy(drop_elements=["img", "object"])
+        self.assertEqual(policy.sanitize_html(
+                             '<object></img>secret</object>after'),
+                         u"after")
+
+    def test_self_closing_dropped_element(self):
+        policy = SanitizePolicy()
+        self.assertEqual(policy.sanitize_html('<p>a<iframe/>b</p>'),
+                         u"<p>ab</p>")
+
+    def test_event_handler_attributes(self):
+        policy = SanitizePolicy()
+        self.assertEqual(policy.sanitize_html(
+                             '<p onclick="evil()" title="t">x</p>'),
+                         u'<p title="t">x</p>')
+
+    def test_javascript_url(self):
+        policy = SanitizePolicy()
+        self.assertEqual(policy.sanitize_html(
+                             '<a href="javascript:evil()">x</a>'
+                             '<a href=" JavaScript:evil()">y</a>'
+                             '<a href="http://example.com/">z</a>'),
+                         u'<a>x</a><a>y</a>'
+                         u'<a href="http://example.com/">z</a>')
+
+    def test_dropped_element(self):
+        policy = SanitizePolicy()
+        self.assertEqual(policy.sanitize_html(
+                             '<p>a<script>evil()</script><font>b</font></p>'),
+                         u"<p>ab</p>")
+
+    def test_stray_end_tags(self):
+        policy = SanitizePolicy()
+        self.assertEqual(policy.sanitize_html('</div></td><p>x'),
+                         u"<p>x</p>")
+        self.assertEqual(policy.sanitize_html('<p>x</p></p></div>'),
+                         u"<p>x</p>")
+
+    def test_unclosed_elements(self):
+        policy = SanitizePolicy()
+        self.assertEqual(policy.sanitize_html('<b>x'), u"<b>x</b>")
+        self.assertEqual(policy.sanitize_html('<div><p><b>x</div>y'),
+                         u"<div><p><b>x</b></p></div>y")
+
+    def test_misnested_elements(self):
+        policy = SanitizePolicy()
+        self.assertEqual(policy.sanitize_html('<b><i>x</b>y</i>'),
+                         u"<b><i>x</i></b>y")
+
+    def test_self_closing_element(self):
+        policy = SanitizePolicy()
+        self.assertEqual(policy.sanitize_html('<p>a<span/>b<br/></p>'),
+                         u"<p>a<span></span>b<br></p>")
+
+
+class SanitizeXMLTest(unittest.TestCase):
+    def test_cache_distinguishes_trees(self):
+        policy = SanitizePolicy()
+        first = policy.sanitize_xml(xhtml('<p>a<b>b</b></p>'))
+        second = policy.sanitize_xml(xhtml('<p>a</p><b>b</b>'))
+        third = policy.sanitize_xml(xhtml('<p title="x">a<b>b</b></p>'))
+        self.assertNotEqual(to_xml_string(first), to_xml_string(second))
+        self.assertNotEqual(to_xml_string(first), to_xml_string(third))
+
+    def test_cache_ignores_tail(self):
+        policy = SanitizePolicy()
+        first = xhtml('<p>a<script>x</script></p>')
+        second = xhtml('<p>a<script>x</script></p>')
+        second.tail = "\n  "
+        self.assertIs(policy.sanitize_xml(first), policy.sanitize_xml(second))
+
+
+if __name__ == "__main__":
+    unittest.main()
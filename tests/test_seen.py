@@ -0,0 +1,49 @@
+"""Tests for atomtools.seen."""
+
+from __future__ import absolute_import
+from StringIO import StringIO
+import unittest
+
+from atomtools.atom import AtomFeed
+from atomtools.seen import get_entry_key, SeenEntries
+
+
+feed = """<feed xmlns="http://www.w3.org/2005/Atom">
+  <id>urn:feed</id>
+  <title>Feed</title>
+  <updated>2012-01-01T00:00:00Z</updated>
+  <entry>
+    <id>
+      urn:e1
+    </id>
+    <title>One</title>
+    <updated>2012-01-01T00:00:00Z</updated>
+  </entry>
+  <entry>
+    <id>urn:e2</id>
+    <title>Two</title>
+    <updated>2012-01-01T00:00:00Z</updated>
+  </entry>
+</feed>"""
+
+
+class SeenEntriesTest(unittest.TestCase):
+    def test_key_ignores_whitespace(self):
+        self.assertEqual(get_entry_key("f", "\n  urn:e1 "),
+                         get_entry_key("f", u"urn:e1"))
+
+    def test_paths_agree(self):
+        entries = AtomFeed.parse_from_xml(StringIO(feed)).entries
+        seen = SeenEntries()
+        self.assertEqual(len(list(seen.filter_entries("f", entries))), 2)
+        self.assertEqual(list(seen.iterparse_new("f", StringIO(feed))), [])
+        seen = SeenEntries()
+        self.assertEqual(len(list(seen.iterparse_new("f", StringIO(feed)))),
+                         2)
+        self.assertEqual(list(seen.filter_entries("f", entries)), [])
+        for entry in entries:
+            self.assertFalse(seen.is_new("f", entry.id, entry.updated))
+
+
+if __name__ == "__main__":
+    unittest.main()
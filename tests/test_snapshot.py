@@ -0,0 +1,162 @@
+"""Tests for atomtools.snapshot."""
+
+from __future__ import absolute_import
+from StringIO import StringIO
+from tempfile import TemporaryFile
+import unittest
+
+from atomtools.atom import AtomEntry
+from atomtools.snapshot import (Decoder, dumps, header_format, loads,
+                                SnapshotError, SnapshotReader,
+                                write_snapshot)
+from atomtools.thr import ThrFeed
+
+
+feed_text = """<feed xmlns="http://www.w3.org/2005/Atom"
+      xmlns:thr="http://purl.org/syndication/thread/1.0">
+  <id>urn:feed</id>
+  <title type="html">The &lt;b&gt;Feed&lt;/b&gt;</title>
+  <updated>2012-01-02T00:00:00.25+05:30</updated>
+  <author><name>A</name><uri>http://example.com/a</uri></author>
+  <category term="t" scheme="http://example.com/s"/>
+  %s
+</feed>"""
+
+entry_text = """<entry>
+    <id>urn:e%d</id>
+    <title>Entry %d</title>
+    <updated>2012-01-01T12:00:00-05:00</updated>
+    <link rel="replies" href="http://example.com/%d/replies" thr:count="3"/>
+    <thr:in-reply-to ref="urn:e0"/>
+    <content type="xhtml">
+      <div xmlns="http://www.w3.org/1999/xhtml"><p>Entry <b>%d</b></p></div>
+    </content>
+  </entry>"""
+
+
+def make_feed(count=10):
+    text = feed_text % "\n  ".join(entry_text % (n, n, n, n)
+                                   for n in range(count))
+    return ThrFeed.parse_from_xml(StringIO(text))
+
+
+def write_file(feed):
+    file = TemporaryFile()
+    write_snapshot(feed, file)
+    file.flush()
+    file.seek(0)
+    return file
+
+
+class ForeignEntry(AtomEntry):
+    pass
+
+
+class Evil(object):
+    def __reduce__(self):
+        return (eval, ("1",))
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_dumps(self):
+        feed = make_feed()
+        result = loads(dumps(feed))
+        self.assertIs(type(result), ThrFeed)
+        self.assertEqual(result.encode(), feed.encode())
+
+    def test_write_snapshot(self):
+        feed = make_feed()
+        reader = SnapshotReader(write_file(feed))
+        try:
+            self.assertEqual(reader.load().encode(), feed.encode())
+        finally:
+            reader.close()
+
+    def test_empty_feed(self):
+        feed = make_feed(0)
+        reader = SnapshotReader(write_file(feed))
+        try:
+            self.assertEqual(len(reader), 0)
+            self.assertEqual(reader.load().encode(), feed.encode())
+        finally:
+            reader.close()
+
+    def test_pickled_values(self):
+        entry = AtomEntry(id="urn:e")
+        entry.extra = set(["a", "b"])
+        self.assertEqual(loads(dumps(entry)).extra, set(["a", "b"]))
+
+
+class SnapshotReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.feed = make_feed()
+        self.reader = SnapshotReader(write_file(self.feed))
+
+    def tearDown(self):
+        self.reader.close()
+
+    def test_random_access(self):
+        reader = self.reader
+        self.assertEqual(len(reader), 10)
+        self.assertEqual(reader[5].id, "urn:e5")
+        self.assertEqual(reader[-1].id, "urn:e9")
+        self.assertEqual(reader[0].id, "urn:e0")
+        self.assertEqual(reader[3].encode(), self.feed.entries[3].encode())
+        self.assertRaises(IndexError, reader.__getitem__, 10)
+        self.assertRaises(IndexError, reader.__getitem__, -11)
+        self.assertEqual([entry.id for entry in reader],
+                         ["urn:e%d" % n for n in range(10)])
+
+    def test_header(self):
+        header = self.reader.get_header()
+        self.assertEqual(header.id, "urn:feed")
+        self.assertEqual(header.entries, [])
+
+
+class BrokenSnapshotTest(unittest.TestCase):
+    def open(self, data):
+        file = TemporaryFile()
+        file.write(data)
+        file.flush()
+        file.seek(0)
+        return SnapshotReader(file)
+
+    def test_not_a_snapshot(self):
+        self.assertRaises(SnapshotError, loads, "")
+        self.assertRaises(SnapshotError, loads, "<feed/>")
+        self.assertRaises(SnapshotError, self.open, "not a snapshot at all")
+
+    def test_wrong_version(self):
+        data = dumps(AtomEntry(id="urn:e"))
+        data = header_format.pack("ATSN", 99, 0) + data[header_format.size:]
+        self.assertRaises(SnapshotError, loads, data)
+
+    def test_truncated(self):
+        data = dumps(AtomEntry(id="urn:e"))
+        self.assertRaises(SnapshotError, loads, data[:header_format.size])
+        self.assertRaises(SnapshotError, loads, data[:-3])
+        data = write_file(make_feed()).read()
+        for size in (header_format.size, len(data) // 2, len(data) - 1):
+            self.assertRaises(SnapshotError, self.open, data[:size])
+
+
+class TrustTest(unittest.TestCase):
+    def test_foreign_class(self):
+        data = dumps(ForeignEntry(id="urn:e"))
+        self.assertRaises(SnapshotError, loads, data)
+        entry = loads(data, trusted_modules=[__name__])
+        self.assertIs(type(entry), ForeignEntry)
+
+    def test_forged_class_name(self):
+        for name in ("os.system", "atomtools.xml.xpath_name",
+                     "atomtools.missing.Class"):
+            self.assertRaises(SnapshotError, Decoder, [name])
+
+    def test_forged_pickle(self):
+        entry = AtomEntry(id="urn:e")
+        entry.extra = Evil()
+        self.assertRaises(SnapshotError, loads, dumps(entry))
+
+
+if __name__ == "__main__":
+    unittest.main()
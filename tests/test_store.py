@@ -0,0 +1,94 @@
+"""Tests for atomtools.store."""
+
+from __future__ import absolute_import
+from datetime import datetime, timedelta
+import unittest
+
+from atomtools.atom import (AtomCategory, AtomDate, AtomEntry, AtomLink,
+                            AtomText)
+from atomtools.store import EntryStore
+
+
+def make_entry(id, minutes=None, terms=(), links=()):
+    entry = AtomEntry(id=id, title=AtomText(text=id))
+    if minutes is not None:
+        entry.updated = AtomDate(datetime(2012, 1, 1)
+                                 + timedelta(minutes=minutes))
+    entry.categories = [AtomCategory(term=term) for term in terms]
+    entry.links = [AtomLink(href=href) for href in links]
+    return entry
+
+
+class EntryStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = EntryStore(":memory:")
+        self.store.add_entries(
+            [make_entry("urn:%02d" % n, n // 2 if n < 20 else None,
+                        ["even" if n % 2 == 0 else "odd", "all"],
+                        ["http://example.com/%d" % (n % 3)])
+             for n in range(24)])
+        self.order = (["urn:%02d" % n for n in range(19, -1, -1)]
+                      + ["urn:23", "urn:22", "urn:21", "urn:20"])
+
+    def tearDown(self):
+        self.store.close()
+
+    def ids(self, entries):
+        return [entry.id for entry in entries]
+
+    def test_order(self):
+        self.assertEqual(self.ids(self.store.get_entries()), self.order)
+        self.assertEqual(self.ids(self.store.get_entries(limit=5, offset=3)),
+                         self.order[3:8])
+
+    def test_filters_return_each_entry_once(self):
+        self.assertEqual(self.ids(self.store.get_by_category("all")),
+                         self.order)
+        self.assertEqual(self.ids(self.store.get_by_category("odd")),
+                         [id for id in self.order if int(id[4:]) % 2])
+        links = self.ids(self.store.get_by_link("alternate",
+                                                "http://example.com/1"))
+        self.assertEqual(links, [id for id in self.order
+                                 if int(id[4:]) % 3 == 1])
+
+    def page_through(self, query, size):
+        result = []
+        start = None
+        while True:
+            page = list(query(limit=size, start=start))
+            result.extend(page)
+            if len(page) < size:
+                return self.ids(result)
+            start = self.store.get_key(page[-1])
+
+    def test_keyset_paging(self):
+        for size in 1, 3, 7, 100:
+            self.assertEqual(self.page_through(self.store.get_entries, size),
+                             self.order)
+            self.assertEqual(self.page_through(
+                                 lambda **kwargs: self.store.get_by_category(
+                                     "even", **kwargs), size),
+                             [id for id in self.order
+                              if int(id[4:]) % 2 == 0])
+
+    def test_start_with_offset(self):
+        start = self.store.get_key(self.store.get("urn:05"))
+        self.assertEqual(self.ids(self.store.get_entries(start=start)),
+                         self.order[15:])
+        self.assertEqual(self.ids(self.store.get_entries(start=start,
+                                                         offset=2, limit=4)),
+                         self.order[17:21])
+        self.assertEqual(self.ids(self.store.get_entries(start=start,
+                                                         offset=6)),
+                         self.order[21:])
+
+    def test_query_plan(self):
+        plan = " ".join(row[-1] for row in self.store.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT entries.data FROM entries "
+            "ORDER BY entries.updated DESC, entries.id DESC LIMIT 20"))
+        self.assertIn("entries_updated_id", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+"""Tests for atomtools.thr."""
+
+from __future__ import absolute_import
+from StringIO import StringIO
+import unittest
+
+from atomtools.thr import (thr_ns, ThrEntry, ThrFeed, ThrIndex, ThrInReplyTo,
+                           ThrLink)
+from atomtools.xhtml import xhtml_ns
+
+
+thread_feed = """<feed xmlns="http://www.w3.org/2005/Atom"
+      xmlns:thr="http://purl.org/syndication/thread/1.0">
+  <id>urn:feed</id>
+  <title>Thread</title>
+  <updated>2012-01-02T00:00:00Z</updated>
+  <entry>
+    <id>urn:post</id>
+    <title>Post</title>
+    <updated>2012-01-01T00:00:00Z</updated>
+    <link rel="replies" href="http://example.com/post/replies"
+          type="application/atom+xml" thr:count="2"
+          thr:updated="2012-01-02T00:00:00Z"/>
+    <thr:total>5</thr:total>
+    <content type="xhtml">
+      <div xmlns="http://www.w3.org/1999/xhtml"><p>A <b>post</b>.</p></div>
+    </content>
+  </entry>
+  <entry>
+    <id>urn:reply</id>
+    <title>Reply</title>
+    <updated>2012-01-02T00:00:00Z</updated>
+    <thr:in-reply-to ref="urn:post" href="http://example.com/post"
+                     type="text/html" source="http://example.com/feed"/>
+    <thr:in-reply-to ref="urn:other"/>
+    <content>Me too.</content>
+  </entry>
+</feed>"""
+
+
+def round_trip(obj):
+    """Encode *obj* and parse the result again with the same class."""
+    return obj.parse_from_xml(StringIO(obj.encode()))
+
+
+def make_entry(id, parent=None):
+    in_reply_tos = [] if parent is None else [ThrInReplyTo(ref=parent)]
+    return ThrEntry(id=id, in_reply_tos=in_reply_tos)
+
+
+class ThrIndexTest(unittest.TestCase):
+    def test_tree(self):
+        index = ThrIndex([make_entry("c", "b"), make_entry("a"),
+                          make_entry("b", "a"), make_entry("d", "a")])
+        self.assertEqual(index.get_replies("a"), ["b", "d"])
+        self.assertEqual(index.get_count("a"), 2)
+        self.assertEqual(index.get_total("a"), 3)
+        self.assertEqual(index.get_total("b"), 1)
+        self.assertEqual(index.get_total("c"), 0)
+        self.assertEqual([(depth, entry.id) for depth, entry
+                          in index.iter_flat()],
+                         [(0, "a"), (1, "b"), (2, "c"), (1, "d")])
+
+    def test_totals_follow_additions(self):
+        index = ThrIndex([make_entry("a"), make_entry("b", "a")])
+        self.assertEqual(index.get_total("a"), 1)
+        index.add(make_entry("c", "b"))
+        self.assertEqual(index.get_total("a"), 2)
+
+    def test_totals_of_ancestors(self):
+        index = ThrIndex([make_entry("a"), make_entry("b", "a"),
+                          make_entry("x")])
+        self.assertEqual(index.get_total("a"), 1)
+        self.assertEqual(index.get_total("x"), 0)
+        # An orphan subtree joins once its parent arrives.
+        index.add(make_entry("d", "c"))
+        index.add(make_entry("e", "d"))
+        self.assertEqual(index.get_total("c"), 2)
+        index.add(make_entry("c", "b"))
+        self.assertEqual(index.get_total("a"), 4)
+        self.assertEqual(index.get_total("b"), 3)
+        self.assertEqual(index.get_total("x"), 0)
+        index.add(make_entry("f", "e"))
+        self.assertEqual([index.get_total(id) for id in "abcdef"],
+                         [5, 4, 3, 2, 1, 0])
+
+    def test_many_queries(self):
+        count = 20000
+        index = ThrIndex([make_entry(0)])
+        for n in xrange(1, count):
+            index.add(make_entry(n, n // 2))
+            self.assertEqual(index.get_total(0), n)
+        self.assertEqual(index.get_total(1), count - 2)
+
+    def test_cycle(self):
+        index = ThrIndex()
+        index.add(make_entry("a", "b"))
+        index.add(make_entry("b", "a"))
+        index.add(make_entry("c", "a"))
+        self.assertEqual(index.get_parent("a"), "b")
+        self.assertEqual(index.get_parent("b"), None)
+        self.assertEqual(index.get_total("b"), 2)
+        self.assertEqual(sorted(entry.id for depth, entry
+                                in index.iter_flat()), ["a", "b", "c"])
+
+    def test_self_reply(self):
+        index = ThrIndex([make_entry("a", "a")])
+        self.assertEqual(index.get_parent("a"), None)
+        self.assertEqual(list(index.iter_flat("a"))[0][1].id, "a")
+
+    def test_deep_chain(self):
+        count = 100000
+        index = ThrIndex(make_entry(n, n - 1 if n else None)
+                         for n in xrange(count))
+        self.assertEqual(index.get_total(0), count - 1)
+        self.assertEqual(index.get_total(count // 2), count // 2 - 1)
+        self.assertEqual(sum(1 for item in index.iter_flat()), count)
+
+
+class ThrValidateTest(unittest.TestCase):
+    def test_in_reply_to(self):
+        self.assertFalse(ThrInReplyTo(ref="urn:post").validate())
+        self.assertEqual(ThrInReplyTo().validate(),
+                         [("/ThrInReplyTo/@ref", "ref is required")])
+
+
+class ThrRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.feed = ThrFeed.parse_from_xml(StringIO(thread_feed))
+
+    def check_post(self, post):
+        self.assertEqual(post.id, "urn:post")
+        self.assertEqual(post.total, 5)
+        link = post.get_replies_link()
+        self.assertTrue(isinstance(link, ThrLink))
+        self.assertEqual(link.href, "http://example.com/post/replies")
+        self.assertEqual(link.count, 2)
+        self.assertEqual(link.updated, "2012-01-02T00:00:00Z")
+        self.assertEqual(post.content.type, "xhtml")
+        div = post.content.content
+        self.assertEqual(div.tag, "{%s}div" % xhtml_ns)
+        self.assertEqual(div[0][0].tag, "{%s}b" % xhtml_ns)
+        self.assertEqual(div[0][0].text, "post")
+
+    def check_reply(self, reply):
+        first, second = reply.in_reply_tos
+        self.assertEqual(first.ref, "urn:post")
+        self.assertEqual(first.href, "http://example.com/post")
+        self.assertEqual(first.type, "text/html")
+        self.assertEqual(first.source, "http://example.com/feed")
+        self.assertEqual(second.ref, "urn:other")
+        self.assertEqual(second.href, None)
+        self.assertEqual(reply.total, None)
+
+    def test_parse(self):
+        self.check_post(self.feed.entries[0])
+        self.check_reply(self.feed.entries[1])
+
+    def test_entry_round_trip(self):
+        self.check_post(round_trip(self.feed.entries[0]))
+        self.check_reply(round_trip(self.feed.entries[1]))
+
+    def test_feed_round_trip(self):
+        feed = round_trip(self.feed)
+        self.check_post(feed.entries[0])
+        self.check_reply(feed.entries[1])
+        self.assertEqual(feed.encode(), self.feed.encode())
+
+    def test_namespace(self):
+        data = self.feed.entries[0].encode()
+        self.assertTrue(thr_ns in data)
+        self.assertTrue("5</" in data)
+
+    def test_created_entry(self):
+        entry = ThrEntry(id=u"urn:new", total=0,
+                         in_reply_tos=[ThrInReplyTo(ref=u"urn:post")],
+                         links=[ThrLink(rel="replies", href=u"r", count=0,
+                                        updated=u"2012-01-01T00:00:00Z")])
+        result = round_trip(entry)
+        self.assertEqual(result.total, 0)
+        self.assertEqual(result.in_reply_tos[0].ref, "urn:post")
+        self.assertEqual(result.get_replies_link().count, 0)
+
+    def test_projection(self):
+        feed = ThrFeed.parse_from_xml(StringIO(thread_feed),
+                                      projection=["id", "in_reply_tos"])
+        post, reply = feed.entries
+        self.assertEqual((post.id, post.total, post.links),
+                         ("urn:post", None, []))
+        self.assertEqual([item.ref for item in reply.in_reply_tos],
+                         ["urn:post", "urn:other"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Tests for atomtools.utils."""
+
+from __future__ import absolute_import
+from StringIO import StringIO
+import unittest
+from xml.etree.ElementTree import fromstring
+
+from atomtools.atom import AtomEntry, AtomText
+from atomtools.utils import extract_html_text, extract_xml_text
+from atomtools.xhtml import xhtml_ns
+
+
+def xhtml(markup):
+    return fromstring('<div xmlns="%s">%s</div>' % (xhtml_ns, markup))
+
+
+class ExtractXMLTextTest(unittest.TestCase):
+    def test_whitespace(self):
+        self.assertEqual(extract_xml_text(xhtml("  Hello\n  <b>big</b>\t"
+                                                "wide  world  ")),
+                         u"Hello big wide world")
+
+    def test_inline_and_block_elements(self):
+        self.assertEqual(extract_xml_text(xhtml(
+                             "<p>One</p><p>Tw<em>o</em></p>Three<br/>Four")),
+                         u"One Two Three Four")
+
+    def test_comments_and_processing_instructions(self):
+        self.assertEqual(extract_xml_text(xhtml("a<!-- b -->c<?pi d?>e")),
+                         u"ace")
+
+    def test_script_and_style(self):
+        self.assertEqual(extract_xml_text(xhtml(
+                             "<p>a<script>bad()</script>b</p>"
+                             "<style>p { color: red }</style>c")),
+                         u"ab c")
+
+    def test_limit(self):
+        element = xhtml("<p>One two</p><p>three four</p>")
+        self.assertEqual(extract_xml_text(element, 3), u"One")
+        self.assertEqual(extract_xml_text(element, 9), u"One two t")
+        self.assertEqual(extract_xml_text(element, 100),
+                         u"One two three four")
+        self.assertEqual(extract_xml_text(xhtml("<p>a<script>12345</script>"
+                                                "bcdef</p>"), 3),
+                         u"abc")
+
+
+class ExtractHTMLTextTest(unittest.TestCase):
+    def test_markup_and_references(self):
+        self.assertEqual(extract_html_text(
+                             u"<p>Fish &amp; chips</p><p>&#8364;&#x31;</p>"),
+                         u"Fish & chips \u20ac1")
+
+    def test_script_and_style(self):
+        self.assertEqual(extract_html_text(
+                             u"a<script>bad()</script>b<style>x</style>"),
+                         u"ab")
+
+    def test_limit(self):
+        self.assertEqual(extract_html_text(u"<p>One two</p><p>three</p>", 9),
+                         u"One two t")
+
+
+class PlainTextTest(unittest.TestCase):
+    entry = """<entry xmlns="http://www.w3.org/2005/Atom">
+      <id>urn:e</id>
+      <title type="html">&lt;b&gt;Bold&lt;/b&gt; title</title>
+      <summary type="xhtml">
+        <div xmlns="http://www.w3.org/1999/xhtml">
+          <p>Summary <script>bad()</script>text</p>
+        </div>
+      </summary>
+      <content>  Plain   content  </content>
+    </entry>"""
+
+    def test_entry(self):
+        entry = AtomEntry.parse_from_xml(StringIO(self.entry))
+        self.assertEqual(entry.title.get_plain_text(), u"Bold title")
+        self.assertEqual(entry.summary.get_plain_text(), u"Summary text")
+        self.assertEqual(entry.content.get_plain_text(), u"Plain content")
+        self.assertEqual(entry.summary.get_plain_text(7), u"Summary")
+
+    def test_text(self):
+        self.assertEqual(AtomText(text=u" a  b ").get_plain_text(), u"a b")
+        self.assertEqual(AtomText(text=u"abcdef").get_plain_text(3), u"abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
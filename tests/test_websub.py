@@ -0,0 +1,175 @@
+"""End to end tests for atomtools.websub."""
+
+from __future__ import absolute_import
+import hashlib
+import hmac
+import threading
+import unittest
+from urllib import urlencode
+import urllib2
+from urlparse import parse_qs
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+from atomtools.seen import SeenEntries
+from atomtools.websub import WebSubError, WebSubSubscriber
+
+
+feed = """<feed xmlns="http://www.w3.org/2005/Atom">
+  <id>urn:feed</id>
+  <title>Feed</title>
+  <updated>2012-01-01T00:00:00Z</updated>
+  <entry>
+    <id>urn:e1</id>
+    <title>One</title>
+    <updated>%s</updated>
+  </entry>
+  <entry>
+    <id>urn:e2</id>
+    <title>Two</title>
+    <updated>2012-01-01T00:00:00Z</updated>
+  </entry>
+</feed>"""
+
+topic = "http://example.com/feed"
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Hub(object):
+    """A hub that verifies each request before accepting it."""
+    def __init__(self):
+        self.requests = {}
+        self.verified = []
+
+    def __call__(self, environ, start_response):
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        params = dict((key, value[0]) for key, value
+                      in parse_qs(environ["wsgi.input"].read(length))
+                                 .iteritems())
+        if params["hub.topic"] != topic:
+            start_response("400 Bad Request", [("Content-Length", "0")])
+            return []
+        query = urlencode({"hub.mode": params["hub.mode"],
+                           "hub.topic": params["hub.topic"],
+                           "hub.challenge": "challenge",
+                           "hub.lease_seconds": "3600"})
+        response = urllib2.urlopen(params["hub.callback"] + "?" + query)
+        self.verified.append((params["hub.mode"], response.read()))
+        self.requests[params["hub.callback"]] = params
+        start_response("202 Accepted", [("Content-Length", "0")])
+        return []
+
+
+def serve(app):
+    server = make_server("127.0.0.1", 0, app, handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class WebSubTest(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+        self.hub = Hub()
+        self.subscriber = WebSubSubscriber(
+            "http://placeholder", seen=SeenEntries(),
+            handler=lambda topic, entry: self.received.append(
+                (topic, entry.id, entry.updated.datetime.day)))
+        self.servers = [serve(self.hub), serve(self.subscriber)]
+        self.hub_url = "http://127.0.0.1:%d/" % self.servers[0].server_port
+        self.subscriber.base_url = ("http://127.0.0.1:%d"
+                                    % self.servers[1].server_port)
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def publish(self, subscription, body, secret=None):
+        if secret is None:
+            secret = subscription.secret
+        signature = hmac.new(secret, body, hashlib.sha256).hexdigest()
+        request = urllib2.Request(self.subscriber.get_callback(subscription),
+                                  body,
+                                  {"Content-Type": "application/atom+xml",
+                                   "X-Hub-Signature": "sha256=" + signature})
+        response = urllib2.urlopen(request)
+        response.read()
+        return response.getcode()
+
+    def test_subscribe_and_receive(self):
+        subscription = self.subscriber.subscribe(topic, self.hub_url,
+                                                 secret="secret",
+                                                 lease_seconds=3600)
+        self.assertEqual(self.hub.verified, [("subscribe", "challenge")])
+        self.assertEqual(subscription.mode, "active")
+        self.assertEqual(self.subscriber.get_expiring(7200), [subscription])
+        first = feed % "2012-01-01T00:00:00Z"
+        self.assertEqual(self.publish(subscription, first), 200)
+        self.assertEqual(self.received, [(topic, "urn:e1", 1),
+                                         (topic, "urn:e2", 1)])
+        # Entries seen before are dropped, updated ones passed on.
+        self.assertEqual(self.publish(subscription, first), 200)
+        self.assertEqual(len(self.received), 2)
+        second = feed % "2012-01-02T00:00:00Z"
+        self.assertEqual(self.publish(subscription, second), 200)
+        self.assertEqual(self.received[2:], [(topic, "urn:e1", 2)])
+        # Content with a wrong signature is acknowledged and ignored.
+        third = feed % "2012-01-03T00:00:00Z"
+        self.assertEqual(self.publish(subscription, third, "wrong"), 202)
+        self.assertEqual(len(self.received), 3)
+
+    def test_broken_content(self):
+        subscription = self.subscriber.subscribe(topic, self.hub_url,
+                                                 secret="secret")
+        body = feed % "2012-01-01T00:00:00Z"
+        for broken in (body[:body.index("<entry>", 200)],
+                       body.replace("<title>Two", "<title>Two<b>")):
+            with self.assertRaises(urllib2.HTTPError) as context:
+                self.publish(subscription, broken)
+            self.assertEqual(context.exception.code, 400)
+            self.assertEqual(self.received, [])
+        # The hub redelivers the repaired document, nothing was lost.
+        self.assertEqual(self.publish(subscription, body), 200)
+        self.assertEqual(self.received, [(topic, "urn:e1", 1),
+                                         (topic, "urn:e2", 1)])
+
+    def test_broken_content_without_seen(self):
+        received = []
+        subscriber = WebSubSubscriber(
+            self.subscriber.base_url,
+            handler=lambda topic, entry: received.append(entry.id))
+        self.servers[1].set_app(subscriber)
+        subscription = subscriber.subscribe(topic, self.hub_url)
+        body = feed % "2012-01-01T00:00:00Z"
+        with self.assertRaises(urllib2.HTTPError) as context:
+            self.publish(subscription, body[:-10], "")
+        self.assertEqual(context.exception.code, 400)
+        self.assertEqual(received, [])
+        self.assertEqual(self.publish(subscription, body, ""), 200)
+        self.assertEqual(received, ["urn:e1", "urn:e2"])
+
+    def test_unsubscribe(self):
+        subscription = self.subscriber.subscribe(topic, self.hub_url,
+                                                 secret="secret")
+        self.subscriber.unsubscribe(subscription)
+        self.assertEqual(self.hub.verified[-1],
+                         ("unsubscribe", "challenge"))
+        self.assertEqual(self.subscriber.subscriptions, {})
+        with self.assertRaises(urllib2.HTTPError) as context:
+            self.publish(subscription, feed % "2012-01-01T00:00:00Z")
+        self.assertEqual(context.exception.code, 404)
+        self.assertEqual(self.received, [])
+
+    def test_refused(self):
+        self.assertRaises(WebSubError, self.subscriber.subscribe,
+                          "http://example.com/other", self.hub_url)
+        self.assertEqual(self.subscriber.subscriptions, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
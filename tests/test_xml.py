@@ -0,0 +1,158 @@
+"""Tests for atomtools.xml."""
+
+from __future__ import absolute_import
+import gzip
+from StringIO import StringIO
+import unittest
+import zlib
+
+from atomtools.atom import AtomEntry, AtomFeed
+from atomtools.utils import flatten_xml_content
+from atomtools.xml import (DecompressingReader, iter_compressed, ParseError,
+                           SourceParser)
+
+
+entry = """<entry>
+    <id>urn:e%d</id>
+    <title>Entry %d</title>
+    <updated>2012-01-01T00:00:00Z</updated>
+  </entry>"""
+
+feed = """<feed xmlns="http://www.w3.org/2005/Atom">
+  <id>urn:feed</id>
+  <title>Feed</title>
+  <updated>2012-01-01T00:00:00Z</updated>
+  %s
+</feed>""" % "\n  ".join(entry % (i, i) for i in range(2000))
+
+
+def gzip_data(data):
+    out = StringIO()
+    file = gzip.GzipFile(fileobj=out, mode="wb")
+    file.write(data)
+    file.close()
+    return out.getvalue()
+
+
+def raw_deflate_data(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class DecompressionTest(unittest.TestCase):
+    def decompress(self, data, compression):
+        return DecompressingReader(StringIO(data), compression).read()
+
+    def parse(self, data, compression):
+        return AtomFeed.parse_from_xml(StringIO(data),
+                                       compression=compression)
+
+    def assertFeed(self, result):
+        self.assertEqual(len(result.entries), 2000)
+        self.assertEqual(result.entries[-1].id, "urn:e1999")
+
+    def test_gzip(self):
+        self.assertEqual(self.decompress(gzip_data(feed), "gzip"), feed)
+        self.assertFeed(self.parse(gzip_data(feed), "gzip"))
+
+    def test_deflate(self):
+        self.assertEqual(self.decompress(zlib.compress(feed), "deflate"),
+                         feed)
+        self.assertFeed(self.parse(zlib.compress(feed), "deflate"))
+
+    def test_raw_deflate(self):
+        self.assertEqual(self.decompress(raw_deflate_data(feed), "deflate"),
+                         feed)
+        self.assertFeed(self.parse(raw_deflate_data(feed), "deflate"))
+
+    def test_auto(self):
+        self.assertEqual(self.decompress(gzip_data(feed), "auto"), feed)
+        self.assertEqual(self.decompress(zlib.compress(feed), "auto"), feed)
+
+    def test_concatenated_gzip_members(self):
+        half = len(feed) // 2
+        data = gzip_data(feed[:half]) + gzip_data(feed[half:])
+        self.assertEqual(self.decompress(data, "gzip"), feed)
+        self.assertFeed(self.parse(data, "gzip"))
+
+    def test_small_reads(self):
+        reader = DecompressingReader(StringIO(gzip_data(feed)), "gzip")
+        chunks = []
+        while True:
+            data = reader.read(1000)
+            if not data:
+                break
+            chunks.append(data)
+        self.assertEqual("".join(chunks), feed)
+
+    def test_trailing_data(self):
+        for data in (zlib.compress(feed), raw_deflate_data(feed)):
+            data += "garbage"
+            self.assertEqual(self.decompress(data, "deflate"), feed)
+            self.assertFeed(self.parse(data, "deflate"))
+        self.assertRaises(ParseError, self.decompress,
+                          gzip_data(feed) + "garbage", "gzip")
+
+    def test_broken_data(self):
+        self.assertRaises(ParseError, self.decompress, "not gzip", "gzip")
+
+    def test_unknown_compression(self):
+        self.assertRaises(ValueError, DecompressingReader, StringIO(""),
+                          "bzip2")
+
+
+class CompressionTest(unittest.TestCase):
+    def test_round_trip(self):
+        chunks = [feed[i:i + 1000] for i in range(0, len(feed), 1000)]
+        for compression in ("gzip", "deflate"):
+            data = "".join(iter_compressed(chunks, compression))
+            reader = DecompressingReader(StringIO(data), compression)
+            self.assertEqual(reader.read(), feed)
+
+    def test_write_xml(self):
+        result = AtomFeed.parse_from_xml(StringIO(feed))
+        out = StringIO()
+        result.write_xml(out, "gzip")
+        result = AtomFeed.parse_from_xml(StringIO(out.getvalue()),
+                                         compression="auto")
+        self.assertEqual(len(result.entries), 2000)
+
+
+source_entry = """<?xml version="1.0" encoding="utf-8"?>
+<entry xmlns="http://www.w3.org/2005/Atom" xmlns:x="urn:x">
+  <id>urn:e</id>
+  <summary type="html" x:note='a > b'>%s</summary>
+  <content>Only &amp; text</content>
+</entry>"""
+
+source_markup = ("Fish &amp; chips <x:b a='1 &gt; 0'>b&#233;ld</x:b>"
+                 " <![CDATA[<raw> & ]]> t\xc3\xa9xt<br/>end &lt;")
+
+
+class SourceParserTest(unittest.TestCase):
+    def parse(self, markup, parser=None):
+        return AtomEntry.parse_from_xml(StringIO(source_entry % markup),
+                                        parser=parser)
+
+    def test_source_content(self):
+        entry = self.parse(source_markup, SourceParser())
+        self.assertEqual(entry.summary.text, source_markup.decode("utf-8"))
+        self.assertEqual(entry.content.content, u"Only & text")
+
+    def test_flatten_xml_content(self):
+        parser = SourceParser()
+        parser.feed(source_entry % source_markup)
+        root = parser.close()
+        summary = root.find("{http://www.w3.org/2005/Atom}summary")
+        self.assertEqual(flatten_xml_content(summary),
+                         source_markup.decode("utf-8"))
+
+    def test_without_source(self):
+        entry = self.parse(source_markup)
+        self.assertNotEqual(entry.summary.text,
+                            source_markup.decode("utf-8"))
+        self.assertTrue(entry.summary.text.startswith(u"Fish & chips <"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+"""Throughput and peak memory of reading and writing compressed feeds.
+
+Run it from anywhere::
+
+    python tools/bench_compression.py [--entries N] [--compression gzip]
+
+It writes a feed with *entries* entries into a compressed temporary file
+and then runs each of the cases below in a process of its own, so that
+their peaks don't mix:
+
+    parse-buffered     decompress the whole file, then parse_from_xml
+    parse-stream       parse_from_xml with compression
+    iterparse-stream   iterparse_from_xml with compression
+    encode-buffered    encode, then compress the whole document
+    encode-stream      write_xml with compression
+
+For each case it reports the throughput in megabytes of uncompressed XML
+per second and by how much the case raised the peak resident memory of
+the process. The encoding cases start from a feed already in memory,
+which doesn't count.
+"""
+
+from __future__ import absolute_import
+import argparse
+from datetime import datetime
+import os
+import random
+import resource
+import subprocess
+import sys
+from StringIO import StringIO
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from atomtools.atom import AtomDate, AtomEntry, AtomFeed, AtomLink, AtomText
+from atomtools.tzinfo import TzInfoUTC
+from atomtools.xml import compression_wbits
+
+cases = ["parse-buffered", "parse-stream", "iterparse-stream",
+         "encode-buffered", "encode-stream"]
+
+
+class NullFile(object):
+    """A file object that only counts what is written to it."""
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+def make_feed(entries):
+    rnd = random.Random(0)
+    words = ["word%d" % n for n in xrange(2000)]
+    updated = AtomDate(datetime(2012, 1, 1, tzinfo=TzInfoUTC()))
+    feed = AtomFeed(id="urn:feed", title=AtomText(text="Feed"),
+                    updated=updated)
+    for n in xrange(entries):
+        feed.entries.append(AtomEntry(
+            id="urn:entry:%d" % n, title=AtomText(text="Entry %d" % n),
+            updated=updated,
+            links=[AtomLink(href="http://example.com/%d" % n)],
+            summary=AtomText(text=" ".join(rnd.choice(words)
+                                           for i in xrange(60)))))
+    return feed
+
+
+def get_peak():
+    """Return the peak resident memory of the process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, Mac OS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def compress(data, compression):
+    compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                  compression_wbits[compression])
+    return compressor.compress(data) + compressor.flush()
+
+
+def run_case(case, path, compression, entries):
+    """Run *case* and return the seconds it took and its peak memory."""
+    if case.startswith("encode"):
+        feed = make_feed(entries)
+    start_peak = get_peak()
+    start = time.time()
+    if case == "parse-buffered":
+        with open(path, "rb") as file:
+            data = zlib.decompress(file.read(),
+                                   compression_wbits[compression])
+        AtomFeed.parse_from_xml(StringIO(data))
+    elif case == "parse-stream":
+        with open(path, "rb") as file:
+            AtomFeed.parse_from_xml(file, compression=compression)
+    elif case == "iterparse-stream":
+        with open(path, "rb") as file:
+            for entry in AtomFeed.iterparse_from_xml(
+                    file, compression=compression):
+                pass
+    elif case == "encode-buffered":
+        NullFile().write(compress(feed.encode(), compression))
+    elif case == "encode-stream":
+        feed.write_xml(NullFile(), compression)
+    else:
+        raise ValueError("unknown case %r" % case)
+    return time.time() - start, get_peak() - start_peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--compression", default="gzip",
+                        choices=["gzip", "deflate"])
+    parser.add_argument("--case", choices=cases, help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case is not None:
+        print "%f %d" % run_case(args.case, args.path, args.compression,
+                                 args.entries)
+        return
+    data = make_feed(args.entries).encode()
+    size = len(data)
+    fd, path = tempfile.mkstemp(suffix=".xml." + args.compression)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(compress(data, args.compression))
+        del data
+        print "%d entries, %d bytes of XML, %d compressed" % (
+            args.entries, size, os.path.getsize(path))
+        for case in cases:
+            output = subprocess.check_output(
+                [sys.executable, os.path.abspath(__file__), "--case", case,
+                 "--path", path, "--entries", str(args.entries),
+                 "--compression", args.compression])
+            seconds, peak = output.split()
+            print "%-17s %7.1f MB/s %9.1f MB peak" % (
+                case, size / float(seconds) / 1e6, int(peak) / 1e6)
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
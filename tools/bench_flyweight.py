@@ -0,0 +1,152 @@
+"""Memory benchmark of interned values and shared persons and categories.
+
+Run it from anywhere::
+
+    python tools/bench_flyweight.py [--entries N]
+
+It generates a feed shaped like a busy blog aggregate, where authors,
+categories and link attributes come from small pools, and parses it in
+three ways: without interning, with interned strings only, and with
+interned strings and shared :class:`AtomPerson` and
+:class:`AtomCategory` instances. For each, it reports the memory held by
+the resulting objects, measured by walking them with
+:func:`sys.getsizeof`, and the best parse time.
+
+It also times creating categories with and without the check for
+frozen instances in :meth:`AtomFlyweight.__setattr__`, which is the price
+all flyweights pay for sharing.
+"""
+
+from __future__ import absolute_import
+import argparse
+import os
+import random
+from StringIO import StringIO
+import sys
+import timeit
+from xml.etree.ElementTree import Element, SubElement, tostring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from atomtools.atom import (atom_tags, AtomCategory, AtomCommon, AtomEntry,
+                            AtomFeed, AtomPerson)
+from atomtools.utils import Interner
+
+
+class SharedPerson(AtomPerson):
+    shared = True
+
+
+class SharedCategory(AtomCategory):
+    shared = True
+
+
+class SharedEntry(AtomEntry):
+    inner_factory = {
+        "author": SharedPerson.from_xml,
+        "category": SharedCategory.from_xml,
+        "contributor": SharedPerson.from_xml,
+    }
+
+
+class SharedFeed(AtomFeed):
+    inner_factory = {
+        "entry": SharedEntry.from_xml,
+    }
+
+
+class UncheckedCategory(AtomCategory):
+    __setattr__ = object.__setattr__
+
+
+def make_feed(entries, seed=0):
+    """Return the XML of a feed with *entries* entries."""
+    rnd = random.Random(seed)
+    authors = [("Author %d" % n, "http://example.com/~a%d" % n,
+                "a%d@example.com" % n) for n in xrange(40)]
+    terms = ["topic-%d" % n for n in xrange(60)]
+    feed = Element(atom_tags.feed)
+    SubElement(feed, atom_tags.id).text = "urn:feed"
+    SubElement(feed, atom_tags.title).text = "Aggregate"
+    SubElement(feed, atom_tags.updated).text = "2012-01-01T00:00:00Z"
+    for n in xrange(entries):
+        entry = SubElement(feed, atom_tags.entry)
+        SubElement(entry, atom_tags.id).text = "urn:entry:%d" % n
+        SubElement(entry, atom_tags.title).text = "Entry %d" % n
+        SubElement(entry, atom_tags.updated).text = "2012-01-01T00:00:00Z"
+        for name, uri, email in rnd.sample(authors, rnd.randint(1, 2)):
+            author = SubElement(entry, atom_tags.author)
+            SubElement(author, atom_tags.name).text = name
+            SubElement(author, atom_tags.uri).text = uri
+            SubElement(author, atom_tags.email).text = email
+        for term in rnd.sample(terms, rnd.randint(2, 5)):
+            SubElement(entry, atom_tags.category, term=term,
+                       scheme="http://example.com/topics")
+        SubElement(entry, atom_tags.link, rel="alternate", type="text/html",
+                   hreflang="en", href="http://example.com/%d" % n)
+        SubElement(entry, atom_tags.link, rel="replies",
+                   type="application/atom+xml", hreflang="en",
+                   href="http://example.com/%d/replies" % n)
+        SubElement(entry, atom_tags.summary).text = "Summary %d" % n
+    return tostring(feed)
+
+
+def get_size(root):
+    """Return the bytes held by *root* and all objects it refers to."""
+    seen = set()
+    stack = [root]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__"):
+            stack.append(obj.__dict__)
+    return size
+
+
+def parse(data, cls, size):
+    interner = AtomCommon.interner
+    AtomCommon.interner = Interner(size)
+    try:
+        return cls.parse_from_xml(StringIO(data))
+    finally:
+        AtomCommon.interner = interner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    data = make_feed(args.entries)
+    print "%d entries, %d bytes of XML" % (args.entries, len(data))
+    base = None
+    for label, cls, size in [("no interning", AtomFeed, 0),
+                             ("interned strings", AtomFeed, 65536),
+                             ("shared objects", SharedFeed, 65536)]:
+        feed = parse(data, cls, size)
+        used = get_size(feed)
+        if base is None:
+            base = used
+        seconds = min(timeit.repeat(lambda: parse(data, cls, size),
+                                    repeat=args.repeat, number=1))
+        print "%-18s %10d bytes %6.1f%% %8.3f s" % (
+            label, used, 100.0 * used / base, seconds)
+    for label, cls in [("checked setattr", AtomCategory),
+                       ("plain setattr", UncheckedCategory)]:
+        seconds = min(timeit.repeat(lambda: cls(term="a", scheme="b"),
+                                    repeat=args.repeat, number=100000))
+        print "%-18s %8.3f us per category" % (label, seconds * 10)
+
+
+if __name__ == "__main__":
+    main()
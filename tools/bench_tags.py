@@ -0,0 +1,90 @@
+"""Microbenchmark of the per-child cost of AtomMeta.from_xml.
+
+Run it from anywhere::
+
+    python tools/bench_tags.py [--children N] [--repeat N]
+
+It reports the time :meth:`AtomEntry.from_xml` takes per child element,
+and how much of that goes into matching the tag of a child, once against
+the interned tags of :mod:`atomtools.xml` and once against a QName built
+for each comparison, as the parsing code used to do. Extension elements
+are compared against every tag, so they are the expensive case.
+"""
+
+from __future__ import absolute_import
+import argparse
+import os
+import sys
+import timeit
+from xml.etree.ElementTree import Element, SubElement
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from atomtools.atom import atom_ns, atom_tags, AtomEntry
+from atomtools.xml import QName
+
+names = ["author", "category", "contributor", "id", "link", "rights",
+         "title", "updated"]
+
+
+def make_entry(children):
+    """Return an entry element with *children* children.
+
+    Every other child is an extension element.
+    """
+    entry = Element(atom_tags.entry)
+    for n in xrange(children):
+        if n % 2:
+            SubElement(entry, "{urn:example}ext%d" % (n % 7)).text = "x"
+        elif n % 8 == 0:
+            SubElement(entry, atom_tags.link, href="http://example.com/%d"
+                                                  % n, rel="alternate")
+        elif n % 8 == 2:
+            SubElement(entry, atom_tags.category, term="term%d" % (n % 5))
+        elif n % 8 == 4:
+            SubElement(SubElement(entry, atom_tags.author),
+                       atom_tags.name).text = "Author %d" % (n % 3)
+        else:
+            SubElement(entry, atom_tags.id).text = "urn:entry"
+    return entry
+
+
+def match_interned(element):
+    tags = [atom_tags[name] for name in names]
+    for sub in element:
+        for tag in tags:
+            if sub.tag == tag:
+                break
+
+
+def match_qname(element):
+    for sub in element:
+        for name in names:
+            if sub.tag == QName(atom_ns, name):
+                break
+
+
+def run(label, function, children, repeat, number):
+    best = min(timeit.repeat(function, repeat=repeat, number=number))
+    print "%-22s %8.3f us per child" % (label,
+                                        best / number / children * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--children", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    entry = make_entry(args.children)
+    run("AtomEntry.from_xml", lambda: AtomEntry.from_xml(entry),
+        args.children, args.repeat, args.number)
+    run("match interned tags", lambda: match_interned(entry),
+        args.children, args.repeat, args.number)
+    run("match QName per child", lambda: match_qname(entry),
+        args.children, args.repeat, args.number)
+
+
+if __name__ == "__main__":
+    main()